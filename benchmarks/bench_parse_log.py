@@ -0,0 +1,107 @@
+"""Throughput benchmark for the log parser on a synthetic detectron2 log.
+
+Writes a detectron2-style training log of --size-mb megabytes (iteration
+lines every 20 iterations, a COCO evaluation block every --eval-period
+iterations) to a temporary file and parses it with parse_log_file.
+
+    python benchmarks/bench_parse_log.py --size-mb 2048
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.parse_log import parse_log_file
+
+HEADER = """[01/08 09:00:00 detectron2]: Command line arguments: Namespace(config_file='configs/mask_rcnn_R_50_FPN_3x.yaml')
+[01/08 09:00:00 detectron2]: Running with full config:
+SOLVER:
+  BASE_LR: 0.02
+  IMS_PER_BATCH: 16
+  MAX_ITER: 270000
+[01/08 09:00:01 d2.data.build]: Using training sampler TrainingSampler, batch_size=16
+"""
+
+ITERATION = ("[01/08 {hour:02d}:{minute:02d}:{second:02d} d2.utils.events]:  eta: 1:23:45  iter: {iteration}  "
+             "total_loss: {total_loss:.4f}  loss_cls: {loss_cls:.4f}  loss_box_reg: {loss_box_reg:.4f}  "
+             "loss_mask: {loss_mask:.4f}  loss_rpn_cls: {loss_rpn_cls:.4f}  loss_rpn_loc: {loss_rpn_loc:.4f}  "
+             "time: 0.4512  data_time: 0.0123  lr: {lr:.6f}  max_mem: 5123M\n")
+
+EVALUATION = """[01/08 {hour:02d}:{minute:02d}:{second:02d} d2.evaluation.evaluator]: Total inference time: 0:05:12
+Evaluate annotation type *bbox*
+ Average Precision  (AP) @[ IoU=0.50:0.95 | area=   all | maxDets=100 ] = {ap:.3f}
+ Average Precision  (AP) @[ IoU=0.50      | area=   all | maxDets=100 ] = {ap50:.3f}
+ Average Precision  (AP) @[ IoU=0.75      | area=   all | maxDets=100 ] = {ap75:.3f}
+ Average Precision  (AP) @[ IoU=0.50:0.95 | area= small | maxDets=100 ] = {aps:.3f}
+ Average Precision  (AP) @[ IoU=0.50:0.95 | area=medium | maxDets=100 ] = {apm:.3f}
+ Average Precision  (AP) @[ IoU=0.50:0.95 | area= large | maxDets=100 ] = {apl:.3f}
+ Average Recall     (AR) @[ IoU=0.50:0.95 | area=   all | maxDets=  1 ] = 0.290
+ Average Recall     (AR) @[ IoU=0.50:0.95 | area=   all | maxDets= 10 ] = 0.455
+ Average Recall     (AR) @[ IoU=0.50:0.95 | area=   all | maxDets=100 ] = 0.478
+[01/08 {hour:02d}:{minute:02d}:{second:02d} d2.evaluation.coco_evaluation]: Evaluation results for bbox:
+|   AP   |  AP50  |  AP75  |  APs   |  APm   |  APl   |
+"""
+
+# Write a synthetic detectron2 log of about size_bytes bytes
+def write_synthetic_log(file, size_bytes, eval_period=5000, seed=0):
+    rng = random.Random(seed)
+    written = file.write(HEADER.encode())
+    iteration = 19
+    while written < size_bytes:
+        progress = min(1.0, iteration / 270000)
+        clock = {"hour": (9 + iteration // 7200) % 24, "minute": iteration // 120 % 60, "second": iteration // 2 % 60}
+        written += file.write(ITERATION.format(
+            iteration=iteration,
+            total_loss=2.5 * (1 - progress) + rng.random() * 0.2,
+            loss_cls=0.6 * (1 - progress) + rng.random() * 0.05,
+            loss_box_reg=0.5 * (1 - progress) + rng.random() * 0.05,
+            loss_mask=0.4 * (1 - progress) + rng.random() * 0.05,
+            loss_rpn_cls=0.1 * (1 - progress) + rng.random() * 0.01,
+            loss_rpn_loc=0.1 * (1 - progress) + rng.random() * 0.01,
+            lr=0.02 * min(1.0, iteration / 1000),
+            **clock
+        ).encode())
+        if (iteration + 1) % eval_period == 0:
+            ap = min(0.6, 0.1 + progress) + rng.random() * 0.02
+            written += file.write(EVALUATION.format(
+                ap=ap, ap50=ap * 1.5, ap75=ap * 1.1, aps=ap * 0.5, apm=ap * 1.05, apl=ap * 1.3, **clock
+            ).encode())
+        iteration += 20
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=2048)
+    parser.add_argument('--eval-period', type=int, default=5000)
+    parser.add_argument('--keep', help="write the log to this path and keep it")
+    args = parser.parse_args()
+
+    path = args.keep or tempfile.mkstemp(suffix='.log')[1]
+    try:
+        if not os.path.exists(path) or os.path.getsize(path) < args.size_mb * 1024 * 1024:
+            with open(path, 'wb') as file:
+                write_synthetic_log(file, int(args.size_mb * 1024 * 1024), args.eval_period)
+        size = os.path.getsize(path)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        with open(path, 'rb') as file:
+            result = parse_log_file(file)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        print(f"parsed {size / 1024 / 1024:.0f} MB in {elapsed:.2f}s: {size / 1024 / 1024 / elapsed:.1f} MB/s, "
+              f"peak traced memory {peak / 1024:.0f} KiB")
+        print(result)
+    finally:
+        if not args.keep:
+            os.remove(path)
+
+if __name__ == '__main__':
+    main()
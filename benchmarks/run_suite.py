@@ -0,0 +1,280 @@
+"""Benchmark suite for the ingest, query and parse hot paths.
+
+Grows one temporary SQLite database to each of the --runs scales (synthetic
+runs from a fixed seed) and measures at every scale:
+
+    create      POST /experiments, runs per second
+    update      POST /experiments/<run_id>/update (until written) and /experiments/batch-update
+    list        GET /experiments latency (first page, selected fields, filter)
+    compare     GET /experiments/compare latency (sorted by AP, status filter)
+
+plus the MB/s of parse_log_content on a synthetic log. The requests go
+through the Flask test client, so no network is involved, with the response
+cache disabled except for the *_cached entries. The results are written as
+JSON; --compare reports the changes between two result files and exits with
+status 1 if a metric got worse than --threshold.
+
+    python benchmarks/run_suite.py --output before.json
+    python benchmarks/run_suite.py --output after.json
+    python benchmarks/run_suite.py --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_parse_log import write_synthetic_log
+
+DATASETS = ('coco', 'lvis', 'cityscapes', 'voc')
+MODELS = ('faster_rcnn_R_50_FPN', 'mask_rcnn_R_50_FPN', 'retinanet_R_101_FPN', 'mask_rcnn_X_101_FPN')
+STATUSES = ('COMPLETED', 'COMPLETED', 'COMPLETED', 'FAILED', 'RUNNING', 'ABORTED')
+STARTED_AT = datetime(2024, 1, 1)
+
+# Synthetic values of the runs index .. index + count - 1, the same for every seed
+def synthetic_runs(index, count, seed, status_enum):
+    rng = random.Random(f"{seed}-{index}")
+    rows = []
+    for number in range(index, index + count):
+        ap = rng.uniform(0.05, 0.6)
+        loss = rng.uniform(0.2, 2.5)
+        rows.append({
+            "run_id": f"bench_{number:07d}",
+            "dataset": rng.choice(DATASETS),
+            "model": rng.choice(MODELS),
+            "started_at": STARTED_AT + timedelta(minutes=number),
+            "iterations": rng.randrange(0, 270000, 20),
+            "status": status_enum[rng.choice(STATUSES)],
+            "learning_rate": rng.choice((0.0025, 0.005, 0.01, 0.02, 0.04)),
+            "batch_size": rng.choice((2, 4, 8, 16, 32)),
+            "num_epochs": rng.randint(1, 36),
+            "ap": ap, "ap50": ap * 1.5, "ap75": ap * 1.1, "aps": ap * 0.5, "apm": ap * 1.05, "apl": ap * 1.3,
+            "total_loss": loss, "loss_cls": loss * 0.3, "loss_box_reg": loss * 0.25,
+            "loss_rpn_cls": loss * 0.05, "loss_rpn_loc": loss * 0.05, "mask_loss": None,
+        })
+    return rows
+
+# Milliseconds of every call of request(), after one warm-up call
+def latencies(request, repeat):
+    request()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        request()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+def summary(timings):
+    timings = sorted(timings)
+    return {
+        "p50_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "mean_ms": statistics.fmean(timings),
+    }
+
+def expect(response, status):
+    if response.status_code != status:
+        raise RuntimeError(f"{response.request.method} {response.request.path}: {response.status_code} {response.get_data(as_text=True)}")
+    return response
+
+# Grow the database to runs experiments: bulk inserts, then `creates` runs over HTTP
+def grow(miniml, app, client, current, runs, creates, seed):
+    seeded = max(current, runs - creates)
+    with app.app_context():
+        for index in range(current, seeded, 10000):
+            miniml.db.session.execute(
+                miniml.Experiment.__table__.insert(),
+                synthetic_runs(index, min(10000, seeded - index), seed, miniml.StatusEnum.__members__)
+            )
+        miniml.db.session.commit()
+
+    created = synthetic_runs(seeded, runs - seeded, seed, miniml.StatusEnum.__members__)
+    start = time.perf_counter()
+    for row in created:
+        expect(client.post('/experiments', json={
+            "run_id": row["run_id"], "dataset": row["dataset"], "model": row["model"],
+            "learning_rate": row["learning_rate"], "batch_size": row["batch_size"], "num_epochs": row["num_epochs"],
+        }), 201)
+    elapsed = time.perf_counter() - start
+    return [row["run_id"] for row in created], {"runs": len(created), "runs_per_s": len(created) / elapsed if created else None}
+
+def bench_updates(app, client, run_ids, updates, batch_size):
+    live_updates = app.extensions['miniml']['live_updates']
+    start = time.perf_counter()
+    for step in range(updates):
+        run_id = run_ids[step % len(run_ids)]
+        expect(client.post(f'/experiments/{run_id}/update', json={
+            "iterations": step, "total_loss": 1.0 / (step + 1), "ap": step / updates
+        }), 202 if live_updates else 200)
+    # Acknowledged updates count once they are written
+    if live_updates:
+        live_updates.flush()
+    live = time.perf_counter() - start
+
+    batches = max(1, updates // batch_size)
+    start = time.perf_counter()
+    for batch in range(batches):
+        expect(client.post('/experiments/batch-update', json=[
+            {"run_id": run_ids[(batch + i) % len(run_ids)], "step": updates + batch * batch_size + i,
+             "total_loss": 1.0 / (i + 1), "loss_cls": 0.5 / (i + 1)}
+            for i in range(batch_size)
+        ]), 200)
+    batched = time.perf_counter() - start
+    return {
+        "live": {"requests": updates, "requests_per_s": updates / live},
+        "batch": {"requests": batches, "points_per_s": batches * batch_size * 2 / batched},
+    }
+
+def bench_queries(app, client, repeat):
+    queries = {
+        "list": ('/experiments', {}),
+        "list_fields": ('/experiments', {"fields": "run_id,model,ap,total_loss", "limit": 1000}),
+        "list_filtered": ('/experiments', {"model": MODELS[1], "dataset": DATASETS[0], "status": "Completed"}),
+        "compare": ('/experiments/compare', {"sort_by": "ap", "limit": 10}),
+        "compare_status": ('/experiments/compare', {"sort_by": "total_loss", "order": "asc", "status": "Completed", "limit": 100}),
+    }
+    results = {}
+    response_cache = app.extensions['miniml']['response_cache']
+    max_bytes = response_cache.max_bytes
+    try:
+        for cached in (False, True):
+            response_cache.max_bytes = max_bytes if cached else 0
+            for name, (path, params) in queries.items():
+                timings = latencies(lambda: expect(client.get(path, query_string=params), 200), repeat)
+                results[f"{name}_cached" if cached else name] = summary(timings)
+    finally:
+        response_cache.max_bytes = max_bytes
+    return results
+
+def bench_parse(parse_log_content, size_mb, repeat, directory):
+    path = os.path.join(directory, 'bench.log')
+    with open(path, 'wb') as file:
+        write_synthetic_log(file, int(size_mb * 1024 * 1024))
+    with open(path, encoding='utf-8') as file:
+        content = file.read()
+    size = len(content.encode('utf-8'))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse_log_content(content)
+        timings.append(time.perf_counter() - start)
+    return {"bytes": size, "mb_per_s": size / 1024 / 1024 / min(timings), "best_s": min(timings)}
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+def run(args):
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['MINIML_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        os.environ['MINIML_LOG_DIR'] = os.path.join(directory, 'logs')
+        os.environ['MINIML_UPLOAD_DIR'] = os.path.join(directory, 'uploads')
+        import logging
+        import main as miniml
+        from src.parse_log import parse_log_content
+        logging.disable(logging.WARNING)
+        app = miniml.create_app()
+        with app.app_context():
+            miniml.upgrade_database()
+        client = app.test_client()
+
+        results = {"environment": environment(), "config": vars(args), "scales": {}}
+        print(f"parse_log_content on {args.parse_mb} MB", file=sys.stderr)
+        results["parse"] = bench_parse(parse_log_content, args.parse_mb, args.parse_repeat, directory)
+        current = 0
+        for runs in sorted(args.runs):
+            print(f"{runs} runs", file=sys.stderr)
+            run_ids, create = grow(miniml, app, client, current, runs, min(args.creates, runs), args.seed)
+            current = runs
+            results["scales"][str(runs)] = {
+                "create": create,
+                "update": bench_updates(app, client, run_ids or [f"bench_{0:07d}"], args.updates, args.batch_size),
+                "query": bench_queries(app, client, args.repeat),
+            }
+    return results
+
+# Flatten the results to {"scales.1000.query.list.p50_ms": value}
+def flatten(results, prefix=''):
+    values = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+# Compare two result files, higher is better for *_per_s, lower for *_ms
+def compare(base_path, new_path, threshold):
+    with open(base_path) as file:
+        base = json.load(file)
+    with open(new_path) as file:
+        new = json.load(file)
+    base_values = flatten({"parse": base.get("parse", {}), "scales": base.get("scales", {})})
+    new_values = flatten({"parse": new.get("parse", {}), "scales": new.get("scales", {})})
+    print(f"{base['environment'].get('commit')} -> {new['environment'].get('commit')}")
+    regressions = 0
+    for name in sorted(base_values.keys() & new_values.keys()):
+        if name.endswith('_per_s'):
+            change = new_values[name] / base_values[name] - 1 if base_values[name] else 0.0
+        elif name.endswith('_ms'):
+            change = base_values[name] / new_values[name] - 1 if new_values[name] else 0.0
+        else:
+            continue
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        elif change > threshold:
+            flag = '  improved'
+        print(f"{name:60s} {base_values[name]:12.2f} {new_values[name]:12.2f} {change:+8.1%}{flag}")
+    return 1 if regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=lambda value: [int(runs) for runs in value.split(',')], default=[1000, 10000, 100000],
+                        help="comma separated database sizes (default 1000,10000,100000)")
+    parser.add_argument('--creates', type=int, default=500, help="runs created over HTTP per scale")
+    parser.add_argument('--updates', type=int, default=2000, help="live updates per scale")
+    parser.add_argument('--batch-size', type=int, default=100, help="updates per batch-update request")
+    parser.add_argument('--repeat', type=int, default=30, help="timed requests per query")
+    parser.add_argument('--parse-mb', type=float, default=64)
+    parser.add_argument('--parse-repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results to this file instead of stdout")
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help="compare two result files")
+    parser.add_argument('--threshold', type=float, default=0.1, help="relative change reported as regression (default 0.1)")
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare, args.threshold)
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Stress test for concurrent writers on one SQLite database.
+
+Starts --writers concurrent writers (threads, or processes with --processes)
+against a temporary database. Each writer creates its own run and posts live
+and batch updates while one reader keeps listing the experiments. Exits with
+status 1 if any request failed, e.g. with "database is locked".
+
+    python benchmarks/stress_writers.py --writers 32 --updates 200
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_app = None
+
+# One app per process, shared by its threads like in a worker of the server
+def get_app():
+    global _app
+    if _app is None:
+        import logging
+        from main import create_app
+        logging.disable(logging.WARNING)
+        _app = create_app()
+    return _app
+
+def run_writer(index, updates):
+    client = get_app().test_client()
+    errors = []
+    run_id = f"stress_{os.getpid()}_{index}"
+    response = client.post('/experiments', json={
+        "run_id": run_id, "dataset": "coco", "model": "stress",
+        "learning_rate": 0.01, "batch_size": 8, "num_epochs": 1
+    })
+    if response.status_code != 201:
+        errors.append(response.get_data(as_text=True))
+    for step in range(updates):
+        if step % 10 == 9:
+            response = client.post('/experiments/batch-update', json={"run_id": run_id, "updates": [
+                {"step": step * 100 + i, "total_loss": 1.0 / (i + 1)} for i in range(50)
+            ]})
+        else:
+            response = client.post(f'/experiments/{run_id}/update', json={"iterations": step, "total_loss": 1.0 / (step + 1)})
+        if response.status_code not in (200, 202):
+            errors.append(response.get_data(as_text=True))
+    return errors
+
+def run_reader(stop, errors):
+    client = get_app().test_client()
+    reads = 0
+    while not stop.is_set():
+        response = client.get('/experiments')
+        if response.status_code != 200:
+            errors.append(response.get_data(as_text=True))
+        reads += 1
+    return reads
+
+def thread_writers(writers, updates):
+    errors = []
+    threads = [threading.Thread(target=lambda i=i: errors.extend(run_writer(i, updates))) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+def process_writer(args):
+    return run_writer(*args)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', type=int, default=32)
+    parser.add_argument('--updates', type=int, default=200, help="updates per writer")
+    parser.add_argument('--processes', action='store_true', help="run the writers in separate processes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ['MINIML_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'stress.db')}"
+        from main import upgrade_database
+        with get_app().app_context():
+            upgrade_database()
+
+        stop = threading.Event()
+        read_errors = []
+        reader = threading.Thread(target=run_reader, args=(stop, read_errors))
+        reader.start()
+        start = time.perf_counter()
+        if args.processes:
+            with multiprocessing.get_context('spawn').Pool(args.writers) as pool:
+                errors = [e for result in pool.map(process_writer, [(i, args.updates) for i in range(args.writers)]) for e in result]
+        else:
+            errors = thread_writers(args.writers, args.updates)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        reader.join()
+
+    requests = args.writers * (args.updates + 1)
+    errors += read_errors
+    locked = sum('locked' in error for error in errors)
+    print(f"{args.writers} {'processes' if args.processes else 'threads'}: {requests} write requests in {elapsed:.2f}s "
+          f"({requests / elapsed:.0f} req/s), {len(errors)} errors, {locked} 'database is locked'")
+    for error in errors[:5]:
+        print(error)
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,35 @@
+# gunicorn settings for production: gunicorn -c gunicorn.conf.py wsgi:app
+#
+# Every worker process imports wsgi.py and creates its own app after the fork
+# (no preload), so no database connection or thread is shared across a fork.
+# Worker threads serve the long lived log streams without blocking a process.
+import glob
+import multiprocessing
+import os
+import tempfile
+
+bind = os.environ.get('MINIML_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('MINIML_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('MINIML_THREADS', 8))
+timeout = int(os.environ.get('MINIML_TIMEOUT', 120))
+graceful_timeout = 30
+preload_app = False
+accesslog = os.environ.get('MINIML_ACCESS_LOG')
+
+# The workers share their request metrics through this directory, inherited by them from the environment
+os.environ.setdefault('MINIML_METRICS_DIR', os.path.join(tempfile.gettempdir(), f"miniml-metrics-{os.getpid()}"))
+
+# Upgrade the database once in the master process before the workers start
+def on_starting(server):
+    from main import create_app, db, upgrade_database
+    for path in glob.glob(os.path.join(os.environ['MINIML_METRICS_DIR'], '*.json')):
+        os.remove(path)
+    app = create_app()
+    with app.app_context():
+        upgrade_database()
+        db.engine.dispose()
+
+def child_exit(server, worker):
+    from src.instrumentation import remove_process_metrics
+    remove_process_metrics(os.environ['MINIML_METRICS_DIR'], worker.pid)
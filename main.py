@@ -1,19 +1,107 @@
-
-from flask import Flask, Response, logging, render_template, request, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, has_request_context, logging, render_template, request, jsonify, send_file, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, event, false, func, select, text, type_coerce
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+from werkzeug.local import LocalProxy
 from datetime import datetime
 import os
+import atexit
+import base64
+import functools
+import itertools
+import json
+import time
 import logging
+import threading
+import click
+import numpy as np
+from cachetools import LRUCache
 from enum import Enum
-from src.parse_log import parse_log_content
+from src.parse_log import LogParser, parse_log_file
+from src.migrate import upgrade_schema
+from src.storage import CommitWatcher, configure_sqlite, serialized, serialized_write
+from src.importer import find_logs, parse_logs
+from src.uploads import OffsetMismatch, UploadStore
+from src import analysis
+from src.downsample import DOWNSAMPLE_METHODS, CurveLevels
+from src.response_cache import ResponseCache
+from src.write_behind import WriteBehindBuffer
+from src.parse_cache import ParseCache
+from src.instrumentation import Instrumentation
+from src.profiler import RequestProfiler
+from src.log_store import LogStore
+from src.export import (
+    ARROW_MIMETYPE, PARQUET_MIMETYPE, EXPORT_FORMATS, negotiate_format,
+    arrow_schema, record_batches, columns_json, stream_arrow, stream_parquet
+)
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.abspath('experiments.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+# Configuration from the MINIML_* environment variables
+def load_config(config):
+    config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('MINIML_DATABASE_URI', f"sqlite:///{os.path.abspath('experiments.db')}")
+    config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Storage engine settings, WAL lets the dashboards read while training jobs write
+    config['SQLITE_JOURNAL_MODE'] = os.environ.get('MINIML_SQLITE_JOURNAL_MODE', 'WAL')
+    config['SQLITE_SYNCHRONOUS'] = os.environ.get('MINIML_SQLITE_SYNCHRONOUS', 'NORMAL')
+    config['SQLITE_CACHE_SIZE'] = int(os.environ.get('MINIML_SQLITE_CACHE_SIZE', -65536)) # negative values are KiB
+    config['SQLITE_BUSY_TIMEOUT'] = int(os.environ.get('MINIML_SQLITE_BUSY_TIMEOUT', 30000)) # milliseconds
+    # Live logs: lines kept in memory per run, history in segment files on disk
+    config['LOG_DIR'] = os.environ.get('MINIML_LOG_DIR', os.path.abspath('experiment_logs'))
+    config['LOG_BUFFER_LINES'] = int(os.environ.get('MINIML_LOG_BUFFER_LINES', 1000))
+    config['LOG_SEGMENT_BYTES'] = int(os.environ.get('MINIML_LOG_SEGMENT_BYTES', 64 * 1024 * 1024))
+    config['LOG_MAX_RUNS'] = int(os.environ.get('MINIML_LOG_MAX_RUNS', 256))
+    # Parse results and curves of logs by content hash, on disk so that all workers share them:
+    # directory, total size in bytes, seconds they are kept
+    config['PARSE_CACHE_DIR'] = os.environ.get('MINIML_PARSE_CACHE_DIR', os.path.abspath('parse_cache'))
+    config['PARSE_CACHE_BYTES'] = int(os.environ.get('MINIML_PARSE_CACHE_BYTES', 256 * 1024 * 1024))
+    config['PARSE_CACHE_TTL'] = int(os.environ.get('MINIML_PARSE_CACHE_TTL', 3600))
+    # Total size in bytes of the precomputed resolutions of metric curves kept for downsampled history reads
+    config['CURVE_CACHE_BYTES'] = int(os.environ.get('MINIML_CURVE_CACHE_BYTES', 256 * 1024 * 1024))
+    # Total size in bytes of the cached responses of the read endpoints, 0 disables the cache
+    config['RESPONSE_CACHE_BYTES'] = int(os.environ.get('MINIML_RESPONSE_CACHE_BYTES', 64 * 1024 * 1024))
+    # Resumable log uploads: spool directory, largest accepted chunk, seconds until an abandoned upload is removed
+    config['UPLOAD_DIR'] = os.environ.get('MINIML_UPLOAD_DIR', os.path.abspath('uploads'))
+    config['UPLOAD_CHUNK_BYTES'] = int(os.environ.get('MINIML_UPLOAD_CHUNK_BYTES', 64 * 1024 * 1024))
+    config['UPLOAD_MAX_AGE'] = int(os.environ.get('MINIML_UPLOAD_MAX_AGE', 24 * 3600))
+    # Write-behind of live updates: seconds an acknowledged update may wait for its commit (0 writes
+    # every update before the response), pending metric points that start a commit before that
+    config['LIVE_UPDATE_MAX_STALENESS'] = float(os.environ.get('MINIML_LIVE_UPDATE_MAX_STALENESS', 1.0))
+    config['LIVE_UPDATE_MAX_PENDING'] = int(os.environ.get('MINIML_LIVE_UPDATE_MAX_PENDING', 10000))
+    # Directory where the worker processes of a server share their request metrics, unset for a single process
+    config['METRICS_DIR'] = os.environ.get('MINIML_METRICS_DIR')
+    # Request profiler, off unless one of the triggers is set: fraction of requests run under cProfile,
+    # threshold in milliseconds above which a request is kept with its stack samples, token of the X-Profile header
+    config['PROFILE_DIR'] = os.environ.get('MINIML_PROFILE_DIR', os.path.abspath('profiles'))
+    config['PROFILE_MAX_FILES'] = int(os.environ.get('MINIML_PROFILE_MAX_FILES', 100))
+    config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('MINIML_PROFILE_SAMPLE_RATE', 0))
+    config['PROFILE_SLOW_MS'] = float(os.environ.get('MINIML_PROFILE_SLOW_MS', 0))
+    config['PROFILE_TOKEN'] = os.environ.get('MINIML_PROFILE_TOKEN')
+
+db = SQLAlchemy()
+# All endpoints and CLI commands, registered on the app by create_app
+api = Blueprint('api', __name__, cli_group=None)
+
+# State of the current app in this process (created by create_app): stores,
+# caches and metrics. Everything that has to be the same in all worker
+# processes lives in the database or in the shared directories instead.
+def app_state(name):
+    return LocalProxy(lambda: current_app.extensions['miniml'][name])
+
+instrumentation = app_state('instrumentation')
+profiler = app_state('profiler')
+response_cache = app_state('response_cache')
+parse_cache = app_state('parse_cache')
+curve_levels = app_state('curve_levels')
+curve_levels_lock = app_state('curve_levels_lock')
+metric_name_ids = app_state('metric_name_ids')
+logs = app_state('logs')
+uploads = app_state('uploads')
+live_updates = app_state('live_updates')
 
 # Enum class to define the status of the experiment
 class StatusEnum(Enum): 
@@ -24,8 +112,22 @@ class StatusEnum(Enum):
     
 # Class Experiment to create the table in the database
 class Experiment(db.Model): 
+    # Indexes for the status filter and the most used sort fields of /experiments/compare
+    __table_args__ = (
+        db.Index('ix_experiment_status_run_id', 'status', 'run_id'),
+        db.Index('ix_experiment_status_started_at', 'status', 'started_at'),
+        db.Index('ix_experiment_status_ap', 'status', 'ap'),
+        db.Index('ix_experiment_status_total_loss', 'status', 'total_loss'),
+        db.Index('ix_experiment_ap', 'ap'),
+        db.Index('ix_experiment_total_loss', 'total_loss'),
+        # Indexes for the filters of GET /experiments
+        db.Index('ix_experiment_status', 'status'),
+        db.Index('ix_experiment_model_dataset', 'model', 'dataset'),
+        db.Index('ix_experiment_dataset', 'dataset'),
+        db.Index('ix_experiment_started_at', 'started_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    run_id = db.Column(db.String(200), nullable = False)
+    run_id = db.Column(db.String(200), nullable = False, unique = True, index = True)
     dataset = db.Column(db.String(200), nullable = True)
     model = db.Column(db.String(200), nullable = True)
     started_at = db.Column(db.DateTime, default = datetime.now)
@@ -33,7 +135,7 @@ class Experiment(db.Model):
     status = db.Column(db.Enum(StatusEnum), nullable = True, default = 'RUNNING')
     
     #Hyperparameters
-    learning_rate = db.Column(db.Float, nullable = False)
+    learning_rate = db.Column(db.Float, nullable = False, default = 0.0)
     batch_size = db.Column(db.Integer, nullable = False, default = 0)
     num_epochs = db.Column(db.Integer, nullable = True)
     
@@ -52,64 +154,652 @@ class Experiment(db.Model):
     loss_rpn_cls = db.Column(db.Float, nullable = False, default = 0.0)
     loss_rpn_loc = db.Column(db.Float, nullable = False, default = 0.0)
     mask_loss = db.Column(db.Float, nullable = True) # Optional metric for Instance Segmentation models
+
+    # sha256 of the uploaded or imported log, the same log is only stored once
+    log_hash = db.Column(db.String(64), nullable = True, unique = True, index = True)
+
+    # Row version, incremented by every update and used as ETag
+    version = db.Column(db.Integer, nullable = False, default = 1, server_default = '1')
+    __mapper_args__ = {'version_id_col': version}
+
+# Metric columns of Experiment which hold the latest value of each curve
+METRIC_FIELDS = (
+    'ap', 'ap50', 'ap75', 'aps', 'apm', 'apl',
+    'total_loss', 'loss_cls', 'loss_box_reg', 'loss_rpn_cls', 'loss_rpn_loc', 'mask_loss'
+)
+
+# Fields of an experiment returned by GET /experiments, in response order
+EXPERIMENT_FIELDS = (
+    'id', 'run_id', 'dataset', 'model', 'started_at', 'iterations', 'status',
+    'learning_rate', 'batch_size', 'num_epochs', *METRIC_FIELDS
+)
+
+# Hyperparameter columns of Experiment, every other parameter is stored in RunParam
+PARAM_FIELDS = ('learning_rate', 'batch_size', 'num_epochs')
+
+# Keys of an update that are not metrics: the other columns of Experiment and the update fields
+NON_METRIC_KEYS = frozenset(
+    ('id', 'run_id', 'dataset', 'model', 'started_at', 'iterations', 'status', 'log_hash', 'version',
+     *PARAM_FIELDS, 'step', 'metrics', 'params')
+)
+
+# Class MetricName to intern metric and parameter names as small integer ids
+class MetricName(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable = False, unique = True)
+
+# Class RunMetric with the latest value of every metric of a run that has no
+# column in Experiment. The covering index on (metric, value, run) makes a
+# filter or sort by any metric an index range scan, like on a metric column.
+class RunMetric(db.Model):
+    __table_args__ = (
+        db.Index('ix_run_metric_name_value', 'name_id', 'value', 'experiment_id'),
+        {'sqlite_with_rowid': False},
+    )
+    experiment_id = db.Column(db.Integer, db.ForeignKey('experiment.id'), primary_key=True)
+    name_id = db.Column(db.Integer, db.ForeignKey('metric_name.id'), primary_key=True)
+    value = db.Column(db.Float, nullable = False)
+
+# Class RunParam with the parameters of a run that have no column in
+# Experiment. Numbers (int, float, bool) are stored in number, strings in
+# text, and kind restores the type.
+class RunParam(db.Model):
+    __table_args__ = (
+        db.Index('ix_run_param_name_value', 'name_id', 'number', 'text', 'experiment_id'),
+        {'sqlite_with_rowid': False},
+    )
+    experiment_id = db.Column(db.Integer, db.ForeignKey('experiment.id'), primary_key=True)
+    name_id = db.Column(db.Integer, db.ForeignKey('metric_name.id'), primary_key=True)
+    kind = db.Column(db.String(5), nullable = False)
+    number = db.Column(db.Float, nullable = True)
+    text = db.Column(db.String(1000), nullable = True)
+
+# Class MetricPoint to store the full time series of every metric of a run.
+# The table is clustered on (experiment, metric, step) so that a step window
+# of one curve is a contiguous range scan.
+class MetricPoint(db.Model):
+    __table_args__ = {'sqlite_with_rowid': False}
+    experiment_id = db.Column(db.Integer, db.ForeignKey('experiment.id'), primary_key=True)
+    name_id = db.Column(db.Integer, db.ForeignKey('metric_name.id'), primary_key=True)
+    step = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Float, nullable = False)
+    timestamp = db.Column(db.Float, nullable = False, default = time.time)
+
+# Class ChangeLog with the cache tags of the runs touched by every committed
+# write, one row per tag. The data generation is the id of the newest row, so
+# it changes with every write in any worker process, and every process reads
+# the rows it has not seen to invalidate its cached responses of those runs.
+class ChangeLog(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    tag = db.Column(db.String(210), nullable = False)
+
+# A write that touches more runs than this (an import) logs one row that invalidates all cached responses
+MAX_CHANGE_TAGS = 100
+ALL_TAG = "*"
+# Rows kept in the change log, a process that fell further behind clears its whole cache
+CHANGE_LOG_ROWS = 10000
+
+# Interned metric names are cached per process (metric_name_ids), ids never change once committed
+def get_metric_name_ids(names):
+    # Names interned by the current transaction only become visible to the cache on commit
+    pending = db.session.info.setdefault('metric_name_ids', {})
+    missing = [name for name in names if name not in metric_name_ids and name not in pending]
+    if missing:
+        db.session.execute(
+            sqlite_insert(MetricName).on_conflict_do_nothing(),
+            [{"name": name} for name in missing]
+        )
+        pending.update(db.session.query(MetricName.name, MetricName.id).filter(MetricName.name.in_(missing)))
+    return {name: metric_name_ids.get(name) or pending[name] for name in names}
+
+# Id of a metric or parameter name for reading, None if it was never used
+def find_metric_name_id(name):
+    name_id = metric_name_ids.get(name)
+    if name_id is None:
+        name_id = db.session.query(MetricName.id).filter(MetricName.name == name).scalar()
+    return name_id
+
+@event.listens_for(Session, 'after_commit')
+def publish_metric_name_ids(session):
+    metric_name_ids.update(session.info.pop('metric_name_ids', {}))
+
+@event.listens_for(Session, 'after_rollback')
+def discard_metric_name_ids(session):
+    session.info.pop('metric_name_ids', None)
+
+# Response cache of the read endpoints. Lists of runs are tagged "experiments",
+# the responses about one run "run:<run_id>". Every flush collects the tags of
+# the experiments it creates, changes or deletes, and the commit invalidates
+# them, so all write paths (and only the runs they touch) are covered. The
+# commit also writes the tags to the change log for the other workers.
+LIST_TAG = "experiments"
+
+def run_tag(run_id):
+    return f"run:{run_id}"
+
+@event.listens_for(Session, 'before_flush')
+def collect_cache_tags(session, flush_context, instances):
+    tags = session.info.setdefault('cache_tags', set())
+    for instance in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, Experiment):
+            tags.update((LIST_TAG, run_tag(instance.run_id)))
+
+@event.listens_for(Session, 'before_commit')
+def log_changes(session):
+    session.flush()
+    tags = session.info.get('cache_tags')
+    if not tags:
+        return
+    if len(tags) > MAX_CHANGE_TAGS:
+        tags = {ALL_TAG}
+    # One multi-row insert, SQLite reports the id of its last row
+    connection = session.connection()
+    last_id = connection.execute(ChangeLog.__table__.insert().values([{"tag": tag} for tag in sorted(tags)])).lastrowid
+    # Pruned every 1000 rows
+    if last_id // 1000 != (last_id - len(tags)) // 1000:
+        connection.execute(ChangeLog.__table__.delete().where(ChangeLog.id <= last_id - CHANGE_LOG_ROWS))
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_cached_responses(session):
+    tags = session.info.pop('cache_tags', None)
+    if tags:
+        response_cache.invalidate(tags)
+        if has_request_context():
+            g.data_changed = True
+
+@event.listens_for(Session, 'after_rollback')
+def discard_cache_tags(session):
+    session.info.pop('cache_tags', None)
+
+# Catch up with the writes of all worker processes: invalidate the cached
+# responses of the runs they touched and advance the data generation. The
+# change log is only read when PRAGMA data_version shows a commit since the
+# last check, which costs microseconds per request while nothing is written.
+def sync_changes():
+    state = current_app.extensions['miniml']
+    watcher = state['commit_watcher']
+    with state['data_generation_lock']:
+        version = watcher.data_version()
+        if version == state['data_version']:
+            return
+        seen = state['data_generation']
+        if seen is None:
+            # Nothing is cached before the first request
+            rows = []
+            last_id = watcher.query("SELECT max(id) FROM change_log")[0][0] or 0
+        else:
+            rows = watcher.query("SELECT id, tag FROM change_log WHERE id > ? ORDER BY id", (seen,))
+            last_id = rows[-1][0] if rows else seen
+        # Ids have no gaps unless rows were pruned before this process read them
+        if rows and (rows[0][0] != seen + 1 or any(tag == ALL_TAG for _, tag in rows)):
+            response_cache.clear()
+        elif rows:
+            response_cache.invalidate({tag for _, tag in rows})
+        state['data_generation'] = last_id
+        state['data_version'] = version
+
+# Decorator to serve a read endpoint from the response cache. tags maps the
+# view arguments to the tags of the response. The key is the endpoint, its
+# arguments, the query parameters and the Accept header (format negotiation).
+# Only complete 200 and 404 responses are cached, not streamed ones. A
+# response with an ETag is answered with 304 if the client has it already.
+def cached_response(tags):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not response_cache.max_bytes:
+                return view(*args, **kwargs)
+            key = (
+                request.endpoint, tuple(sorted(kwargs.items())),
+                tuple(sorted(request.args.items(multi=True))), request.headers.get('Accept')
+            )
+            cached = response_cache.get(key)
+            if cached is not None:
+                body, status, headers = cached
+                return conditional_response(Response(body, status=status, headers=headers))
+            token = response_cache.start()
+            try:
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code in (200, 404) and not response.is_streamed:
+                    body = response.get_data()
+                    response_cache.put(key, (body, response.status_code, list(response.headers)), len(body), tags(**kwargs), token)
+            finally:
+                response_cache.finish(token)
+            return conditional_response(response)
+        return wrapper
+    return decorator
+
+def conditional_response(response):
+    if response.status_code == 200 and response.get_etag()[0]:
+        response.make_conditional(request)
+    return response
+
+# Decorator for the views that have to see the acknowledged live updates of a
+# run (the run_id argument) in this process: they are written first. Views
+# without run_id write all pending updates. Put it above @serialized, the
+# writer of the live updates needs the write lock.
+def flush_live_updates(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if live_updates:
+            live_updates.flush([kwargs['run_id']] if 'run_id' in kwargs else None)
+        return view(*args, **kwargs)
+    return wrapper
+
+def list_tags(**kwargs):
+    return (LIST_TAG,)
+
+def run_tags(run_id):
+    return (run_tag(run_id),)
+
+# Bulk insert of metric points in a single executemany, a repeated step overwrites the old value.
+# The statement is on the table, not the model, which skips the per-row work of the ORM bulk path.
+def insert_metric_points(rows):
+    if not rows:
+        return
+    stmt = sqlite_insert(MetricPoint.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MetricPoint.experiment_id, MetricPoint.name_id, MetricPoint.step],
+        set_={"value": stmt.excluded.value, "timestamp": stmt.excluded.timestamp}
+    )
+    db.session.execute(stmt, rows)
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def check_name(name, what):
+    if not isinstance(name, str) or not 0 < len(name) <= 100:
+        raise ValueError(f"{what} names must be strings of 1 to 100 characters.")
+
+# Status and iterations of an update and its metrics: every other top-level
+# number and the "metrics" object. Raises ValueError for invalid values.
+def parse_update(data):
+    fields = {}
+    if 'status' in data:
+        fields['status'] = StatusEnum(data['status'])
+    for name in ('iterations', 'step'):
+        if name in data and (not isinstance(data[name], int) or isinstance(data[name], bool)):
+            raise ValueError(f"{name} must be an integer.")
+    if 'iterations' in data:
+        fields['iterations'] = data['iterations']
+    metrics = parse_metrics(data.get('metrics'))
+    extra = parse_metrics({name: value for name, value in data.items() if name not in NON_METRIC_KEYS})
+    return fields, {**extra, **metrics}
+
+# Metrics {name: number} of a "metrics" object without the ones that are null
+def parse_metrics(metrics):
+    metrics = metrics or {}
+    if not isinstance(metrics, dict):
+        raise ValueError("metrics must be an object.")
+    for name, value in metrics.items():
+        check_name(name, "Metric")
+        if value is not None and not is_number(value):
+            raise ValueError(f"{name} must be a number.")
+    return {name: value for name, value in metrics.items() if value is not None}
+
+# Parameters of a run: the hyperparameter columns at the top level and the "params" object
+def parse_params(data):
+    params = data.get('params') or {}
+    if not isinstance(params, dict):
+        raise ValueError("params must be an object.")
+    params = {**{name: data[name] for name in PARAM_FIELDS if name in data}, **params}
+    for name, value in params.items():
+        check_name(name, "Parameter")
+        if name in PARAM_FIELDS:
+            if value is not None and not is_number(value):
+                raise ValueError(f"{name} must be a number.")
+        elif value is not None and not isinstance(value, (int, float, str)):
+            raise ValueError(f"Parameter {name} must be a number, boolean or string.")
+        elif isinstance(value, str) and len(value) > 1000:
+            raise ValueError(f"Parameter {name} is longer than 1000 characters.")
+    return params
+
+# Keep the latest metric values ({experiment: {name: value}}): in the column of
+# a metric that has one, else in RunMetric, all of them in one bulk upsert
+def set_metric_values(values):
+    rows = []
+    for experiment, metrics in values.items():
+        if not metrics:
+            continue
+        # The row version (ETag) of the run changes with every new metric point,
+        # also when the latest values stay the same, the stream and caches rely on it
+        flag_modified(experiment, 'iterations')
+        extra = {}
+        for name, value in metrics.items():
+            if name in METRIC_FIELDS:
+                setattr(experiment, name, value)
+            else:
+                extra[name] = value
+        if extra:
+            rows.append((experiment, extra))
+    if not rows:
+        return
+    name_ids = get_metric_name_ids(sorted({name for _, extra in rows for name in extra}))
+    stmt = sqlite_insert(RunMetric.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[RunMetric.experiment_id, RunMetric.name_id], set_={"value": stmt.excluded.value}
+    )
+    db.session.execute(stmt, [
+        {"experiment_id": experiment.id, "name_id": name_ids[name], "value": value}
+        for experiment, extra in rows for name, value in extra.items()
+    ])
+
+# Set parameters of an experiment: the hyperparameter columns, every other one in RunParam
+def set_params(experiment, params):
+    extra = {}
+    for name, value in params.items():
+        if name in PARAM_FIELDS:
+            setattr(experiment, name, value)
+        else:
+            extra[name] = value
+    if not extra:
+        return
+    flag_modified(experiment, 'iterations')
+    name_ids = get_metric_name_ids(sorted(extra))
+    stmt = sqlite_insert(RunParam.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[RunParam.experiment_id, RunParam.name_id],
+        set_={"kind": stmt.excluded.kind, "number": stmt.excluded.number, "text": stmt.excluded.text}
+    )
+    db.session.execute(stmt, [
+        {"experiment_id": experiment.id, "name_id": name_ids[name], "kind": param_kind(value),
+         "number": None if isinstance(value, str) or value is None else float(value),
+         "text": value if isinstance(value, str) else None}
+        for name, value in extra.items()
+    ])
+
+def param_kind(value):
+    if value is None:
+        return 'none'
+    if isinstance(value, bool):
+        return 'bool'
+    return {int: 'int', float: 'float', str: 'str'}[type(value)]
+
+def param_value(kind, number, text):
+    if kind == 'str':
+        return text
+    if kind == 'int':
+        return int(number)
+    if kind == 'bool':
+        return bool(number)
+    return number
+
+# Other metrics and parameters of an experiment, {name: value} each
+def experiment_values(experiment):
+    metrics = dict(
+        db.session.query(MetricName.name, RunMetric.value)
+        .join(RunMetric, RunMetric.name_id == MetricName.id)
+        .filter(RunMetric.experiment_id == experiment.id)
+    )
+    params = {
+        name: param_value(kind, number, text)
+        for name, kind, number, text in db.session.query(MetricName.name, RunParam.kind, RunParam.number, RunParam.text)
+        .join(RunParam, RunParam.name_id == MetricName.id)
+        .filter(RunParam.experiment_id == experiment.id)
+    }
+    return metrics, params
+
+# Write metric points (one per metric at the given step) and keep the latest values
+def record_metrics(experiment, step, values):
+    values = {name: value for name, value in values.items() if value is not None}
+    if not values:
+        return
+    name_ids = get_metric_name_ids(list(values))
+    now = time.time()
+    insert_metric_points([
+        {"experiment_id": experiment.id, "name_id": name_ids[name], "step": step, "value": value, "timestamp": now}
+        for name, value in values.items()
+    ])
+    set_metric_values({experiment: values})
+
+# Write the curves of a parsed log ({name: (steps, values)} NumPy arrays) as metric points in one bulk insert
+def insert_history(experiment, history):
+    if not history:
+        return
+    name_ids = get_metric_name_ids(list(history))
+    now = time.time()
+    insert_metric_points([
+        {"experiment_id": experiment.id, "name_id": name_ids[name], "step": step, "value": value, "timestamp": now}
+        for name, (steps, values) in history.items()
+        for step, value in zip(steps.tolist(), values.tolist())
+    ])
     
 #Endpoints 
+@api.before_app_request
+def sync_data_generation():
+    sync_changes()
+
+# Every response carries the data generation it was computed from, a write its own
+@api.after_app_request
+def add_data_generation(response):
+    if g.pop('data_changed', False):
+        sync_changes()
+    response.headers['X-Data-Generation'] = str(current_app.extensions['miniml']['data_generation'])
+    return response
+
+# Generation endpoint, a cheap way for the dashboard to check if its cached data is still valid
+@api.route('/generation', methods = ['GET'])
+def get_data_generation():
+    return jsonify({"generation": str(current_app.extensions['miniml']['data_generation'])}), 200
+
+# Hit and miss counters of the response cache
+@api.route('/cache/stats', methods = ['GET'])
+def get_cache_stats():
+    return jsonify(response_cache.stats()), 200
+
+# Scrape endpoint of the request metrics in the Prometheus text format
+@api.route('/metrics', methods = ['GET'])
+def get_request_metrics():
+    return Response(instrumentation.render(), mimetype='text/plain; version=0.0.4')
+
+# Profiles endpoint to list the kept request profiles, newest first
+@api.route('/profiles', methods = ['GET'])
+def list_profiles():
+    return jsonify({"enabled": profiler.enabled, "profiles": profiler.list()}), 200
+
+# Profile endpoint with the SQL statements and the hot functions or stacks of one request
+@api.route('/profiles/<string:profile_id>', methods = ['GET'])
+def get_profile(profile_id):
+    profile = profiler.get(profile_id)
+    if profile is None:
+        return jsonify({"error": "Profile not found."}), 404
+    return jsonify(profile), 200
+
+# cProfile stats of a profile, e.g. for python -m pstats or snakeviz
+@api.route('/profiles/<string:profile_id>/stats', methods = ['GET'])
+def get_profile_stats(profile_id):
+    path = profiler.stats_path(profile_id)
+    if path is None:
+        return jsonify({"error": "Profile has no cProfile stats."}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True, download_name=f"{profile_id}.prof")
+
+# Whether an IntegrityError is the unique constraint of run_id, i.e. the run
+# exists already; every other constraint (NOT NULL, log_hash) is a bad request
+def is_duplicate_run(error):
+    return 'UNIQUE constraint failed: experiment.run_id' in str(error.orig)
+
+def is_duplicate_log(error):
+    return 'UNIQUE constraint failed: experiment.log_hash' in str(error.orig)
+
 # Endpoint to create a new experiment
-@app.route('/experiments', methods=['POST'])
+@api.route('/experiments', methods=['POST'])
+@serialized
 def create_experiment():
     data = request.json
     try:
+        # Missing fields get the defaults of the columns
         new_experiment = Experiment(
             run_id=data['run_id'],
-            dataset=data['dataset'],
-            model=data['model'],
-            learning_rate=data['learning_rate'],
-            batch_size=data['batch_size'],
-            num_epochs=data['num_epochs']
+            **{field: data[field] for field in ('dataset', 'model', *PARAM_FIELDS) if data.get(field) is not None}
         )
+        params = parse_params(data)
         db.session.add(new_experiment)
+        if data.get('params'):
+            db.session.flush()
+            set_params(new_experiment, params)
         db.session.commit()
         logging.info(f"Experiment {data['run_id']} created successfully.")
         return jsonify({"message": "Experiment created successfully!"}), 201
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_duplicate_run(e):
+            logging.warning(f"Experiment {data['run_id']} already exists.")
+            return jsonify({"error": "Experiment already exists."}), 409
+        logging.error(f"Error creating experiment: {str(e.orig)}")
+        return jsonify({"error": str(e.orig)}), 400
     except Exception as e:
+        db.session.rollback()
         logging.error(f"Error creating experiment: {str(e)}")
         return jsonify({"error": str(e)}), 400
     
-# Read endpoint to get all the experiments
-@app.route('/experiments', methods = ['GET'])
+# Page size of GET /experiments
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+# Opaque pagination cursor holding the last id of the previous page
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+def decode_cursor(cursor):
+    try: 
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except Exception: 
+        raise ValueError("invalid cursor")
+
+# Rows per record batch of the Arrow and Parquet streams
+EXPORT_BATCH_SIZE = 10000
+
+# Status as its value ('Running'), computed by SQLite instead of per row in Python
+STATUS_VALUE = case({member.name: member.value for member in StatusEnum}, value=type_coerce(Experiment.status, db.String))
+
+def export_columns(fields):
+    return [STATUS_VALUE.label('status') if field == 'status' else getattr(Experiment, field) for field in fields]
+
+# Response with rows of the given fields in one of the column oriented formats,
+# columns are the table columns of the fields (default the Experiment columns)
+def export_response(rows, fields, export_format, columns=None):
+    if export_format == 'columns': 
+        return jsonify(columns_json(rows, fields))
+    if columns is None:
+        columns = [Experiment.__table__.c[field] for field in fields]
+    schema = arrow_schema(fields, columns)
+    batches = record_batches(rows, schema, EXPORT_BATCH_SIZE)
+    if export_format == 'arrow': 
+        return Response(stream_with_context(stream_arrow(batches, schema)), mimetype=ARROW_MIMETYPE)
+    return Response(stream_with_context(stream_parquet(batches, schema)), mimetype=PARQUET_MIMETYPE)
+
+# Numeric columns that can be filtered by range without a join
+RANGE_FIELDS = ('learning_rate', 'batch_size', 'num_epochs', 'iterations', *METRIC_FIELDS)
+
+# Apply the min_<metric> and max_<metric> query parameters to a query of
+# experiments. Metrics without a column are matched in RunMetric through the
+# (name_id, value) index, raises ValueError for invalid values
+def filter_metric_ranges(query):
+    ranges = {}
+    for key, value in request.args.items():
+        if key.startswith(('min_', 'max_')) and len(key) > 4:
+            try:
+                ranges.setdefault(key[4:], {})[key[:3]] = float(value)
+            except ValueError:
+                raise ValueError(f"{key} must be a number")
+    for name, bounds in ranges.items():
+        if name in RANGE_FIELDS:
+            column = getattr(Experiment, name)
+            if 'min' in bounds:
+                query = query.filter(column >= bounds['min'])
+            if 'max' in bounds:
+                query = query.filter(column <= bounds['max'])
+            continue
+        name_id = find_metric_name_id(name)
+        if name_id is None:
+            # No run has this metric
+            query = query.filter(false())
+            continue
+        matching = select(RunMetric.experiment_id).where(RunMetric.name_id == name_id)
+        if 'min' in bounds:
+            matching = matching.where(RunMetric.value >= bounds['min'])
+        if 'max' in bounds:
+            matching = matching.where(RunMetric.value <= bounds['max'])
+        query = query.filter(Experiment.id.in_(matching))
+    return query
+
+# Apply the status, model, dataset, started_after, started_before and metric
+# range query parameters to a query of experiments, raises ValueError for invalid values
+def filter_experiments(query):
+    if request.args.get('status'): 
+        query = query.filter(Experiment.status == StatusEnum(request.args['status']))
+    if request.args.get('started_after'): 
+        query = query.filter(Experiment.started_at >= datetime.fromisoformat(request.args['started_after']))
+    if request.args.get('started_before'): 
+        query = query.filter(Experiment.started_at < datetime.fromisoformat(request.args['started_before']))
+    for field in ('model', 'dataset'): 
+        if request.args.get(field): 
+            query = query.filter(getattr(Experiment, field) == request.args[field])
+    return filter_metric_ranges(query)
+
+# Read endpoint to get the experiments, page by page
+# Query parameters: 
+#   fields: comma separated list of the fields to return (default all)
+#   status, model, dataset: only return matching experiments
+#   started_after, started_before: ISO 8601 range for started_at
+#   min_<metric>, max_<metric>: range of a metric or hyperparameter, e.g. min_ap=40
+#   limit: page size, cursor: value of the X-Next-Cursor header of the previous page
+#   format: json, columns, arrow or parquet (or an Accept header with the Arrow or Parquet type)
+@api.route('/experiments', methods = ['GET'])
+@cached_response(list_tags)
 def get_experiments(): 
-    experiments = Experiment.query.all()
-    result = []
-    for exp in experiments: 
-        result.append({
-            "id": exp.id,
-            "run_id": exp.run_id,
-            "dataset": exp.dataset,
-            "model": exp.model,
-            "started_at": exp.started_at,
-            "iterations": exp.iterations,
-            "status": exp.status.value,
-            "learning_rate": exp.learning_rate,
-            "batch_size": exp.batch_size,
-            "num_epochs": exp.num_epochs,
-            "ap": exp.ap,
-            "ap50": exp.ap50,
-            "ap75": exp.ap75,
-            "aps": exp.aps,
-            "apm": exp.apm,
-            "apl": exp.apl,
-            "total_loss": exp.total_loss,
-            "loss_cls": exp.loss_cls,
-            "loss_box_reg": exp.loss_box_reg,
-            "loss_rpn_cls": exp.loss_rpn_cls,
-            "loss_rpn_loc": exp.loss_rpn_loc,
-            "mask_loss": exp.mask_loss
-        })
-    logging.info("Retrieved all experiments.")
-    return jsonify(result), 200 
-
-#Update endpoint to update the status of the experiment
-@app.route('/experiments/<string:run_id>', methods = ['PUT'])
+    fields = request.args.get('fields')
+    fields = fields.split(',') if fields else list(EXPERIMENT_FIELDS)
+    invalid = [field for field in fields if field not in EXPERIMENT_FIELDS]
+    if invalid: 
+        logging.error("Invalid fields requested.")
+        return jsonify({"error": f"Invalid fields: {', '.join(invalid)}."}), 400
+    export_format = negotiate_format(request)
+    if export_format not in EXPORT_FORMATS: 
+        logging.error("Invalid format requested.")
+        return jsonify({"error": f"Invalid format: {export_format}."}), 400
+    # Arrow and Parquet are streamed and return all experiments unless a limit is given
+    streamed = export_format in ('arrow', 'parquet')
+    limit = request.args.get('limit', None if streamed else DEFAULT_PAGE_SIZE, type=int)
+    if limit is not None and not streamed: 
+        limit = min(limit, MAX_PAGE_SIZE)
+    if limit is not None and limit < 1: 
+        logging.error("Invalid limit.")
+        return jsonify({"error": "Invalid limit."}), 400
+
+    query = db.session.query(*export_columns(fields))
+    try: 
+        cursor = request.args.get('cursor')
+        if cursor: 
+            query = query.filter(Experiment.id > decode_cursor(cursor))
+        query = filter_experiments(query)
+    except ValueError as e: 
+        logging.error(f"Invalid query parameter: {str(e)}")
+        return jsonify({"error": f"Invalid query parameter: {str(e)}"}), 400
+    query = query.order_by(Experiment.id)
+
+    if streamed: 
+        if limit: 
+            query = query.limit(limit)
+        logging.info(f"Streaming experiments as {export_format}.")
+        return export_response(query.yield_per(EXPORT_BATCH_SIZE), fields, export_format)
+
+    # The id is selected last as keyset for the next page
+    rows = query.add_columns(Experiment.id).limit(limit + 1).all()
+    page = [row[:-1] for row in rows[:limit]]
+    if export_format == 'columns': 
+        response = export_response(page, fields, export_format)
+    else: 
+        response = jsonify([dict(zip(fields, row)) for row in page])
+    if len(rows) > limit: 
+        response.headers['X-Next-Cursor'] = encode_cursor(rows[limit - 1][-1])
+    logging.info(f"Retrieved {len(page)} experiments.")
+    return response, 200
+
+#Update endpoint to update the status, latest metrics and parameters of the experiment
+@api.route('/experiments/<string:run_id>', methods = ['PUT'])
+@flush_live_updates
+@serialized
 def update_experiment(run_id):  
     data = request.json
     experiment = Experiment.query.filter_by(run_id = run_id).first()
@@ -117,59 +807,91 @@ def update_experiment(run_id):
         logging.warning(f"Experiment {run_id} not found.")
         return jsonify({"error": "Experiment not found."}), 404
     try: 
-        if 'status' in data: 
-            experiment.status = StatusEnum(data['status'])
-        if 'iterations' in data: 
-            experiment.iterations = data['iterations']
-        if 'ap' in data: 
-            experiment.ap = data['ap']
-        if 'ap50' in data: 
-            experiment.ap50 = data['ap50']
-        if 'ap75' in data:
-            experiment.ap75 = data['ap75']
-        if 'aps' in data:
-            experiment.aps = data['aps']
-        if 'apm' in data:
-            experiment.apm = data['apm']
-        if 'apl' in data:
-            experiment.apl = data['apl']
-        if 'total_loss' in data:
-            experiment.total_loss = data['total_loss']
-        if 'loss_cls' in data:
-            experiment.loss_cls = data['loss_cls']
-        if 'loss_box_reg' in data:
-            experiment.loss_box_reg = data['loss_box_reg']
-        if 'loss_rpn_cls' in data:
-            experiment.loss_rpn_cls = data['loss_rpn_cls']
-        if 'loss_rpn_loc' in data:
-            experiment.loss_rpn_loc = data['loss_rpn_loc']
-        if 'mask_loss' in data:
-            experiment.mask_loss = data['mask_loss']
+        fields, metrics = parse_update(data)
+        params = parse_params(data)
+        for name, value in fields.items():
+            setattr(experiment, name, value)
+        set_metric_values({experiment: metrics})
+        set_params(experiment, params)
         db.session.commit()
         logging.info(f"Experiment {run_id} updated successfully.")
         return jsonify({"message": "Experiment updated successfully."}), 200
     except Exception as e:
+        db.session.rollback()
         logging.error(f"Error updating experiment {run_id}: {str(e)}")
         return jsonify({"error": str(e)}), 400
     
 #Delete endpoint to delete an experiment
-@app.route('/experiments/<string:run_id>', methods = ['DELETE'])
+@api.route('/experiments/<string:run_id>', methods = ['DELETE'])
+@serialized
 def delete_experiment(run_id):
     experiment = Experiment.query.filter_by(run_id = run_id).first()
     if experiment is None: 
         logging.warning(f"Experiment {run_id} not found.")
         return jsonify({"error": "Experiment not found."}), 404
     try: 
+        for model in (MetricPoint, RunMetric, RunParam):
+            model.query.filter_by(experiment_id = experiment.id).delete()
         db.session.delete(experiment)
         db.session.commit()
+        if live_updates:
+            live_updates.discard(run_id)
+        logs.delete(run_id)
         logging.info(f"Experiment {run_id} deleted successfully.")
         return jsonify({"message": "Experiment deleted successfully."}), 200
     except Exception as e:
+        db.session.rollback()
         logging.error(f"Error deleting experiment {run_id}: {str(e)}")
         return jsonify({"error": str(e)}), 400
     
+#Run endpoint to get all fields of the experiment in one response
+# The response is cached with its ETag, so revalidating an unchanged run needs no query
+@api.route('/experiments/<string:run_id>', methods = ['GET'])
+@flush_live_updates
+@cached_response(run_tags)
+def get_experiment(run_id):
+    experiment = Experiment.query.filter_by(run_id = run_id).first()
+    if experiment is None: 
+        logging.warning(f"Experiment {run_id} not found.")
+        return jsonify({"error": "Experiment not found."}), 404
+    metrics, params = experiment_values(experiment)
+    response = jsonify({
+        "id": experiment.id,
+        "run_id": experiment.run_id,
+        "version": experiment.version,
+        "dataset": experiment.dataset,
+        "model": experiment.model,
+        "started_at": experiment.started_at,
+        "iterations": experiment.iterations,
+        "status": experiment.status.value,
+        "learning_rate": experiment.learning_rate,
+        "batch_size": experiment.batch_size,
+        "num_epochs": experiment.num_epochs,
+        "ap": experiment.ap,
+        "ap50": experiment.ap50,
+        "ap75": experiment.ap75,
+        "aps": experiment.aps,
+        "apm": experiment.apm,
+        "apl": experiment.apl,
+        "total_loss": experiment.total_loss,
+        "loss_cls": experiment.loss_cls,
+        "loss_box_reg": experiment.loss_box_reg,
+        "loss_rpn_cls": experiment.loss_rpn_cls,
+        "loss_rpn_loc": experiment.loss_rpn_loc,
+        "mask_loss": experiment.mask_loss,
+        # Metrics and parameters without a column
+        "metrics": metrics,
+        "params": params
+    })
+    # Clients have to revalidate, but an unchanged run only costs a 304
+    response.set_etag(f"{experiment.id}-{experiment.version}")
+    response.cache_control.no_cache = True
+    logging.info(f"Experiment {run_id} retrieved successfully.")
+    return response
+
 #Status endpoint to monitor the status 
-@app.route('/experiments/<string:run_id>/status', methods = ['GET'])
+@api.route('/experiments/<string:run_id>/status', methods = ['GET'])
+@flush_live_updates
 def get_experiment_status(run_id): 
     experiment = Experiment.query.filter_by(run_id = run_id).first()
     if experiment is None: 
@@ -185,7 +907,8 @@ def get_experiment_status(run_id):
     return jsonify(result), 200
 
 #Information endpoint to get the information of the experiment
-@app.route('/experiments/<string:run_id>/info', methods = ['GET'])
+@api.route('/experiments/<string:run_id>/info', methods = ['GET'])
+@cached_response(run_tags)
 def get_experiment_info(run_id):
     experiment = Experiment.query.filter_by(run_id = run_id).first()
     if experiment is None: 
@@ -203,7 +926,9 @@ def get_experiment_info(run_id):
     return jsonify(result), 200
 
 #Metrics endpoint to get the metrics of the experiment
-@app.route('/experiments/<string:run_id>/metrics', methods = ['GET'])
+@api.route('/experiments/<string:run_id>/metrics', methods = ['GET'])
+@flush_live_updates
+@cached_response(run_tags)
 def get_experiment_metrics(run_id):
     experiment = Experiment.query.filter_by(run_id = run_id).first()
     if experiment is None: 
@@ -228,8 +953,31 @@ def get_experiment_metrics(run_id):
     return jsonify(result), 200
 
 #Automatic update Endpoint to live update the status of the experiment
-@app.route('/experiments/<string:run_id>/update', methods = ['POST'])
+#The update is acknowledged with 202 and written by the write-behind buffer within
+#LIVE_UPDATE_MAX_STALENESS seconds, together with the other pending updates
+@api.route('/experiments/<string:run_id>/update', methods = ['POST'])
 def update_experiment_live(run_id):
+    if not live_updates:
+        return update_experiment_now(run_id)
+    experiment = db.session.query(Experiment.iterations).filter_by(run_id = run_id).first()
+    if experiment is None: 
+        logging.warning(f"Experiment {run_id} not found.")
+        return jsonify({"error": "Experiment not found."}), 404
+    data = request.json 
+    if data is None: 
+        logging.error("No data provided for live update.")
+        return jsonify({"error": "No data provided."}), 400
+    try: 
+        fields, metrics = parse_update(data)
+    except ValueError as e:
+        logging.error(f"Invalid live update for experiment {run_id}: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+    step = live_updates.put(run_id, fields, metrics, data.get('step'), experiment.iterations)
+    return jsonify({"message": "Experiment update accepted.", "step": step}), 202
+
+#Live update written before the response, without write-behind
+@serialized
+def update_experiment_now(run_id):
     experiment = Experiment.query.filter_by(run_id = run_id).first()
     if experiment is None: 
         logging.warning(f"Experiment {run_id} not found.")
@@ -239,59 +987,211 @@ def update_experiment_live(run_id):
         logging.error("No data provided for live update.")
         return jsonify({"error": "No data provided."}), 400
     try: 
-        if 'status' in data: 
-            experiment.status = StatusEnum(data['status'])
-        if 'iterations' in data: 
-            experiment.iterations = data['iterations']
-        if 'ap' in data: 
-            experiment.ap = data['ap']
-        if 'ap50' in data: 
-            experiment.ap50 = data['ap50']
-        if 'ap75' in data:
-            experiment.ap75 = data['ap75']
-        if 'aps' in data:
-            experiment.aps = data['aps']
-        if 'apm' in data:
-            experiment.apm = data['apm']
-        if 'apl' in data:
-            experiment.apl = data['apl']
-        if 'total_loss' in data:
-            experiment.total_loss = data['total_loss']
-        if 'loss_cls' in data:
-            experiment.loss_cls = data['loss_cls']
-        if 'loss_box_reg' in data:
-            experiment.loss_box_reg = data['loss_box_reg']
-        if 'loss_rpn_cls' in data:
-            experiment.loss_rpn_cls = data['loss_rpn_cls']
-        if 'loss_rpn_loc' in data:
-            experiment.loss_rpn_loc = data['loss_rpn_loc']
-        if 'mask_loss' in data:
-            experiment.mask_loss = data['mask_loss']
+        fields, metrics = parse_update(data)
+        for name, value in fields.items():
+            setattr(experiment, name, value)
+        # Every update is appended to the metric history, the latest values are kept as well
+        step = data.get('step', experiment.iterations)
+        record_metrics(experiment, step, metrics)
         db.session.commit()
         logging.info(f"Experiment {run_id} updated successfully.")
         return jsonify({"message": "Experiment updated successfully."}), 200
     except Exception as e:
+        db.session.rollback()
         logging.error(f"Error updating experiment {run_id}: {str(e)}")
         return jsonify({"error": str(e)}), 400
 
+#Write a batch of coalesced live updates ({run_id: pending updates}) in one transaction
+def write_live_updates(batch):
+    with serialized_write():
+        experiments = {exp.run_id: exp for exp in Experiment.query.filter(Experiment.run_id.in_(list(batch)))}
+        name_ids = get_metric_name_ids(sorted({name for pending in batch.values() for name, _ in pending.points}))
+        rows = []
+        latest = {}
+        for run_id, pending in batch.items():
+            experiment = experiments.get(run_id)
+            if experiment is None:
+                logging.warning(f"Experiment {run_id} was deleted, dropped {pending.updates} live updates.")
+                continue
+            for name, value in pending.fields.items():
+                setattr(experiment, name, value)
+            latest[experiment] = pending.values
+            rows.extend(
+                {"experiment_id": experiment.id, "name_id": name_ids[name], "step": step, "value": value, "timestamp": timestamp}
+                for (name, step), (value, timestamp) in pending.points.items()
+            )
+        insert_metric_points(rows)
+        set_metric_values(latest)
+        db.session.commit()
+    logging.info(f"Wrote {sum(pending.updates for pending in batch.values())} live updates of {len(batch)} experiments.")
+
+#Batch update endpoint to ingest many live updates (many steps, many runs) in one transaction
+@api.route('/experiments/batch-update', methods = ['POST'])
+@flush_live_updates
+@serialized
+def update_experiments_batch():
+    data = request.json
+    if data is None: 
+        logging.error("No data provided for batch update.")
+        return jsonify({"error": "No data provided."}), 400
+    # Accept a bare list of updates or {"run_id": default, "updates": [...]}
+    default_run_id = None
+    if isinstance(data, dict):
+        default_run_id = data.get('run_id')
+        data = data.get('updates')
+    if not isinstance(data, list) or not all(isinstance(update, dict) for update in data):
+        logging.error("Batch update requires a list of updates.")
+        return jsonify({"error": "A list of updates is required."}), 400
+
+    run_ids = {update.get('run_id', default_run_id) for update in data}
+    experiments = {exp.run_id: exp for exp in Experiment.query.filter(Experiment.run_id.in_(run_ids))}
+    missing = sorted(str(run_id) for run_id in run_ids if run_id not in experiments)
+    if missing: 
+        logging.warning(f"Experiments {', '.join(missing)} not found.")
+        return jsonify({"error": "Experiment not found.", "run_ids": missing}), 404
+
+    try: 
+        updates = [parse_update(update) for update in data]
+        name_ids = get_metric_name_ids(sorted({name for _, metrics in updates for name in metrics}))
+        now = time.time()
+        rows = []
+        latest = {}
+        for update, (fields, metrics) in zip(data, updates): 
+            experiment = experiments[update.get('run_id', default_run_id)]
+            for name, value in fields.items():
+                setattr(experiment, name, value)
+            step = update.get('step', experiment.iterations)
+            for name, value in metrics.items(): 
+                rows.append({"experiment_id": experiment.id, "name_id": name_ids[name], "step": step, "value": value, "timestamp": now})
+            latest.setdefault(experiment, {}).update(metrics)
+        insert_metric_points(rows)
+        set_metric_values(latest)
+        db.session.commit()
+        logging.info(f"Batch of {len(data)} updates for {len(experiments)} experiments applied successfully.")
+        return jsonify({"message": "Experiments updated successfully.", "updates": len(data), "points": len(rows)}), 200
+    except Exception as e:
+        db.session.rollback()
+        logging.error(f"Error applying batch update: {str(e)}")
+        return jsonify({"error": str(e)}), 400
+
+# Resolutions of the curves read with max_points, by (experiment, metric) and
+# the state of the curve (row version of the experiment, last step and its
+# write time), so that new points of a running experiment lead to new levels.
+# Every worker process keeps its own in curve_levels, the keys are the same in all.
+MAX_HISTORY_POINTS = 100000
+
+def get_curve_levels(key):
+    with curve_levels_lock:
+        levels = curve_levels.get(key)
+    if levels is None:
+        experiment_id, name_id = key[:2]
+        statement = db.select(MetricPoint.step, MetricPoint.value) \
+            .where(MetricPoint.experiment_id == experiment_id, MetricPoint.name_id == name_id) \
+            .order_by(MetricPoint.step)
+        result = db.session.connection().execute(statement)
+        points = np.array(result.cursor.fetchall(), dtype=np.float64).reshape(-1, 2)
+        result.close()
+        levels = CurveLevels(points[:, 0].astype(np.int64), points[:, 1])
+        try:
+            with curve_levels_lock:
+                curve_levels[key] = levels
+        except ValueError:
+            logging.warning(f"Curve {name_id} of experiment {experiment_id} is too large for the curve cache.")
+    return levels
+
+# Shape preserving reduction of the curves to at most max_points points each
+def downsampled_history(experiment, names, start, end, max_points, method):
+    # The last point of every curve is one lookup in the primary key, no scan of the points
+    def last_point(column):
+        return db.select(column).where(
+            MetricPoint.experiment_id == experiment.id, MetricPoint.name_id == MetricName.id
+        ).order_by(MetricPoint.step.desc()).limit(1).correlate(MetricName).scalar_subquery()
+    query = db.session.query(MetricName.id, MetricName.name, last_point(MetricPoint.step), last_point(MetricPoint.timestamp))
+    if names:
+        query = query.filter(MetricName.name.in_(names))
+    metrics = {}
+    for name_id, name, last_step, last_write in query.all():
+        if last_step is None:
+            continue
+        levels = get_curve_levels((experiment.id, name_id, experiment.version, last_step, last_write))
+        steps, values = levels.select(max_points, start, end, method)
+        metrics[name] = {"steps": steps.tolist(), "values": values.tolist()}
+    return metrics
+
+#History endpoint to get the metric curves of the experiment
+# Query parameters: 
+#   metric: name of a curve, can be repeated (default all)
+#   start, end: step window
+#   max_points: downsample every curve to at most this many points
+#   method: lttb (default) or minmax buckets for the downsampling
+@api.route('/experiments/<string:run_id>/history', methods = ['GET'])
+@flush_live_updates
+def get_experiment_history(run_id):
+    experiment = Experiment.query.filter_by(run_id = run_id).first()
+    if experiment is None: 
+        logging.warning(f"Experiment {run_id} not found.")
+        return jsonify({"error": "Experiment not found."}), 404
+    names = request.args.getlist('metric')
+    start = request.args.get('start', type=int)
+    end = request.args.get('end', type=int)
+
+    max_points = request.args.get('max_points', type=int)
+    if max_points is not None: 
+        method = request.args.get('method', 'lttb')
+        if method not in DOWNSAMPLE_METHODS: 
+            return jsonify({"error": f"Invalid method: {method}."}), 400
+        if not 4 <= max_points <= MAX_HISTORY_POINTS: 
+            return jsonify({"error": f"max_points must be between 4 and {MAX_HISTORY_POINTS}."}), 400
+        metrics = downsampled_history(experiment, names, start, end, max_points, method)
+        logging.info(f"Downsampled history for experiment {run_id} retrieved successfully.")
+        return jsonify({"run_id": experiment.run_id, "metrics": metrics}), 200
+
+    query = db.session.query(MetricName.name, MetricPoint.step, MetricPoint.value) \
+        .join(MetricName, MetricName.id == MetricPoint.name_id) \
+        .filter(MetricPoint.experiment_id == experiment.id)
+    if names:
+        query = query.filter(MetricName.name.in_(names))
+    if start is not None:
+        query = query.filter(MetricPoint.step >= start)
+    if end is not None:
+        query = query.filter(MetricPoint.step <= end)
+    query = query.order_by(MetricPoint.name_id, MetricPoint.step)
+
+    # Column oriented result: one list of steps and one list of values per metric
+    metrics = {}
+    for name, step, value in query:
+        series = metrics.setdefault(name, {"steps": [], "values": []})
+        series["steps"].append(step)
+        series["values"].append(value)
+    logging.info(f"History for experiment {run_id} retrieved successfully.")
+    return jsonify({"run_id": experiment.run_id, "metrics": metrics}), 200
+
+# Fields of an experiment returned by /experiments/compare, in response order
+COMPARE_FIELDS = (
+    'id', 'run_id', 'dataset', 'model', 'status',
+    'learning_rate', 'batch_size', 'num_epochs', *METRIC_FIELDS, 'iterations'
+)
+
 #Comparison endpoint 
-@app.route('/experiments/compare', methods = ['GET'])
+# sort_by is one of COMPARE_FIELDS or the name of any other metric, which is
+# then returned with the experiments; only experiments that have it are compared
+@api.route('/experiments/compare', methods = ['GET'])
+@cached_response(list_tags)
 def compare_experiments():
     status_filter = request.args.get('status')
     sort_by = request.args.get('sort_by', 'run_id')
     order = request.args.get('order', 'desc')
     limit = request.args.get('limit', 10, type=int)
-    
-    valid_sort_fields = [
-        'id', 'run_id', 'dataset', 'model', 'status',
-        'learning_rate', 'batch_size', 'num_epochs',
-        'ap', 'ap50', 'ap75', 'aps', 'apm', 'apl',
-        'total_loss', 'loss_cls', 'loss_box_reg', 'loss_rpn_cls', 'loss_rpn_loc' 'mask_loss', 'iterations'
-    ]
-
-    if sort_by not in valid_sort_fields:
+
+    sort_name_id = None if sort_by in COMPARE_FIELDS else find_metric_name_id(sort_by)
+    if sort_by not in COMPARE_FIELDS and sort_name_id is None:
         logging.error("Invalid sort_by field.")
         return jsonify({"error": "Invalid sort_by field."}), 400
+
+    export_format = negotiate_format(request)
+    if export_format not in EXPORT_FORMATS: 
+        logging.error("Invalid format requested.")
+        return jsonify({"error": f"Invalid format: {export_format}."}), 400
     
     query = Experiment.query
     
@@ -302,93 +1202,369 @@ def compare_experiments():
         except ValueError:
             logging.error("Invalid status value.")
             return jsonify({"error": "Invalid status value."}), 400
-    
+    try: 
+        query = filter_metric_ranges(query)
+    except ValueError as e: 
+        logging.error(f"Invalid query parameter: {str(e)}")
+        return jsonify({"error": f"Invalid query parameter: {str(e)}"}), 400
+
+    fields = COMPARE_FIELDS
+    columns = export_columns(COMPARE_FIELDS)
+    if sort_name_id is not None:
+        query = query.join(RunMetric, (RunMetric.experiment_id == Experiment.id) & (RunMetric.name_id == sort_name_id))
+        fields = (*COMPARE_FIELDS, sort_by)
+        columns.append(RunMetric.value)
+
+    sort_column = getattr(Experiment, sort_by) if sort_name_id is None else RunMetric.value
     if order == 'asc': 
-        query = query.order_by(getattr(Experiment, sort_by).asc())
+        query = query.order_by(sort_column.asc())
     else:
-        query = query.order_by(getattr(Experiment, sort_by).desc())
+        query = query.order_by(sort_column.desc())
 
     if limit: 
         query = query.limit(limit)
         
-    experiments = query.all()
-    result = []
-    for exp in experiments: 
-        result.append({
-            "id": exp.id,
-            "run_id": exp.run_id,
-            "dataset": exp.dataset,
-            "model": exp.model,
-            "status": exp.status.value,
-            "learning_rate": exp.learning_rate,
-            "batch_size": exp.batch_size,
-            "num_epochs": exp.num_epochs,
-            "ap": exp.ap,
-            "ap50": exp.ap50,
-            "ap75": exp.ap75,
-            "aps": exp.aps,
-            "apm": exp.apm,
-            "apl": exp.apl,
-            "total_loss": exp.total_loss,
-            "loss_cls": exp.loss_cls,
-            "loss_box_reg": exp.loss_box_reg,
-            "loss_rpn_cls": exp.loss_rpn_cls,
-            "loss_rpn_loc": exp.loss_rpn_loc,
-            "mask_loss": exp.mask_loss,
-            "iterations": exp.iterations
-        })
+    rows = query.with_entities(*columns).all()
     logging.info("Compared experiments.")
-    return jsonify(result), 200
+    if export_format != 'json': 
+        table_columns = [Experiment.__table__.c[field] for field in COMPARE_FIELDS]
+        if sort_name_id is not None:
+            table_columns.append(RunMetric.__table__.c.value)
+        return export_response(rows, fields, export_format, table_columns)
+    return jsonify([dict(zip(fields, row)) for row in rows]), 200
+
+# Numeric fields that can be analysed as hyperparameter or target
+ANALYSIS_FIELDS = ('learning_rate', 'batch_size', 'num_epochs', 'iterations', *METRIC_FIELDS)
+MAX_ANALYSIS_BINS = 100
+
+#Analysis endpoint: how the hyperparameters relate to a target metric across all runs.
+#The columns are loaded in one query and analysed as NumPy arrays (src/analysis.py).
+# Query parameters: 
+#   target: metric to explain (default ap)
+#   params: comma separated hyperparameters (default learning_rate,batch_size)
+#   bins: number of bins of the marginal effects (default 10)
+#   status, model, dataset, started_after, started_before: only analyse matching experiments
+@api.route('/experiments/analysis', methods = ['GET'])
+def analyse_experiments():
+    target = request.args.get('target', 'ap')
+    params = request.args.get('params')
+    params = params.split(',') if params else ['learning_rate', 'batch_size']
+    bins = request.args.get('bins', 10, type=int)
+    invalid = [field for field in (target, *params) if field not in ANALYSIS_FIELDS]
+    if invalid: 
+        logging.error("Invalid analysis fields requested.")
+        return jsonify({"error": f"Invalid fields: {', '.join(invalid)}."}), 400
+    if not 1 <= bins <= MAX_ANALYSIS_BINS: 
+        return jsonify({"error": f"bins must be between 1 and {MAX_ANALYSIS_BINS}."}), 400
+
+    fields = list(dict.fromkeys((*params, target)))
+    query = db.session.query(
+        Experiment.run_id, func.coalesce(Experiment.model, ''), func.coalesce(Experiment.dataset, ''),
+        *[getattr(Experiment, field) for field in fields]
+    )
+    try: 
+        query = filter_experiments(query)
+    except ValueError as e: 
+        logging.error(f"Invalid query parameter: {str(e)}")
+        return jsonify({"error": f"Invalid query parameter: {str(e)}"}), 400
+
+    # Fetch the plain tuples of the DBAPI cursor, none of the columns needs type
+    # processing, and transpose them into one array per column (missing values become NaN)
+    result = db.session.connection().execute(query.statement)
+    rows = result.cursor.fetchall()
+    result.close()
+    columns = list(zip(*rows)) or [()] * (3 + len(fields))
+    run_ids, models, datasets = (np.array(column, dtype=str) for column in columns[:3])
+    values = {field: np.array(column, dtype=np.float64) for field, column in zip(fields, columns[3:])}
+
+    analysis_result = {
+        "target": target,
+        "params": params,
+        "runs": len(run_ids),
+        "correlations": analysis.correlations(values),
+        "marginals": {param: analysis.binned_effect(values[param], values[target], bins) for param in params},
+        "groups": analysis.group_stats(
+            {"model": models, "dataset": datasets}, values[target], {param: values[param] for param in params},
+            run_ids, maximize='loss' not in target
+        ),
+    }
+    logging.info(f"Analysed {len(run_ids)} experiments.")
+    return jsonify(analysis_result), 200
 
 #Live Logging for Output 
-logs = {}
+# Maximum size of one GET logs response
+LOG_READ_LIMIT = 4 * 1024 * 1024
+# Event stream timing (seconds, milliseconds for the client reconnect delay)
+STREAM_POLL_INTERVAL = 0.5
+STREAM_HEARTBEAT_INTERVAL = 15
+STREAM_RETRY_MS = 2000
+
+# New metric points of a run for the event stream: the points of every metric
+# after the last step sent of that metric (:steps, a JSON object by name id)
+# or else after :step. The metrics of the run are found with one seek per
+# metric on the primary key (a loose index scan), and the points with one
+# range per metric, so a poll does not read the points that were sent already.
+STREAM_POINTS = text("""
+    WITH RECURSIVE names(name_id) AS (
+        SELECT MIN(name_id) FROM metric_point WHERE experiment_id = :experiment_id
+        UNION ALL
+        SELECT (SELECT MIN(name_id) FROM metric_point WHERE experiment_id = :experiment_id AND name_id > names.name_id)
+        FROM names WHERE names.name_id IS NOT NULL
+    ),
+    sent(name_id, step) AS (
+        SELECT name_id, COALESCE((SELECT value FROM json_each(:steps) WHERE key = CAST(name_id AS TEXT)), :step)
+        FROM names WHERE name_id IS NOT NULL
+    )
+    SELECT metric_name.name, point.name_id, point.step, point.value
+    FROM sent
+    CROSS JOIN metric_point AS point ON point.experiment_id = :experiment_id AND point.name_id = sent.name_id
+        AND point.step > sent.step
+    JOIN metric_name ON metric_name.id = point.name_id
+    ORDER BY point.step
+""")
+
+# Event id of the stream: "<log offset>:<step>[;<name id>=<step>,...]", the
+# highest step sent and the metrics whose last step sent is below it
+def stream_event_id(log_offset, step, steps):
+    last_step = max([step, *steps.values()])
+    behind = ",".join(f"{name_id}={name_step}" for name_id, name_step in steps.items() if name_step < last_step)
+    return f"{log_offset}:{last_step}" + (f";{behind}" if behind else "")
 
-@app.route('/experiments/<string:run_id>/logs', methods = ['POST'])
+# (log offset, step, {name id: step}) of an event id, raises ValueError
+def parse_stream_event_id(event_id):
+    position, _, behind = event_id.partition(';')
+    log_offset, step = (int(part) for part in position.split(':'))
+    steps = {}
+    for entry in filter(None, behind.split(',')):
+        name_id, name_step = entry.split('=')
+        steps[int(name_id)] = int(name_step)
+    return log_offset, step, steps
+
+@api.route('/experiments/<string:run_id>/logs', methods = ['POST'])
 def get_experiment_logs(run_id): 
-    #Get logs from workstation and save them temporarily
+    #Get logs from workstation and save them
     data = request.json
-    log_entry = data.get('log')
-    if not log_entry: 
+    if not isinstance(data, dict): 
+        return jsonify({"error": "No log entry provided."}), 400
+    # A single entry as {"log": ...} or a batch as {"logs": [...]}
+    log_entries = data.get('logs') or ([data['log']] if data.get('log') else [])
+    if not log_entries: 
         return jsonify({"error": "No log entry provided."}), 400
+    if not isinstance(log_entries, list) or not all(isinstance(entry, str) for entry in log_entries): 
+        logging.error(f"Invalid log entries for experiment {run_id}.")
+        return jsonify({"error": "Log entries must be strings, logs a list of them."}), 400
     
-    if run_id not in logs: 
-        logs[run_id] = []
-    logs[run_id].append(log_entry)
+    offset = logs.append(run_id, log_entries)
     
-    return jsonify({"message": "Log received successfully."}), 200
+    return jsonify({"message": "Log received successfully.", "offset": offset}), 200
 
-@app.route('/experiments/<string:run_id>/logs', methods = ['GET'])
+# Log lines from byte offset since on (default 0), the X-Log-Offset header holds the offset to continue from
+@api.route('/experiments/<string:run_id>/logs', methods = ['GET'])
 def stream_logs(run_id):
+    since = request.args.get('since', 0, type=int)
+    limit = request.args.get('limit', LOG_READ_LIMIT, type=int)
+    data, offset = logs.read(run_id, since, max(1, min(limit, LOG_READ_LIMIT)))
+    response = Response(data, mimetype='text/plain')
+    response.headers['X-Log-Offset'] = str(offset)
+    return response
+
+# Server-Sent Events stream of new log lines and metric points of a run
+# Events: 'log' (one data line per log line), 'metric' (JSON list of {name, step, value}),
+# 'status' (JSON {status, iterations}) and 'end' once the run is no longer running.
+# The event id (see stream_event_id) can be sent back as Last-Event-ID, or the
+# since and step query parameters, to resume without duplicates.
+@api.route('/experiments/<string:run_id>/stream', methods = ['GET'])
+def stream_experiment(run_id):
+    experiment = Experiment.query.filter_by(run_id = run_id).first()
+    if experiment is None: 
+        logging.warning(f"Experiment {run_id} not found.")
+        return jsonify({"error": "Experiment not found."}), 404
+    experiment_id = experiment.id
+    log_offset = request.args.get('since', 0, type=int)
+    # By default only metric points after the latest step are sent
+    step = request.args.get('step', type=int)
+    if step is None: 
+        step = db.session.query(func.max(MetricPoint.step)).filter(MetricPoint.experiment_id == experiment_id).scalar()
+        step = -1 if step is None else step
+    # Last step sent per metric name id
+    steps = {}
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id: 
+        try: 
+            log_offset, step, steps = parse_stream_event_id(last_event_id)
+        except ValueError: 
+            return jsonify({"error": "Invalid Last-Event-ID."}), 400
+    db.session.rollback()
+
     def generate():
-        if run_id in logs:
-            for log in logs[run_id]:
-                yield log + '\n'
-    
-    return Response(generate(), mimetype='text/plain')
+        nonlocal log_offset
+        version = None
+        status = None
+        last_event = time.monotonic()
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        while True: 
+            events = []
+            data, new_offset = logs.read(run_id, log_offset, LOG_READ_LIMIT)
+            if data: 
+                log_offset = new_offset
+                lines = data.decode('utf-8', errors='replace').splitlines()
+                events.append("event: log\n" + "".join(f"data: {line}\n" for line in lines))
+
+            # The row version changes with every update, only then look for new metric points
+            row = db.session.query(Experiment.version, Experiment.status, Experiment.iterations).filter_by(id = experiment_id).first()
+            if row is None: 
+                db.session.rollback()
+                yield "event: end\ndata: deleted\n\n"
+                return
+            if row.version != version: 
+                version = row.version
+                rows = db.session.execute(STREAM_POINTS, {
+                    "experiment_id": experiment_id, "step": step, "steps": json.dumps(steps)
+                })
+                points = []
+                for name, name_id, point_step, value in rows: 
+                    points.append({"name": name, "step": point_step, "value": value})
+                    steps[name_id] = point_step
+                if points: 
+                    events.append(f"event: metric\ndata: {json.dumps(points)}\n")
+                if row.status != status: 
+                    status = row.status
+                    events.append(f"event: status\ndata: {json.dumps({'status': status.value, 'iterations': row.iterations})}\n")
+            # Release the read transaction so the next poll sees new commits
+            db.session.rollback()
+
+            if events: 
+                event_id = f"id: {stream_event_id(log_offset, step, steps)}\n"
+                for event in events: 
+                    yield event + event_id + "\n"
+                last_event = time.monotonic()
+            elif status != StatusEnum.RUNNING: 
+                yield "event: end\ndata: finished\n\n"
+                return
+            elif time.monotonic() - last_event > STREAM_HEARTBEAT_INTERVAL: 
+                yield ": heartbeat\n\n"
+                last_event = time.monotonic()
+            # Wake up as soon as new log lines arrive, metrics are polled
+            logs.wait(run_id, log_offset, STREAM_POLL_INTERVAL)
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 #Upload endpoints 
-@app.route('/experiments/parse-log', methods=['POST'])
+#Parse results by log_hash (sha256 of the log). Streamlit reruns the upload page
+#on every interaction, so a log that was parsed before is answered from here
+#without uploading and parsing it again. The curves are kept for upload-run,
+#which may be handled by another worker process than the parse.
+#Cache the result and curves of a parsed log, returns the parsed data with its log_hash
+def cache_parse(parser):
+    parsed_data = dict(parser.result(), log_hash=parser.log_hash)
+    try:
+        if not parse_cache.put(parser.log_hash, parsed_data, parser.history()):
+            logging.warning(f"Curves of log {parser.log_hash} are too large for the parse cache.")
+    except OSError as e:
+        logging.error(f"Could not cache the parse of log {parser.log_hash}: {str(e)}")
+    return parsed_data
+
+def get_cached_parse(log_hash):
+    return parse_cache.get(log_hash)
+
+@api.route('/experiments/parse-log/<string:log_hash>', methods = ['GET'])
+def get_parse_log(log_hash):
+    cached = get_cached_parse(log_hash)
+    if cached is None:
+        return jsonify({"error": "Log not parsed, upload it."}), 404
+    return jsonify(cached[0]), 200
+
+@api.route('/experiments/parse-log', methods=['POST'])
 def parse_log():
     file = request.files.get('file')
     if not file:
         logging.error("No file provided for parsing.")
         return jsonify({"error": "No file provided."}), 400
 
-    try:
-        content = file.read().decode('utf-8')
+    #A client that sends the log_hash of a cached log gets the cached result
+    cached = get_cached_parse(request.form.get('log_hash', ''))
+    if cached is not None:
+        return jsonify(cached[0]), 200
 
-        parsed_data = parse_log_content(content)
+    try:
+        #Parse the upload block by block, it is never decoded or held in memory as a whole
+        parser = LogParser(history=True, hash=True)
+        parse_log_file(file.stream, parser=parser)
+        parsed_data = cache_parse(parser)
 
         logging.info("Log parsed successfully.")
         return jsonify(parsed_data), 200
-    except UnicodeDecodeError:
-        logging.error("File could not be decoded. Ensure it's a valid text file.")
-        return jsonify({"error": "File could not be decoded. Ensure it's a valid text file."}), 400
     except Exception as e:
         logging.error(f"Error parsing log file: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-@app.route('/experiments/upload-run', methods = ['POST'])
+#Resumable chunked uploads, the log is parsed while the chunks arrive:
+#  POST /experiments/uploads starts an upload ({"filename", "size"} optional)
+#  PUT /experiments/uploads/<upload_id>?offset=n appends the body at byte offset n
+#  GET /experiments/uploads/<upload_id> returns the offset to resume from
+#  POST /experiments/uploads/<upload_id>/complete returns the same data as parse-log
+#Check GET /experiments/parse-log/<log_hash> first, a cached log does not have to be uploaded.
+
+@api.route('/experiments/uploads', methods = ['POST'])
+def create_upload():
+    data = request.get_json(silent=True) or {}
+    size = data.get('size')
+    if size is not None and (not isinstance(size, int) or size < 0):
+        return jsonify({"error": "size must be a non-negative integer."}), 400
+    upload = uploads.create(data.get('filename'), size)
+    logging.info(f"Upload {upload['upload_id']} started.")
+    return jsonify(upload), 201, {'Location': f"/experiments/uploads/{upload['upload_id']}"}
+
+@api.route('/experiments/uploads/<string:upload_id>', methods = ['GET'])
+def get_upload(upload_id):
+    try:
+        return jsonify(uploads.info(upload_id)), 200
+    except KeyError:
+        return jsonify({"error": "Upload not found."}), 404
+
+@api.route('/experiments/uploads/<string:upload_id>', methods = ['PUT'])
+def append_upload(upload_id):
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({"error": "offset is required."}), 400
+    if request.content_length is None:
+        return jsonify({"error": "Content-Length is required."}), 411
+    if request.content_length > current_app.config['UPLOAD_CHUNK_BYTES']:
+        return jsonify({"error": f"Chunks are limited to {current_app.config['UPLOAD_CHUNK_BYTES']} bytes."}), 413
+    try:
+        offset = uploads.append(upload_id, offset, request.stream)
+        return jsonify({"upload_id": upload_id, "offset": offset}), 200
+    except KeyError:
+        return jsonify({"error": "Upload not found."}), 404
+    except OffsetMismatch as e:
+        #The client continues from the offset the upload is at
+        return jsonify({"error": str(e), "offset": e.offset}), 409
+
+@api.route('/experiments/uploads/<string:upload_id>/complete', methods = ['POST'])
+def complete_upload(upload_id):
+    try:
+        parser = uploads.complete(upload_id)
+    except KeyError:
+        return jsonify({"error": "Upload not found."}), 404
+    except OffsetMismatch as e:
+        return jsonify({"error": f"Upload is incomplete at offset {e.offset}.", "offset": e.offset}), 409
+    parsed_data = cache_parse(parser)
+    logging.info(f"Upload {upload_id} completed and parsed.")
+    return jsonify(parsed_data), 200
+
+@api.route('/experiments/uploads/<string:upload_id>', methods = ['DELETE'])
+def delete_upload(upload_id):
+    try:
+        uploads.delete(upload_id)
+    except KeyError:
+        return jsonify({"error": "Upload not found."}), 404
+    return jsonify({"message": "Upload deleted."}), 200
+
+@api.route('/experiments/upload-run', methods = ['POST'])
+@serialized
 def create_run(): 
     data = request.json
     if not data:
@@ -400,6 +1576,16 @@ def create_run():
         logging.error("Run ID is required.")
         return jsonify({"error": "Run ID is required."}), 400
 
+    #Curves of the log returned by parse-log, stored with the run
+    history = None
+    log_hash = data.get('log_hash')
+    if log_hash:
+        cached = get_cached_parse(log_hash)
+        if cached is None:
+            logging.error(f"Unknown log_hash {log_hash}.")
+            return jsonify({"error": "Unknown log_hash, parse the log again."}), 400
+        history = cached[1]
+
     try: 
         new_experiment = Experiment(
             run_id=run_id,
@@ -420,22 +1606,249 @@ def create_run():
             loss_rpn_cls=data.get('loss_rpn_cls'),
             loss_rpn_loc=data.get('loss_rpn_loc'),
             iterations=data.get('iterations'),
-            mask_loss=data.get('mask_loss')
+            mask_loss=data.get('mask_loss'),
+            log_hash=log_hash
         )
+        params = parse_params(data)
+        metrics = parse_metrics(data.get('metrics'))
         db.session.add(new_experiment)
+        if history or data.get('params') or metrics:
+            db.session.flush()
+            insert_history(new_experiment, history)
+            set_params(new_experiment, params)
+            set_metric_values({new_experiment: metrics})
         db.session.commit()
         
         logging.info(f"Experiment {data['run_id']} created successfully.")
         return jsonify({"message": "Experiment created successfully!"}), 201
+    except IntegrityError as e:
+        db.session.rollback()
+        if is_duplicate_run(e):
+            logging.warning(f"Experiment {run_id} already exists.")
+            return jsonify({"error": "Experiment already exists."}), 409
+        if is_duplicate_log(e):
+            existing = db.session.query(Experiment.run_id).filter_by(log_hash = log_hash).scalar()
+            logging.warning(f"Log of {run_id} is already stored as run {existing}.")
+            return jsonify({"error": f"Log already stored as run {existing}.", "run_id": existing}), 409
+        logging.error(f"Error creating experiment: {str(e.orig)}")
+        return jsonify({"error": str(e.orig)}), 400
     except Exception as e:
+        db.session.rollback()
         logging.error(f"Error creating experiment: {str(e)}")
         return jsonify({"error": str(e)}), 400
 
-@app.route('/')
+@api.route('/')
 def hello():
     return "Welcome to MiniML - The Machine Learning Experiment Tracker!"
 
+#Migration of existing databases
+def upgrade_database(rename_duplicates = False):
+    # The unique index on run_id can only be created once run_ids are unique
+    duplicates = db.session.query(Experiment.run_id).group_by(Experiment.run_id).having(func.count() > 1).all() \
+        if db.inspect(db.engine).has_table(Experiment.__tablename__) else []
+    if duplicates and not rename_duplicates:
+        raise click.ClickException(
+            f"Duplicate run_ids {', '.join(run_id for run_id, in duplicates)}. "
+            "Rename them or run 'flask --app main migrate --rename-duplicates'."
+        )
+    # Only id and run_id are touched, the other columns of the models may not exist yet
+    table = Experiment.__table__
+    for run_id, in duplicates:
+        # Keep the oldest run, the others get their id appended
+        for experiment_id, in db.session.execute(select(table.c.id).where(table.c.run_id == run_id).order_by(table.c.id).offset(1)).all():
+            new_run_id = f"{run_id}-{experiment_id}"
+            db.session.execute(table.update().where(table.c.id == experiment_id).values(run_id = new_run_id))
+            logging.info(f"Renamed duplicate experiment {run_id} to {new_run_id}.")
+    db.session.commit()
+
+    for change in upgrade_schema(db.engine, db.metadata):
+        logging.info(f"Migration: {change}.")
+
+@api.cli.command('migrate')
+@click.option('--rename-duplicates', is_flag = True, help = "Append the id to duplicate run_ids instead of aborting.")
+def migrate_command(rename_duplicates):
+    """Upgrade the schema of an existing experiments database in place."""
+    upgrade_database(rename_duplicates)
+    click.echo("Database is up to date.")
+
+#Bulk import of training logs
+@api.cli.command('import-logs')
+@click.argument('paths', nargs = -1, required = True)
+@click.option('--pattern', default = '*.log', show_default = True, help = "File name pattern of the logs in directories and archives.")
+@click.option('--dataset', default = 'unknown_dataset', show_default = True)
+@click.option('--model', default = 'unknown_model', show_default = True)
+@click.option('--workers', type = int, default = None, help = "Number of parser processes, defaults to the number of CPUs.")
+@click.option('--batch-size', type = int, default = 100, show_default = True, help = "Runs written per transaction.")
+@click.option('--history/--no-history', default = True, help = "Also store the loss and AP curves of every run.")
+def import_logs_command(paths, pattern, dataset, model, workers, batch_size, history):
+    """Import training logs from directories, globs or tar archives as completed runs."""
+    upgrade_database()
+    # Logs that were imported or uploaded before are skipped
+    known_hashes = {log_hash for log_hash, in db.session.query(Experiment.log_hash).filter(Experiment.log_hash.isnot(None))}
+    run_ids = {run_id for run_id, in db.session.query(Experiment.run_id)}
+    db.session.commit()
+
+    counts = {"imported": 0, "duplicate": 0, "failed": 0}
+    batch = []
+    start = time.perf_counter()
+    try:
+        for name, parsed, error in parse_logs(find_logs(paths, pattern), workers, history):
+            if error:
+                counts["failed"] += 1
+                logging.error(f"Could not parse log {name}: {error}")
+                continue
+            result, log_hash, log_history = parsed
+            if result['iterations'] is None and not result['ap']:
+                counts["failed"] += 1
+                logging.error(f"Log {name} has no training iterations.")
+                continue
+            if log_hash in known_hashes:
+                counts["duplicate"] += 1
+                continue
+            known_hashes.add(log_hash)
+            run_id = name if name not in run_ids else f"{name}-{log_hash[:8]}"
+            run_ids.add(run_id)
+            batch.append((run_id, result, log_hash, log_history))
+            if len(batch) >= batch_size:
+                import_runs(batch, dataset, model, counts)
+                batch = []
+        import_runs(batch, dataset, model, counts)
+    except FileNotFoundError as e:
+        raise click.ClickException(str(e))
+
+    elapsed = time.perf_counter() - start
+    files = sum(counts.values())
+    click.echo(
+        f"Imported {counts['imported']} runs from {files} logs in {elapsed:.1f}s ({files / max(elapsed, 1e-9):.1f} files/s), "
+        f"{counts['duplicate']} duplicates skipped, {counts['failed']} failed."
+    )
+
+# Write a batch of parsed logs as completed runs in one transaction. When a run
+# collides with one stored meanwhile (same run_id or log), the batch is written
+# run by run and the colliding ones are skipped and counted.
+def import_runs(batch, dataset, model, counts):
+    if not batch:
+        return
+    with serialized_write():
+        try:
+            insert_runs(batch, dataset, model)
+        except IntegrityError:
+            db.session.rollback()
+            for run in batch:
+                try:
+                    insert_runs([run], dataset, model)
+                except IntegrityError as e:
+                    db.session.rollback()
+                    duplicate = is_duplicate_log(e)
+                    counts["duplicate" if duplicate else "failed"] += 1
+                    logging.warning(f"Skipped run {run[0]}: {'log already stored' if duplicate else str(e.orig)}")
+                else:
+                    counts["imported"] += 1
+            return
+        except Exception:
+            db.session.rollback()
+            raise
+    counts["imported"] += len(batch)
+    logging.info(f"Imported {len(batch)} runs.")
+
+def insert_runs(batch, dataset, model):
+    experiments = []
+    for run_id, result, log_hash, log_history in batch:
+        values = {field: value for field, value in result.items() if value is not None and hasattr(Experiment, field)}
+        values.setdefault('learning_rate', 0.0)
+        experiment = Experiment(run_id = run_id, dataset = dataset, model = model, num_epochs = 0,
+                                status = StatusEnum.COMPLETED, log_hash = log_hash, **values)
+        experiments.append((experiment, log_history))
+    db.session.add_all([experiment for experiment, _ in experiments])
+    db.session.flush()
+    for experiment, log_history in experiments:
+        insert_history(experiment, log_history)
+    db.session.commit()
+
+# Application factory, every worker process of the server creates its own app.
+# The configuration comes from the environment, config overrides single values.
+def create_app(config = None):
+    app = Flask(__name__)
+    load_config(app.config)
+    app.config.update(config or {})
+    db.init_app(app)
+    with app.app_context():
+        configure_sqlite(
+            db.engine,
+            journal_mode=app.config['SQLITE_JOURNAL_MODE'],
+            synchronous=app.config['SQLITE_SYNCHRONOUS'],
+            cache_size=app.config['SQLITE_CACHE_SIZE'],
+            busy_timeout=app.config['SQLITE_BUSY_TIMEOUT']
+        )
+        database_path = db.engine.url.database
+
+    # Request metrics (latency, response size, SQL queries per route), scraped from /metrics
+    instrumentation = Instrumentation(directory=app.config['METRICS_DIR'])
+    instrumentation.init_app(app)
+    # Opt-in profiles of sampled, flagged or slow requests with their SQL statements, listed at /profiles
+    profiler = RequestProfiler(
+        app.config['PROFILE_DIR'],
+        sample_rate=app.config['PROFILE_SAMPLE_RATE'],
+        slow_ms=app.config['PROFILE_SLOW_MS'],
+        token=app.config['PROFILE_TOKEN'],
+        max_profiles=app.config['PROFILE_MAX_FILES']
+    )
+    profiler.init_app(app)
+    with app.app_context():
+        instrumentation.watch_engine(db.engine)
+        profiler.watch_engine(db.engine)
+
+    response_cache = ResponseCache(app.config['RESPONSE_CACHE_BYTES'])
+    for name, help_text in (('hits', "Responses served from the cache."), ('misses', "Responses computed for the cache."),
+                            ('evictions', "Responses evicted for space."), ('invalidations', "Responses invalidated by writes.")):
+        instrumentation.add_collector(f"response_cache_{name}_total", 'counter', help_text, lambda name=name: getattr(response_cache, name))
+    instrumentation.add_collector("response_cache_bytes", 'gauge', "Size of the cached responses.", lambda: response_cache.bytes)
+
+    app.extensions['miniml'] = {
+        "instrumentation": instrumentation,
+        "profiler": profiler,
+        "response_cache": response_cache,
+        # Id of the newest change log row applied to the response cache (read at the first request),
+        # and the data_version of the database at that time
+        "data_generation": None,
+        "data_version": None,
+        "data_generation_lock": threading.Lock(),
+        "commit_watcher": CommitWatcher(database_path, busy_timeout=app.config['SQLITE_BUSY_TIMEOUT']),
+        "parse_cache": ParseCache(app.config['PARSE_CACHE_DIR'], max_bytes=app.config['PARSE_CACHE_BYTES'], ttl=app.config['PARSE_CACHE_TTL']),
+        "curve_levels": LRUCache(maxsize=app.config['CURVE_CACHE_BYTES'], getsizeof=lambda levels: levels.nbytes),
+        "curve_levels_lock": threading.Lock(),
+        "metric_name_ids": {},
+        "logs": LogStore(
+            app.config['LOG_DIR'],
+            buffer_lines=app.config['LOG_BUFFER_LINES'],
+            segment_bytes=app.config['LOG_SEGMENT_BYTES'],
+            max_runs=app.config['LOG_MAX_RUNS']
+        ),
+        "uploads": UploadStore(app.config['UPLOAD_DIR'], max_age=app.config['UPLOAD_MAX_AGE']),
+        "live_updates": None,
+    }
+
+    # Write-behind of live updates, the pending ones are written at exit of the process
+    if app.config['LIVE_UPDATE_MAX_STALENESS'] > 0:
+        def write(batch):
+            with app.app_context():
+                write_live_updates(batch)
+        live_updates = WriteBehindBuffer(
+            write, max_staleness=app.config['LIVE_UPDATE_MAX_STALENESS'], max_pending=app.config['LIVE_UPDATE_MAX_PENDING']
+        )
+        app.extensions['miniml']['live_updates'] = live_updates
+        atexit.register(live_updates.close)
+        instrumentation.add_collector("live_updates_pending", 'gauge', "Acknowledged live updates not written yet.", lambda: live_updates.pending)
+        instrumentation.add_collector("live_updates_written_total", 'counter', "Live updates written.", lambda: live_updates.written)
+        instrumentation.add_collector("live_update_flushes_total", 'counter', "Batches of live updates written.", lambda: live_updates.flushes)
+        instrumentation.add_collector("live_update_failures_total", 'counter', "Batches of live updates that failed.", lambda: live_updates.failures)
+        instrumentation.add_collector("live_updates_dropped_total", 'counter', "Live updates dropped after failed retries.", lambda: live_updates.dropped)
+    app.register_blueprint(api)
+    return app
+
+#Development server, see wsgi.py and gunicorn.conf.py for production
 if __name__ == '__main__':
+    app = create_app()
     with app.app_context():
-        db.create_all()
-    app.run(debug=True)
\ No newline at end of file
+        upgrade_database()
+    app.run(debug=os.environ.get('MINIML_DEBUG', '1') == '1')
\ No newline at end of file
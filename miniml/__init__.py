@@ -0,0 +1,14 @@
+"""MiniML client: log metrics and text from a training job without blocking it.
+
+    import miniml
+
+    miniml.init_run("run_42", dataset="coco", model="mask_rcnn",
+                    learning_rate=0.02, batch_size=16, num_epochs=12)
+    for step in range(max_iter):
+        ...
+        miniml.log_metrics({"total_loss": loss}, step=step)
+    miniml.finish()
+"""
+from miniml.client import Run, init_run, log_metrics, log_text, finish
+
+__all__ = ["Run", "init_run", "log_metrics", "log_text", "finish"]
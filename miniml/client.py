@@ -0,0 +1,204 @@
+import atexit
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+
+DEFAULT_BASE_URL = "http://localhost:5000"
+
+logger = logging.getLogger(__name__)
+
+# Class Run to buffer metrics and log lines of one experiment in process and
+# send them to the MiniML server from a background thread.
+#
+# log_metrics and log_text only append to a deque; the flusher thread sends
+# the buffers in batches whenever flush_size items are pending or every
+# flush_interval seconds. Failed requests are retried with exponential backoff.
+# When max_buffer items are pending, on_overflow decides whether new items
+# are dropped ('drop') or the caller waits for the flusher ('block').
+class Run:
+    def __init__(self, run_id, base_url=DEFAULT_BASE_URL, flush_interval=1.0, flush_size=1000,
+                 max_buffer=100000, on_overflow='drop', max_retries=5, backoff=0.5, max_backoff=30.0,
+                 timeout=10.0):
+        if on_overflow not in ('drop', 'block'):
+            raise ValueError("on_overflow must be 'drop' or 'block'.")
+        self.run_id = run_id
+        self.base_url = base_url.rstrip('/')
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_buffer = max_buffer
+        self.on_overflow = on_overflow
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        # Number of items that were dropped because of overflow or failed requests
+        self.dropped = 0
+
+        self._metrics = deque()
+        self._logs = deque()
+        self._step = 0
+        self._sending = False
+        self._closed = False
+        self._stopping = False
+        self._wakeup = threading.Event()
+        self._cond = threading.Condition()
+        self._session = requests.Session()
+        self._thread = threading.Thread(target=self._run, name=f"miniml-{run_id}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log_metrics(self, metrics, step=None):
+        if step is None:
+            step = self._step
+        self._step = step + 1
+        update = dict(metrics)
+        update['step'] = step
+        # The step is the progress of the run shown by the pages
+        update.setdefault('iterations', step)
+        return self._put(self._metrics, update)
+
+    def log_text(self, text):
+        return self._put(self._logs, str(text).rstrip('\n'))
+
+    def _put(self, buffer, item):
+        if self._closed:
+            raise RuntimeError(f"Run {self.run_id} is already finished.")
+        if len(self._metrics) + len(self._logs) >= self.max_buffer:
+            if self.on_overflow == 'drop':
+                self.dropped += 1
+                return False
+            with self._cond:
+                while len(self._metrics) + len(self._logs) >= self.max_buffer and self._thread.is_alive():
+                    self._wakeup.set()
+                    self._cond.wait(0.1)
+        buffer.append(item)
+        if len(buffer) >= self.flush_size:
+            self._wakeup.set()
+        return True
+
+    # Block until everything logged so far has been sent (or dropped)
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while (self._metrics or self._logs or self._sending) and self._thread.is_alive():
+                self._wakeup.set()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining if remaining is not None else 0.1)
+        return not (self._metrics or self._logs)
+
+    # Stop accepting data, send what is still buffered and stop the flusher thread
+    def close(self, timeout=30.0):
+        if self._closed:
+            return
+        self._closed = True
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+        atexit.unregister(self.close)
+        if self._metrics or self._logs:
+            logger.warning(f"Run {self.run_id}: {len(self._metrics) + len(self._logs)} buffered items were not sent.")
+
+    def finish(self, status='Completed', timeout=30.0):
+        self.close(timeout)
+        self._send('PUT', f"/experiments/{self.run_id}", {"status": status}, 0)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            stopping = self._stopping
+            self._flush()
+            if stopping:
+                break
+
+    def _flush(self):
+        while self._metrics or self._logs:
+            with self._cond:
+                self._sending = True
+            metrics = self._drain(self._metrics)
+            logs = self._drain(self._logs)
+            if metrics:
+                self._send('POST', "/experiments/batch-update", {"run_id": self.run_id, "updates": metrics}, len(metrics))
+            if logs:
+                self._send('POST', f"/experiments/{self.run_id}/logs", {"logs": logs}, len(logs))
+            with self._cond:
+                self._sending = False
+                self._cond.notify_all()
+
+    def _drain(self, buffer):
+        batch = []
+        while buffer and len(batch) < self.flush_size:
+            batch.append(buffer.popleft())
+        return batch
+
+    def _send(self, method, path, payload, count):
+        delay = self.backoff
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._session.request(method, self.base_url + path, json=payload, timeout=self.timeout)
+                if response.status_code < 400:
+                    return True
+                if response.status_code < 500:
+                    # Client errors will not succeed on retry
+                    logger.warning(f"Run {self.run_id}: {method} {path} rejected: {response.text}")
+                    break
+                error = f"HTTP {response.status_code}"
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt < self.max_retries:
+                logger.info(f"Run {self.run_id}: {method} {path} failed ({error}), retrying in {delay:.1f}s.")
+                time.sleep(delay * (1 + random.random() * 0.1))
+                delay = min(delay * 2, self.max_backoff)
+        else:
+            logger.warning(f"Run {self.run_id}: {method} {path} failed after {self.max_retries} retries ({error}).")
+        self.dropped += count
+        return False
+
+# The run used by the module level functions
+_current_run = None
+
+def init_run(run_id, dataset=None, model=None, learning_rate=None, batch_size=None, num_epochs=None,
+             resume=False, base_url=DEFAULT_BASE_URL, **options):
+    global _current_run
+    if not resume:
+        run = {
+            "run_id": run_id,
+            "dataset": dataset,
+            "model": model,
+            "learning_rate": learning_rate,
+            "batch_size": batch_size,
+            "num_epochs": num_epochs
+        }
+        # Fields that are not given get the defaults of the server
+        response = requests.post(f"{base_url.rstrip('/')}/experiments", json={
+            name: value for name, value in run.items() if value is not None
+        }, timeout=options.get('timeout', 10.0))
+        if response.status_code != 201:
+            raise RuntimeError(f"Could not create run {run_id}: {response.text}")
+    if _current_run is not None:
+        _current_run.close()
+    _current_run = Run(run_id, base_url=base_url, **options)
+    return _current_run
+
+def _get_current_run():
+    if _current_run is None:
+        raise RuntimeError("No active run, call miniml.init_run() first.")
+    return _current_run
+
+def log_metrics(metrics, step=None):
+    return _get_current_run().log_metrics(metrics, step)
+
+def log_text(text):
+    return _get_current_run().log_text(text)
+
+def finish(status='Completed'):
+    global _current_run
+    run = _get_current_run()
+    _current_run = None
+    run.finish(status)
@@ -3,8 +3,7 @@ import requests
 import pandas as pd
 from pages.details import run_ids
 from pages.src.displaymetrics import display_metrics
-
-BASE_URL = "http://localhost:5000"
+from pages.src.api import BASE_URL, get_analysis, get_run, get_run_ids
 
 st.set_page_config(page_title="MiniML: Compare", layout="wide")
 st.title("Compare Runs")
@@ -12,26 +11,14 @@ st.title("Compare Runs")
 col1, col2 = st.columns(2)
 
 def get_run_details(run_id):
-    info_response = requests.get(f"{BASE_URL}/experiments/{run_id}/info")
-    status_response = requests.get(f"{BASE_URL}/experiments/{run_id}/status")
-    metrics_response = requests.get(f"{BASE_URL}/experiments/{run_id}/metrics")
-
-    if info_response.status_code == 200 and status_response.status_code == 200 and metrics_response.status_code == 200:
-        return {
-            "info": info_response.json(),
-            "status": status_response.json(),
-            "metrics": metrics_response.json()
-        }
-    else:
+    run_details = get_run(run_id)
+    if run_details is None:
         st.error(f"Failed to load data for Run ID: {run_id}")
-        return None
+    return run_details
 
 # Get all available run IDs
-response = requests.get(f"{BASE_URL}/experiments")
-if response.status_code == 200:
-    experiments = response.json()
-    run_ids = [exp["run_id"] for exp in experiments]
-else:
+run_ids = get_run_ids()
+if run_ids is None:
     st.error("Failed to load run IDs")
     st.stop()
     
@@ -44,9 +31,8 @@ with col1:
     if selected_run_id_1:
         run_1_details = get_run_details(selected_run_id_1)
         if run_1_details:
-            info_details_1 = run_1_details["info"]
-            status_details_1 = run_1_details["status"]
-            metrics_details_1 = run_1_details["metrics"]
+            # One response holds the information, the status and the metrics of the run
+            info_details_1 = status_details_1 = metrics_details_1 = run_1_details
 
             st.write("#### Run Information")
             st.dataframe({
@@ -74,9 +60,8 @@ with col2:
     if selected_run_id_2:
         run_2_details = get_run_details(selected_run_id_2)
         if run_2_details:
-            info_details_2 = run_2_details["info"]
-            status_details_2 = run_2_details["status"]
-            metrics_details_2 = run_2_details["metrics"]
+            # One response holds the information, the status and the metrics of the run
+            info_details_2 = status_details_2 = metrics_details_2 = run_2_details
 
             st.write("#### Run Information")
             st.dataframe({
@@ -151,4 +136,39 @@ if run_1_details and run_2_details:
         })
         st.write("#### Loss Metrics Comparison")
         st.bar_chart(comparison_df.set_index("Metric"), stack=False)
-    
+
+# Hyperparameter sensitivity across all runs
+st.write("### Hyperparameter Sensitivity")
+ANALYSIS_TARGETS = ["ap", "ap50", "ap75", "aps", "apm", "apl", "total_loss", "loss_cls", "loss_box_reg", "loss_rpn_cls", "loss_rpn_loc", "mask_loss"]
+ANALYSIS_PARAMS = ["learning_rate", "batch_size", "num_epochs", "iterations"]
+
+col1, col2, col3 = st.columns(3)
+target = col1.selectbox("Target metric", options=ANALYSIS_TARGETS)
+params = col2.multiselect("Hyperparameters", options=ANALYSIS_PARAMS, default=["learning_rate", "batch_size"])
+bins = col3.slider("Bins", min_value=2, max_value=50, value=10)
+
+analysis = get_analysis(target, params, bins) if params else None
+if params and analysis is None:
+    st.error("Failed to load the analysis")
+elif analysis:
+    st.caption(f"{analysis['runs']} runs, {analysis['correlations']['runs']} with all values")
+
+    st.write("#### Correlations")
+    names = list(dict.fromkeys(params + [target]))
+    pearson_tab, spearman_tab = st.tabs(["Pearson", "Spearman (rank)"])
+    pearson_tab.dataframe(pd.DataFrame(analysis["correlations"]["pearson"]).loc[names, names])
+    spearman_tab.dataframe(pd.DataFrame(analysis["correlations"]["spearman"]).loc[names, names])
+
+    st.write(f"#### Mean {target} per Bin")
+    for param, effect in analysis["marginals"].items():
+        # Bins of continuous parameters are drawn at their center
+        if "values" in effect:
+            positions = effect["values"]
+        else:
+            positions = [(low + high) / 2 for low, high in zip(effect["edges"][:-1], effect["edges"][1:])]
+        st.write(f"**{param}**")
+        st.line_chart(pd.DataFrame({param: positions, f"mean {target}": effect["mean"]}), x=param, y=f"mean {target}")
+
+    st.write(f"#### {target} per Model and Dataset")
+    group_columns = ["model", "dataset", "count", "mean", "std", "min", "max", "best_run_id", *params]
+    st.dataframe(pd.DataFrame(analysis["groups"])[group_columns], hide_index=True)
@@ -2,18 +2,17 @@ import streamlit as st
 import requests
 import pandas as pd
 from pages.src.displaymetrics import display_metrics
-
-BASE_URL = "http://localhost:5000"
+from pages.src.api import BASE_URL, get_history, get_run, get_run_ids
 
 st.set_page_config(page_title="MiniML: Details", layout="wide")
 st.title("Details of a Run")
 
+# Points per curve in the charts
+CURVE_POINTS = 1000
+
 # Get Run IDs
-response = requests.get(f"{BASE_URL}/experiments")
-if response.status_code == 200: 
-    experiments = response.json()
-    run_ids = [exp["run_id"] for exp in experiments]
-else:
+run_ids = get_run_ids()
+if run_ids is None:
     st.error("Failed to load run IDs")
     st.stop()
 
@@ -21,38 +20,61 @@ else:
 selected_run_id = st.selectbox("Select a Run ID", options=run_ids, key="run_id")
 
 if selected_run_id:
-    run_response_metrics = requests.get(f"{BASE_URL}/experiments/{selected_run_id}/metrics")
-    run_response_status = requests.get(f"{BASE_URL}/experiments/{selected_run_id}/status")
-    run_response_info = requests.get(f"{BASE_URL}/experiments/{selected_run_id}/info")
+    run_details = get_run(selected_run_id)
     
-    if run_response_status.status_code == 200 and run_response_info.status_code == 200:
-        status_details = run_response_status.json()
-        info_details = run_response_info.json()
-        
+    if run_details: 
         st.write(f"### Details for Run ID: {selected_run_id}")
 
         # Display Run Information
         st.write("#### Run Information")
         st.dataframe({
-            "Dataset": info_details["dataset"],
-            "Model": info_details["model"], 
-            "Status": status_details["status"],
-            "Started At": status_details["started_at"]
+            "Dataset": run_details["dataset"],
+            "Model": run_details["model"], 
+            "Status": run_details["status"],
+            "Started At": run_details["started_at"]
         })
         
         # Display Hyperparameters
         st.write("#### Hyperparameters")
         hyper_df = pd.DataFrame([{
-            "Learning Rate": info_details["learning_rate"],
-            "Batch Size": info_details["batch_size"],
-            "Number of Epochs": info_details["num_epochs"]
+            "Learning Rate": run_details["learning_rate"],
+            "Batch Size": run_details["batch_size"],
+            "Number of Epochs": run_details["num_epochs"]
         }])
         st.dataframe(hyper_df)
-
-    if run_response_metrics.status_code == 200: 
-        metric_details = run_response_metrics.json()    
+        if run_details.get("params"):
+            st.dataframe(pd.DataFrame([run_details["params"]]))
 
         # Display Metrics
-        display_metrics(metric_details, key_prefix="details")
+        display_metrics(run_details, key_prefix="details")
+        if run_details.get("metrics"):
+            st.write("#### Other Metrics")
+            st.dataframe(pd.DataFrame([run_details["metrics"]]))
+
+        # Display Curves, downsampled by the backend to about one point per pixel
+        curves = get_history(selected_run_id, max_points=CURVE_POINTS)
+        if curves:
+            st.write("#### Curves")
+            steps = [step for curve in curves.values() for step in curve["steps"]]
+            first_step, last_step = min(steps), max(steps)
+            col1, col2 = st.columns([3, 1])
+            with col2:
+                method = st.radio("Downsampling", ["lttb", "minmax"], horizontal=True, key="details_method",
+                                  help="LTTB keeps the shape of the curve, min-max keeps every spike.")
+            with col1:
+                if first_step < last_step:
+                    start, end = st.slider("Steps", first_step, last_step, (first_step, last_step), key="details_steps")
+                else:
+                    start, end = first_step, last_step
+            # Zooming in fetches the window again, so it keeps its full detail
+            curves = get_history(selected_run_id, max_points=CURVE_POINTS, start=start, end=end, method=method)
+            losses = {name: curve for name, curve in (curves or {}).items() if "loss" in name}
+            precisions = {name: curve for name, curve in (curves or {}).items() if name.startswith("ap")}
+            for title, group in (("Losses", losses), ("Average Precision", precisions)):
+                if group:
+                    st.write(f"##### {title}")
+                    st.line_chart(pd.DataFrame({
+                        name: pd.Series(curve["values"], index=curve["steps"]) for name, curve in group.items()
+                    }))
     else:
-        st.error("Failed to load Metrics.")
+        st.error(f"Failed to load data for Run ID: {selected_run_id}")
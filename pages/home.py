@@ -1,15 +1,14 @@
 import streamlit as st
 import requests
 import pandas as pd
+from pages.src.api import get_experiments_frame
 
-BASE_URL = "http://localhost:5000"
 st.set_page_config(page_title="MiniML: Home", layout="wide")
 st.title("MiniML: A Minimalistic ML Experiment Tracking Tool")
 
 st.write("### Overview of all Experiments")
-response = requests.get(f"{BASE_URL}/experiments")
-if response.status_code == 200: 
-    experiments = pd.DataFrame(response.json())
+experiments = get_experiments_frame()
+if experiments is not None: 
     columns_order = [
         "id",
         "run_id", 
@@ -2,33 +2,51 @@ import streamlit as st
 import requests
 import pandas as pd
 import time 
+import json
+from collections import deque
+from pages.src.api import get_run_ids, stream_events
 
 st.set_page_config(page_title="MiniML: Running", layout="wide")
 st.title("Currently Running")
 
-BASE_URL = "http://localhost:5000"
-
 # Get Run IDs
-response = requests.get(f"{BASE_URL}/experiments")
-if response.status_code == 200: 
-    experiments = response.json()
-    run_ids = [exp["run_id"] for exp in experiments]
-else:
+run_ids = get_run_ids()
+if run_ids is None:
     st.error("Failed to load run IDs")
     st.stop()
     
 selected_run_id = st.selectbox("Select a Run ID", options=run_ids, key="run_id")
 log_area = st.empty()
 
+# Number of log lines shown
+MAX_LOG_LINES = 1000
+
 if selected_run_id:
     st.write('### Logs for Run ID:', selected_run_id)
-    while True: 
+    status_area = st.empty()
+    st.write('### Metrics')
+    metrics_chart = st.line_chart(pd.DataFrame({"step": [], "value": [], "name": []}), x="step", y="value", color="name")
+    
+    # The backend pushes only new log lines and metric points, they are appended to what is shown
+    log_lines = deque(maxlen=MAX_LOG_LINES)
+    last_event_id = None
+    finished = False
+    while not finished: 
         try: 
-            response = requests.get(f'{BASE_URL}/experiments/{selected_run_id}/logs')
-            if response.status_code == 200:
-                log_area.text(response.text)
-            else:
-                st.error(f"Failed to load logs for Run ID: {selected_run_id}")
+            for event, data, event_id in stream_events(selected_run_id, last_event_id):
+                last_event_id = event_id or last_event_id
+                if event == "log":
+                    log_lines.extend(data.split("\n"))
+                    log_area.text("\n".join(log_lines))
+                elif event == "metric":
+                    metrics_chart.add_rows(pd.DataFrame(json.loads(data)))
+                elif event == "status":
+                    status = json.loads(data)
+                    status_area.write(f"Status: {status['status']} (iteration {status['iterations']})")
+                elif event == "end":
+                    finished = True
         except Exception as e:
-            st.error(f"Error fetching logs: {e}")
-        time.sleep(1)
\ No newline at end of file
+            st.error(f"Error streaming run {selected_run_id}: {e}")
+        if not finished:
+            # Reconnect, Last-Event-ID resumes where the stream stopped
+            time.sleep(2)
\ No newline at end of file
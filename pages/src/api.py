@@ -0,0 +1,233 @@
+import hashlib
+import threading
+import time
+import streamlit as st
+import requests
+import pyarrow as pa
+from cachetools import LRUCache
+
+BASE_URL = "http://localhost:5000"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+# Data access layer of the pages. Streamlit reruns a page on every widget
+# interaction, so all reads go through st.cache_data. Each cached function
+# takes the data generation of the backend as argument: the backend changes it
+# on every write, so a write makes the next rerun fetch fresh data while
+# unchanged data is served from the cache without a round trip.
+GENERATION_TTL = 1 # seconds, bounds the staleness of the cached data
+CACHE_TTL = 600
+MAX_ENTRIES = 256
+UPLOAD_CHUNK_BYTES = 8 * 1024 * 1024
+UPLOAD_RETRIES = 3
+
+class BackendError(Exception):
+    pass
+
+# One HTTP session (keep-alive connections) shared by all pages and users
+@st.cache_resource
+def get_session():
+    return requests.Session()
+
+def _get(path, **kwargs):
+    response = get_session().get(f"{BASE_URL}{path}", **kwargs)
+    if response.status_code not in (200, 304):
+        raise BackendError(f"GET {path} failed: {response.text}")
+    return response
+
+@st.cache_data(ttl=GENERATION_TTL, show_spinner=False)
+def get_generation():
+    try:
+        return _get("/generation").json()["generation"]
+    except (requests.RequestException, BackendError):
+        return None
+
+# ETags of the most recently loaded runs, shared by all sessions
+@st.cache_resource
+def _run_etags():
+    return LRUCache(maxsize=MAX_ENTRIES)
+
+# The sessions run in threads, the LRU order must not be changed by two at once
+_run_etags_lock = threading.Lock()
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _get_run(run_id, generation):
+    # A new generation may not touch this run, so revalidate with the ETag first
+    etags = _run_etags()
+    with _run_etags_lock:
+        cached = etags.get(run_id)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    response = _get(f"/experiments/{run_id}", headers=headers)
+    if response.status_code == 304 and cached:
+        return cached[1]
+    run = response.json()
+    with _run_etags_lock:
+        etags[run_id] = (response.headers.get("ETag"), run)
+    return run
+
+# Get all fields of one run. Returns None if the request fails.
+def get_run(run_id):
+    try:
+        return _get_run(run_id, get_generation())
+    except (requests.RequestException, BackendError):
+        return None
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _get_experiments(generation, params):
+    params = dict(params)
+    experiments = []
+    while True:
+        response = _get("/experiments", params=params)
+        experiments.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return experiments
+        params["cursor"] = cursor
+
+def _params(fields, filters):
+    params = {key: value for key, value in filters.items() if value is not None}
+    if fields:
+        params["fields"] = ",".join(fields)
+    return tuple(sorted(params.items()))
+
+# Get the experiments as a list of dicts, following the pagination cursor of
+# GET /experiments. fields restricts the returned fields (e.g. ["run_id"] for
+# a dropdown), filters are passed as query parameters (status, model, ...).
+# Returns None if a request fails.
+def get_experiments(fields=None, **filters):
+    try:
+        return _get_experiments(get_generation(), _params(fields, filters))
+    except (requests.RequestException, BackendError):
+        return None
+
+# Get all run IDs for the dropdowns
+def get_run_ids():
+    experiments = get_experiments(fields=["run_id"])
+    if experiments is None:
+        return None
+    return [exp["run_id"] for exp in experiments]
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _get_experiments_frame(generation, params):
+    response = _get("/experiments", params=dict(params), headers={"Accept": ARROW_MIMETYPE})
+    return pa.ipc.open_stream(response.content).read_pandas()
+
+# Get the experiments as a DataFrame, streamed by the backend as Arrow record
+# batches so that no JSON has to be decoded row by row. Returns None if the
+# request fails.
+def get_experiments_frame(fields=None, **filters):
+    try:
+        return _get_experiments_frame(get_generation(), _params(fields, filters))
+    except (requests.RequestException, BackendError):
+        return None
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _get_analysis(generation, params):
+    return _get("/experiments/analysis", params=dict(params)).json()
+
+# Get the sensitivity of a target metric to the hyperparameters across all
+# runs: correlations, binned marginal effects and statistics per model and
+# dataset. filters are passed as query parameters. Returns None if the request fails.
+def get_analysis(target="ap", params=("learning_rate", "batch_size"), bins=10, **filters):
+    try:
+        query = dict(filters, target=target, params=",".join(params), bins=bins)
+        return _get_analysis(get_generation(), _params(None, query))
+    except (requests.RequestException, BackendError):
+        return None
+
+@st.cache_data(ttl=CACHE_TTL, max_entries=MAX_ENTRIES, show_spinner=False)
+def _get_history(generation, run_id, params):
+    return _get(f"/experiments/{run_id}/history", params=list(params)).json()["metrics"]
+
+# Get the metric curves of a run as {name: {"steps": [...], "values": [...]}},
+# downsampled by the backend to at most max_points points per curve in the
+# step window start..end. Returns None if the request fails.
+def get_history(run_id, metrics=(), max_points=1000, start=None, end=None, method="lttb"):
+    try:
+        query = _params(None, dict(max_points=max_points, start=start, end=end, method=method))
+        return _get_history(get_generation(), run_id, query + tuple(("metric", name) for name in metrics))
+    except (requests.RequestException, BackendError):
+        return None
+
+# Follow the Server-Sent Events stream of a run, yields (event, data, id)
+# tuples as they arrive. Not cached, the stream only carries new data.
+def stream_events(run_id, last_event_id=None):
+    headers = {"Accept": "text/event-stream"}
+    if last_event_id:
+        headers["Last-Event-ID"] = last_event_id
+    with get_session().get(f"{BASE_URL}/experiments/{run_id}/stream", headers=headers, stream=True, timeout=(5, 60)) as response:
+        if response.status_code != 200:
+            raise BackendError(f"Stream of run {run_id} failed: {response.text}")
+        event, data, event_id = "message", [], None
+        # chunk_size=None hands over the data as soon as it is received
+        for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+            if not line:
+                if data:
+                    yield event, "\n".join(data), event_id
+                event, data = "message", []
+                continue
+            if line.startswith(":"):
+                continue
+            field, _, value = line.partition(":")
+            value = value[1:] if value.startswith(" ") else value
+            if field == "event":
+                event = value
+            elif field == "data":
+                data.append(value)
+            elif field == "id":
+                event_id = value
+
+def _upload_request(method, path, **kwargs):
+    response = get_session().request(method, f"{BASE_URL}{path}", **kwargs)
+    if response.status_code not in (200, 201, 409):
+        raise BackendError(f"{method} {path} failed: {response.text}")
+    return response
+
+# sha256 of a file object, the key of the parse results on the backend
+def log_sha256(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for block in iter(lambda: file.read(UPLOAD_CHUNK_BYTES), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+# Parsed data of a log the backend parsed recently, None if it has to be uploaded
+def get_parsed_log(log_hash):
+    response = get_session().get(f"{BASE_URL}/experiments/parse-log/{log_hash}")
+    if response.status_code == 404:
+        return None
+    if response.status_code != 200:
+        raise BackendError(f"GET /experiments/parse-log/{log_hash} failed: {response.text}")
+    return response.json()
+
+# Upload a log file object in chunks through the resumable upload endpoints,
+# the backend parses each chunk as it arrives. A failed chunk is retried from
+# the offset the backend reports. progress(sent, size) is called after every
+# chunk. Returns the parsed data like POST /experiments/parse-log. With the
+# log_hash of the file, a log the backend has parsed before is not uploaded.
+def upload_log(file, size, filename=None, progress=None, log_hash=None):
+    if log_hash:
+        parsed_data = get_parsed_log(log_hash)
+        if parsed_data is not None:
+            return parsed_data
+    upload_id = _upload_request("POST", "/experiments/uploads", json={"filename": filename, "size": size}).json()["upload_id"]
+    path = f"/experiments/uploads/{upload_id}"
+    offset = 0
+    retries = 0
+    while offset < size:
+        file.seek(offset)
+        chunk = file.read(UPLOAD_CHUNK_BYTES)
+        try:
+            offset = _upload_request("PUT", path, params={"offset": offset}, data=chunk).json()["offset"]
+            retries = 0
+        except requests.RequestException:
+            if retries >= UPLOAD_RETRIES:
+                raise
+            retries += 1
+            time.sleep(2 ** retries)
+            offset = _upload_request("GET", path).json()["offset"]
+        if progress:
+            progress(offset, size)
+    response = _upload_request("POST", f"{path}/complete")
+    if response.status_code != 200:
+        raise BackendError(f"Upload {upload_id} failed: {response.text}")
+    return response.json()
@@ -1,32 +1,53 @@
-from io import StringIO
 import streamlit as st
 import requests
 import pandas as pd
+from pages.src.api import BASE_URL, BackendError, log_sha256, upload_log
 
 st.set_page_config(page_title="MiniML: Upload Logs", layout="wide")
 st.title("Upload Logs")
 
-BASE_URL = "http://localhost:5000"
+PREVIEW_BYTES = 16 * 1024
 
 st.write("### Upload your Log file to create a new run")
 
 # File Upload
 uploaded_file = st.file_uploader("Choose a file")
 if uploaded_file is not None:
-    # Parse file content
-    string_data = StringIO(uploaded_file.getvalue().decode("utf-8")).read()
-    
-    # Show log content preview
+    # Show only the head and tail of the log, large logs do not fit in a text area
+    size = uploaded_file.size
+    uploaded_file.seek(0)
+    head = uploaded_file.read(PREVIEW_BYTES).decode("utf-8", errors="replace")
     st.write("### Log File Content Preview")
-    st.text_area("Log Preview", string_data, height=200)
+    if size > 2 * PREVIEW_BYTES:
+        uploaded_file.seek(size - PREVIEW_BYTES)
+        tail = uploaded_file.read(PREVIEW_BYTES).decode("utf-8", errors="replace")
+        st.text_area("Log Preview (head)", head, height=200)
+        st.caption(f"... {size - 2 * PREVIEW_BYTES:,} bytes not shown ...")
+        st.text_area("Log Preview (tail)", tail, height=200)
+    else:
+        uploaded_file.seek(0)
+        st.text_area("Log Preview", uploaded_file.read().decode("utf-8", errors="replace"), height=200)
+
+    # The page reruns on every interaction, the hash lets the backend answer
+    # from its parse cache instead of receiving and parsing the log again
+    log_hashes = st.session_state.setdefault("log_hashes", {})
+    if uploaded_file.file_id not in log_hashes:
+        log_hashes[uploaded_file.file_id] = log_sha256(uploaded_file)
+
+    # Upload the log in chunks, the backend parses them while they arrive
+    progress_bar = st.progress(0.0, text="Uploading and parsing log...")
+    try:
+        parsed_data = upload_log(
+            uploaded_file, size, filename=uploaded_file.name, log_hash=log_hashes[uploaded_file.file_id],
+            progress=lambda sent, total: progress_bar.progress(sent / max(total, 1), text=f"Uploaded {sent:,} of {total:,} bytes")
+        )
+        error = None
+    except (requests.RequestException, BackendError) as e:
+        parsed_data, error = None, e
+    progress_bar.empty()
 
-    # Upload and parse log
-    with st.spinner("Uploading and parsing log..."):
-        response = requests.post(f"{BASE_URL}/experiments/parse-log", files={"file": uploaded_file})
-    
-    if response.status_code == 200:
+    if parsed_data is not None:
         # Parsing successful
-        parsed_data = response.json()
         st.success("Log file uploaded and parsed successfully!")
 
         # Show data preview
@@ -57,4 +78,4 @@ if uploaded_file is not None:
             else:
                 st.error(f"Failed to save run '{run_id}': {save_response.text}")
     else:
-        st.error(f"Failed to upload log file: {response.text}")
+        st.error(f"Failed to upload log file: {error}")
@@ -0,0 +1,114 @@
+import numpy as np
+
+# Hyperparameter sensitivity analysis over all runs. Every function works on
+# whole NumPy columns (one entry per run), there are no loops over the runs.
+
+# Convert an array to a JSON list, NaN becomes null
+def to_list(values):
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isnan(values), None, values).tolist()
+
+# Ranks of the values (average rank for ties), for the Spearman correlation
+def _ranks(values):
+    order = np.argsort(values, kind='stable')
+    sorted_values = values[order]
+    # First and last position of every run of equal values
+    starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+    ends = np.r_[starts[1:], len(values)] - 1
+    counts = ends - starts + 1
+    ranks = np.empty(len(values), dtype=np.float64)
+    ranks[order] = np.repeat((starts + ends) / 2.0, counts)
+    return ranks
+
+def _pearson(matrix):
+    if matrix.shape[1] < 2:
+        return np.full((matrix.shape[0], matrix.shape[0]), np.nan)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.corrcoef(matrix)
+
+# Pearson and Spearman correlations between the columns, over the runs that
+# have a value in every column. Returns {"pearson": {a: {b: r}}, "spearman": ..., "runs": n}.
+def correlations(columns):
+    names = list(columns)
+    matrix = np.vstack([columns[name] for name in names])
+    matrix = matrix[:, ~np.isnan(matrix).any(axis=0)]
+    ranked = np.vstack([_ranks(row) for row in matrix]) if matrix.shape[1] else matrix
+    result = {"runs": int(matrix.shape[1])}
+    for method, values in (("pearson", _pearson(matrix)), ("spearman", _pearson(ranked))):
+        result[method] = {name: dict(zip(names, to_list(row))) for name, row in zip(names, values)}
+    return result
+
+# Mean, standard deviation and count of y per bin of x. Parameters with at
+# most `bins` distinct values (e.g. batch_size) get one bin per value, the
+# others quantile bins so that every bin holds about the same number of runs.
+def binned_effect(x, y, bins=10):
+    present = ~np.isnan(x) & ~np.isnan(y)
+    x, y = x[present], y[present]
+    distinct = np.unique(x)
+    if len(distinct) <= bins:
+        index = np.searchsorted(distinct, x)
+        result = {"values": distinct.tolist()}
+        size = len(distinct)
+    else:
+        edges = np.unique(np.quantile(x, np.linspace(0, 1, bins + 1)))
+        index = np.clip(np.searchsorted(edges, x, side='right') - 1, 0, len(edges) - 2)
+        result = {"edges": edges.tolist()}
+        size = len(edges) - 1
+    count = np.bincount(index, minlength=size)
+    total = np.bincount(index, weights=y, minlength=size)
+    squares = np.bincount(index, weights=y * y, minlength=size)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        std = np.sqrt(np.maximum(squares / count - mean * mean, 0))
+    result.update(count=count.tolist(), mean=to_list(mean), std=to_list(std))
+    return result
+
+# Statistics of the target per group (e.g. per (model, dataset)), column
+# oriented. keys maps the grouping columns to arrays of labels, params the
+# hyperparameter columns averaged per group, and labels holds the run names
+# of which the best run per group is returned (highest target if maximize,
+# else lowest, e.g. for losses).
+def group_stats(keys, target, params, labels, maximize=True):
+    present = ~np.isnan(target)
+    keys = {name: key[present] for name, key in keys.items()}
+    target = target[present]
+    labels = labels[present]
+    params = {name: values[present] for name, values in params.items()}
+    if not len(target):
+        return {name: [] for name in (*keys, "count", "mean", "std", "min", "max", "best_run_id", *params)}
+
+    # One integer code per combination of the keys
+    codes = np.zeros(len(target), dtype=np.int64)
+    uniques = []
+    for key in keys.values():
+        unique, inverse = np.unique(key, return_inverse=True)
+        codes = codes * len(unique) + inverse
+        uniques.append(unique)
+    groups, index = np.unique(codes, return_inverse=True)
+
+    count = np.bincount(index)
+    mean = np.bincount(index, weights=target) / count
+    std = np.sqrt(np.maximum(np.bincount(index, weights=target * target) / count - mean * mean, 0))
+    # Sorted by group and target, the first run of every group has its minimum and the last its maximum
+    order = np.lexsort((target, index))
+    last = np.r_[np.flatnonzero(np.diff(index[order])), len(order) - 1]
+    first = np.r_[0, last[:-1] + 1]
+    best = order[last] if maximize else order[first]
+
+    # Decode the group codes back into the labels of every key
+    key_labels = {}
+    for name, unique in reversed(list(zip(keys, uniques))):
+        key_labels[name] = unique[groups % len(unique)].tolist()
+        groups = groups // len(unique)
+    result = {name: key_labels[name] for name in keys}
+    result.update(
+        count=count.tolist(), mean=to_list(mean), std=to_list(std),
+        min=to_list(target[order[first]]), max=to_list(target[order[last]]),
+        best_run_id=labels[best].tolist()
+    )
+    for name, values in params.items():
+        known = ~np.isnan(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result[name] = to_list(np.bincount(index[known], weights=values[known], minlength=len(count))
+                                   / np.bincount(index[known], minlength=len(count)))
+    return result
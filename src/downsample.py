@@ -0,0 +1,88 @@
+import numpy as np
+
+# Shape preserving downsampling of metric curves for the charts. A curve is a
+# pair of NumPy arrays (steps sorted ascending, values).
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+# Min-max buckets: split the curve into at most (max_points - 2) / 2 buckets of
+# equal size and keep the lowest and the highest point of each (and the first
+# and last point), in step order. Spikes survive any reduction.
+def minmax(steps, values, max_points):
+    size = len(steps)
+    if size <= max_points or max_points < 4:
+        return steps, values
+    bucket_size = -(-size // ((max_points - 2) // 2))
+    buckets = -(-size // bucket_size)
+    # One row per bucket, the last one is padded with values that are never picked
+    low = np.full(buckets * bucket_size, np.inf)
+    low[:size] = values
+    high = np.full(buckets * bucket_size, -np.inf)
+    high[:size] = values
+    offsets = np.arange(buckets) * bucket_size
+    keep = np.unique(np.concatenate([
+        [0, size - 1],
+        offsets + low.reshape(buckets, bucket_size).argmin(axis=1),
+        offsets + high.reshape(buckets, bucket_size).argmax(axis=1),
+    ]))
+    return steps[keep], values[keep]
+
+# Largest-Triangle-Three-Buckets: keeps the first and last point and from
+# each of max_points - 2 buckets the point that spans the largest triangle
+# with the point kept before and the mean of the next bucket. The loop runs
+# over the buckets, the points of a bucket are handled as one array.
+def lttb(steps, values, max_points):
+    size = len(steps)
+    if size <= max_points or max_points < 3:
+        return steps, values
+    x = steps.astype(np.float64)
+    y = values
+    edges = np.linspace(1, size - 1, max_points - 1).astype(np.int64)
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:size - 1], edges[:-1] - 1) / counts
+    mean_y = np.add.reduceat(y[1:size - 1], edges[:-1] - 1) / counts
+    # The last bucket is followed by the last point
+    mean_x = np.r_[mean_x[1:], x[-1]]
+    mean_y = np.r_[mean_y[1:], y[-1]]
+
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0] = 0
+    keep[-1] = size - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        low, high = edges[bucket], edges[bucket + 1]
+        px, py = x[previous], y[previous]
+        area = np.abs((px - mean_x[bucket]) * (y[low:high] - py) - (px - x[low:high]) * (mean_y[bucket] - py))
+        previous = low + int(np.argmax(area))
+        keep[bucket + 1] = previous
+    return steps[keep], values[keep]
+
+def downsample(steps, values, max_points, method='lttb'):
+    if method == 'minmax':
+        return minmax(steps, values, max_points)
+    return lttb(steps, values, max_points)
+
+# Class CurveLevels with precomputed resolutions of one curve: the full curve
+# and min-max reductions by factor each, down to min_points. A request picks
+# the coarsest level that still has max_points points in the requested step
+# window, so zoomed-out views of long curves only touch a few thousand points.
+class CurveLevels:
+    def __init__(self, steps, values, factor=4, min_points=1024):
+        self.levels = [(steps, values)]
+        while len(self.levels[-1][0]) > min_points * factor:
+            level_steps, level_values = self.levels[-1]
+            self.levels.append(minmax(level_steps, level_values, len(level_steps) // factor))
+
+    @property
+    def nbytes(self):
+        return sum(steps.nbytes + values.nbytes for steps, values in self.levels)
+
+    def __len__(self):
+        return len(self.levels[0][0])
+
+    # Downsampled points of the window start <= step <= end (None for open ends)
+    def select(self, max_points, start=None, end=None, method='lttb'):
+        for steps, values in reversed(self.levels):
+            low = 0 if start is None else np.searchsorted(steps, start, side='left')
+            high = len(steps) if end is None else np.searchsorted(steps, end, side='right')
+            if high - low >= max_points or steps is self.levels[0][0]:
+                return downsample(steps[low:high], values[low:high], max_points, method)
@@ -0,0 +1,73 @@
+import io
+import itertools
+import pyarrow as pa
+import pyarrow.parquet as pq
+import sqlalchemy as sa
+
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+PARQUET_MIMETYPE = 'application/vnd.apache.parquet'
+
+# Formats of the bulk read endpoints:
+#   json: list of row objects (default)
+#   columns: one JSON list per field
+#   arrow: Arrow IPC stream, parquet: Parquet file, both streamed in record batches
+EXPORT_FORMATS = ('json', 'columns', 'arrow', 'parquet')
+
+# Choose the format from the format query parameter or the Accept header
+def negotiate_format(request):
+    export_format = request.args.get('format')
+    if export_format:
+        return export_format
+    best = request.accept_mimetypes.best_match(['application/json', ARROW_MIMETYPE, PARQUET_MIMETYPE], default='application/json')
+    return {ARROW_MIMETYPE: 'arrow', PARQUET_MIMETYPE: 'parquet'}.get(best, 'json')
+
+def arrow_type(column_type):
+    if isinstance(column_type, sa.Enum):
+        return pa.string()
+    if isinstance(column_type, sa.Integer):
+        return pa.int64()
+    if isinstance(column_type, sa.Float):
+        return pa.float64()
+    if isinstance(column_type, sa.DateTime):
+        return pa.timestamp('us')
+    return pa.string()
+
+# Arrow schema for the given field names and their SQLAlchemy columns
+def arrow_schema(fields, columns):
+    return pa.schema([(field, arrow_type(column.type)) for field, column in zip(fields, columns)])
+
+# Cut an iterable of row tuples into record batches, transposed column by column
+def record_batches(rows, schema, batch_size):
+    rows = iter(rows)
+    for chunk in iter(lambda: list(itertools.islice(rows, batch_size)), []):
+        yield pa.RecordBatch.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(zip(*chunk), schema)],
+            schema=schema
+        )
+
+def columns_json(rows, fields):
+    columns = list(zip(*rows)) or [()] * len(fields)
+    return {field: list(column) for field, column in zip(fields, columns)}
+
+def _take(sink):
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+# Generators of the encoded stream, yielding the bytes written for every batch
+def stream_arrow(batches, schema):
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield _take(sink)
+    yield _take(sink)
+
+def stream_parquet(batches, schema):
+    sink = io.BytesIO()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield _take(sink)
+    yield _take(sink)
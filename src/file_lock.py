@@ -0,0 +1,21 @@
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: there is no gunicorn, so the server runs in a single process
+    fcntl = None
+
+# Exclusive lock on an open file for the worker processes that share a
+# directory. Without fcntl (Windows) it does nothing: the callers hold a
+# threading lock as well, which is all a single process needs.
+@contextmanager
+def file_lock(file):
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(file, fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(file, fcntl.LOCK_UN)
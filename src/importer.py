@@ -0,0 +1,77 @@
+import fnmatch
+import glob
+import os
+import tarfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from src.parse_log import LogParser, parse_log_file
+
+ARCHIVE_SUFFIXES = ('.tar', '.tar.gz', '.tgz')
+
+# Run name of a log file: its file name without the extension
+def run_name(path):
+    name = os.path.basename(path)
+    for suffix in ('.log', '.txt'):
+        if name.endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+# Find the logs of directories, globs and tar archives. Yields (name, source)
+# where source is the path of a file or the content of an archive member.
+def find_logs(paths, pattern='*.log'):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(fnmatch.filter(files, pattern)):
+                    yield run_name(name), os.path.join(root, name)
+        elif os.path.isfile(path) and path.endswith(ARCHIVE_SUFFIXES):
+            yield from _archive_logs(path, pattern)
+        elif os.path.isfile(path):
+            yield run_name(path), path
+        else:
+            matches = sorted(glob.glob(path, recursive=True))
+            if not matches:
+                raise FileNotFoundError(f"No logs found at {path}")
+            yield from find_logs(matches, pattern)
+
+# Members of a compressed archive can only be read in order, so they are read
+# here and their content is handed to the parser processes
+def _archive_logs(path, pattern):
+    with tarfile.open(path, 'r:*') as archive:
+        for member in archive:
+            if member.isfile() and fnmatch.fnmatch(os.path.basename(member.name), pattern):
+                yield run_name(member.name), archive.extractfile(member).read()
+
+# Parse one log in a worker process. Returns (result, log_hash, history).
+def parse_log_source(source, history=True):
+    parser = LogParser(history=history, hash=True)
+    if isinstance(source, bytes):
+        parser.feed(source)
+        result = parser.result()
+    else:
+        with open(source, 'rb') as file:
+            result = parse_log_file(file, parser=parser)
+    return result, parser.log_hash, parser.history() if history else None
+
+# Parse logs from find_logs in a pool of processes. Yields (name, parsed, error)
+# in completion order, parsed is the (result, log_hash, history) of a log and
+# error the exception if it could not be parsed. At most max_pending logs are
+# queued so that archives are not read into memory as a whole.
+def parse_logs(logs, workers=None, history=True, max_pending=None):
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 4 * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        logs = iter(logs)
+        while True:
+            for name, source in logs:
+                pending[pool.submit(parse_log_source, source, history)] = name
+                if len(pending) >= max_pending:
+                    break
+            if not pending:
+                return
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                error = future.exception()
+                yield name, None if error else future.result(), error
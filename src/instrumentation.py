@@ -0,0 +1,342 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from flask import request
+from sqlalchemy import event
+from werkzeug.wsgi import ClosingIterator
+
+# Bucket upper bounds of the histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Per request histograms by route: attribute, metric name, buckets, help text
+HISTOGRAMS = (
+    ('durations', 'http_request_duration_seconds', LATENCY_BUCKETS, "Time until the last byte of the response."),
+    ('sizes', 'http_response_size_bytes', SIZE_BUCKETS, "Size of the response body."),
+    ('queries', 'http_request_db_queries', QUERY_BUCKETS, "SQL statements executed per request."),
+    ('db_seconds', 'http_request_db_seconds', LATENCY_BUCKETS, "Time spent executing SQL statements per request."),
+)
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # A value equal to a bound belongs to its bucket (le = less or equal)
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class _RequestState:
+    __slots__ = ('method', 'route', 'start', 'status', 'size', 'queries', 'db_seconds')
+
+    def __init__(self, method):
+        self.method = method
+        self.route = None
+        self.start = time.perf_counter()
+        self.status = None
+        self.size = 0
+        self.queries = 0
+        self.db_seconds = 0.0
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# Add the series of a snapshot to total, both {label values tuple: value}
+def _add_series(total, series):
+    for key, value in series.items():
+        previous = total.get(key)
+        if previous is None:
+            total[key] = value
+        elif isinstance(value, tuple):
+            counts, histogram_sum, count = previous
+            total[key] = ([a + b for a, b in zip(counts, value[0])], histogram_sum + value[1], count + value[2])
+        else:
+            total[key] = previous + value
+
+def _merge(total, snapshot):
+    for name in ('requests', 'in_flight', *(attribute for attribute, *_ in HISTOGRAMS)):
+        _add_series(total[name], snapshot[name])
+    total['total_queries'] += snapshot['total_queries']
+    total['total_db_seconds'] += snapshot['total_db_seconds']
+    for name, value in snapshot['collectors'].items():
+        if name not in total['collectors'] or total['collectors'][name] is None:
+            total['collectors'][name] = value
+        elif isinstance(value, dict):
+            _add_series(total['collectors'][name], value)
+        elif value is not None:
+            total['collectors'][name] += value
+
+# Snapshots as JSON: series are lists of [label values, value] pairs
+def _dump(snapshot):
+    def series(values):
+        return [[list(key), list(value) if isinstance(value, tuple) else value] for key, value in values.items()]
+    data = {name: series(value) if isinstance(value, dict) else value for name, value in snapshot.items() if name != 'collectors'}
+    data['collectors'] = {name: series(value) if isinstance(value, dict) else value for name, value in snapshot['collectors'].items()}
+    data['collector_series'] = [name for name, value in snapshot['collectors'].items() if isinstance(value, dict)]
+    return json.dumps(data)
+
+def _load(text):
+    data = json.loads(text)
+    def series(pairs):
+        return {tuple(key): tuple(value) if isinstance(value, list) else value for key, value in pairs}
+    snapshot = {name: series(value) if isinstance(value, list) else value for name, value in data.items() if name not in ('collectors', 'collector_series')}
+    snapshot['collectors'] = {
+        name: series(value) if name in data['collector_series'] else value for name, value in data['collectors'].items()
+    }
+    return snapshot
+
+# Remove the metrics of a worker process that exited (gunicorn child_exit hook)
+def remove_process_metrics(directory, pid):
+    if not directory:
+        return
+    try:
+        os.remove(os.path.join(directory, f"{pid}.json"))
+    except FileNotFoundError:
+        pass
+
+# Class Instrumentation for the request metrics of a Flask app in the
+# Prometheus text format: latency, response size, SQL queries and SQL time
+# of every request by route (the URL rule, not the path, so that run ids do
+# not create new series), request counts by status and in-flight requests.
+#
+# The app is wrapped as WSGI middleware, so a streamed response (Arrow,
+# Server-Sent Events) counts until its last byte is sent. The state of a
+# request lives in a thread local, which is what the SQLAlchemy events of the
+# same thread add their queries to. Recording a request takes one lock.
+#
+# A server with several worker processes passes a directory shared by them:
+# every process writes a snapshot of its metrics to {pid}.json there every
+# interval seconds, and the scrape, whichever process handles it, adds up the
+# snapshots of the other processes and the current metrics of its own.
+class Instrumentation:
+    def __init__(self, prefix='miniml', directory=None, interval=5.0):
+        self.prefix = prefix
+        self.directory = directory
+        self.interval = interval
+        self.requests = {}
+        self.in_flight = {}
+        self.durations = {}
+        self.sizes = {}
+        self.queries = {}
+        self.db_seconds = {}
+        # All queries, also the ones outside of requests (CLI, background threads)
+        self.total_queries = 0
+        self.total_db_seconds = 0.0
+        self._collectors = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Process that runs the snapshot writer, a forked worker starts its own
+        self._writer_pid = None
+
+    def init_app(self, app):
+        app.wsgi_app = self._middleware(app.wsgi_app)
+        app.before_request(self._start_route)
+
+    def watch_engine(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            connection.info.setdefault('query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - connection.info['query_start'].pop()
+            state = getattr(self._local, 'state', None)
+            if state is not None:
+                state.queries += 1
+                state.db_seconds += elapsed
+            with self._lock:
+                self.total_queries += 1
+                self.total_db_seconds += elapsed
+
+    # Add a metric computed at scrape time: callback returns a number, or a
+    # dict of label values tuple -> number for the label names in labels
+    def add_collector(self, name, metric_type, help_text, callback, labels=()):
+        self._collectors.append((f"{self.prefix}_{name}", metric_type, help_text, callback, labels))
+
+    def _start_route(self):
+        state = getattr(self._local, 'state', None)
+        if state is None or state.route is not None:
+            return
+        state.route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        key = (state.method, state.route)
+        with self._lock:
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+
+    def _middleware(self, wsgi_app):
+        def instrumented_app(environ, start_response):
+            if self.directory and self._writer_pid != os.getpid():
+                self._start_writer()
+            state = _RequestState(environ.get('REQUEST_METHOD', ''))
+            self._local.state = state
+
+            def instrumented_start_response(status, headers, exc_info=None):
+                state.status = status.split(' ', 1)[0]
+                for name, value in headers:
+                    if name.lower() == 'content-length':
+                        state.size = int(value)
+                        break
+                else:
+                    state.size = None
+                return start_response(status, headers, exc_info)
+
+            try:
+                body = wsgi_app(environ, instrumented_start_response)
+            except BaseException:
+                state.status = '500'
+                self._finish(state)
+                raise
+            # Only bodies without Content-Length (streams) are counted while they are sent
+            if state.size is None:
+                state.size = 0
+                return self._iterate(body, state)
+            return ClosingIterator(body, lambda: self._finish(state))
+        return instrumented_app
+
+    def _iterate(self, body, state):
+        try:
+            for data in body:
+                state.size += len(data)
+                yield data
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+            self._finish(state)
+
+    def _finish(self, state):
+        if getattr(self._local, 'state', None) is state:
+            self._local.state = None
+        elapsed = time.perf_counter() - state.start
+        route = state.route or '<unmatched>'
+        key = (state.method, route)
+        with self._lock:
+            if state.route is not None:
+                self.in_flight[key] -= 1
+            status_key = (state.method, route, state.status)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            for (attribute, _, buckets, _), value in zip(HISTOGRAMS, (elapsed, state.size, state.queries, state.db_seconds)):
+                histograms = getattr(self, attribute)
+                histogram = histograms.get(key)
+                if histogram is None:
+                    histogram = histograms[key] = Histogram(buckets)
+                histogram.observe(value)
+
+    def _start_writer(self):
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+        threading.Thread(target=self._write_snapshots, name='metrics-writer', daemon=True).start()
+
+    def _write_snapshots(self):
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        while True:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(f"{path}.tmp", 'w') as file:
+                    file.write(_dump(self.snapshot()))
+                os.replace(f"{path}.tmp", path)
+            except Exception as e:
+                logging.error(f"Could not write the metrics snapshot: {str(e)}")
+            time.sleep(self.interval)
+
+    # Metrics of this process, series as {label values tuple: value}, histograms as (counts, sum, count)
+    def snapshot(self):
+        with self._lock:
+            snapshot = {
+                "requests": dict(self.requests),
+                "in_flight": dict(self.in_flight),
+                "total_queries": self.total_queries,
+                "total_db_seconds": self.total_db_seconds,
+            }
+            for attribute, *_ in HISTOGRAMS:
+                snapshot[attribute] = {
+                    key: (list(histogram.counts), histogram.sum, histogram.count) for key, histogram in getattr(self, attribute).items()
+                }
+        snapshot["collectors"] = {}
+        for name, _, _, callback, _ in self._collectors:
+            value = callback()
+            snapshot["collectors"][name] = dict(value) if isinstance(value, dict) else value
+        return snapshot
+
+    # Metrics of this process and the snapshots of the other processes
+    def collect(self):
+        total = self.snapshot()
+        if not self.directory:
+            return total
+        own = f"{os.getpid()}.json"
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return total
+        for name in names:
+            if not name.endswith('.json') or name == own:
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as file:
+                    _merge(total, _load(file.read()))
+            except (FileNotFoundError, ValueError, KeyError):
+                # Removed by an exiting worker in the meantime
+                continue
+        return total
+
+    # All metrics in the Prometheus text exposition format (version 0.0.4)
+    def render(self):
+        metrics = self.collect()
+        lines = []
+        def header(name, metric_type, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        prefix = self.prefix
+        header(f"{prefix}_http_requests_total", 'counter', "Requests by method, route and status.")
+        for key, count in sorted(metrics['requests'].items(), key=lambda item: tuple(map(str, item[0]))):
+            lines.append(f"{prefix}_http_requests_total{_labels(('method', 'route', 'status'), key)} {count}")
+        header(f"{prefix}_http_requests_in_flight", 'gauge', "Requests being handled or streamed.")
+        for key, count in sorted(metrics['in_flight'].items()):
+            lines.append(f"{prefix}_http_requests_in_flight{_labels(('method', 'route'), key)} {count}")
+        for attribute, name, buckets, help_text in HISTOGRAMS:
+            name = f"{prefix}_{name}"
+            header(name, 'histogram', help_text)
+            for key, (counts, histogram_sum, count) in sorted(metrics[attribute].items()):
+                cumulative = 0
+                for bound, bucket_count in zip((*buckets, float('inf')), counts):
+                    cumulative += bucket_count
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f"{name}_bucket{_labels(('method', 'route'), key, le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(('method', 'route'), key)} {_number(histogram_sum)}")
+                lines.append(f"{name}_count{_labels(('method', 'route'), key)} {count}")
+        header(f"{prefix}_db_queries_total", 'counter', "SQL statements executed.")
+        lines.append(f"{prefix}_db_queries_total {metrics['total_queries']}")
+        header(f"{prefix}_db_query_seconds_total", 'counter', "Time spent executing SQL statements.")
+        lines.append(f"{prefix}_db_query_seconds_total {_number(metrics['total_db_seconds'])}")
+
+        for name, metric_type, help_text, callback, labels in self._collectors:
+            header(name, metric_type, help_text)
+            value = metrics['collectors'].get(name)
+            if isinstance(value, dict):
+                for key, item in sorted(value.items()):
+                    lines.append(f"{name}{_labels(labels, key)} {_number(item)}")
+            elif value is not None:
+                lines.append(f"{name} {_number(value)}")
+        return '\n'.join(lines) + '\n'
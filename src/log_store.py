@@ -0,0 +1,223 @@
+import bisect
+import os
+import threading
+from collections import OrderedDict, deque
+from urllib.parse import quote
+from src.file_lock import file_lock
+
+# Class LogStore to keep the live log lines of the runs.
+#
+# Every line is appended to segment files on disk (one directory per run,
+# files named after the byte offset of their first line), so the history
+# survives restarts. The last buffer_lines lines of the most recently used
+# max_runs runs are also kept in memory to answer the usual "what is new
+# since offset x" requests without touching the disk. Offsets are byte
+# offsets into the concatenated log of a run and always point to line starts.
+#
+# Several worker processes can share the directory: appends take a file lock
+# per run, and the end of a log is taken from the segment files, so lines
+# appended by other workers are read from disk instead of the buffer.
+class LogStore:
+    def __init__(self, directory, buffer_lines=1000, segment_bytes=64 * 1024 * 1024, max_runs=256):
+        self.directory = directory
+        self.buffer_lines = buffer_lines
+        self.segment_bytes = segment_bytes
+        self.max_runs = max_runs
+        self._runs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _run(self, run_id):
+        with self._lock:
+            run_log = self._runs.get(run_id)
+            if run_log is None:
+                run_log = _RunLog(os.path.join(self.directory, quote(run_id, safe='')), self.buffer_lines, self.segment_bytes)
+                self._runs[run_id] = run_log
+                while len(self._runs) > self.max_runs:
+                    self._runs.popitem(last=False)[1].close()
+            else:
+                self._runs.move_to_end(run_id)
+            return run_log
+
+    # Append log entries to a run, returns the offset after the last entry
+    def append(self, run_id, entries):
+        return self._run(run_id).append(entries)
+
+    # Block until the log of a run grows past offset since or timeout seconds passed
+    def wait(self, run_id, since, timeout):
+        return self._run(run_id).wait(since, timeout)
+
+    # Read the lines of a run from offset since on, at most limit bytes
+    # (but at least one line). Returns the data and the offset to continue from.
+    def read(self, run_id, since=0, limit=4 * 1024 * 1024):
+        return self._run(run_id).read(since, limit)
+
+    def delete(self, run_id):
+        with self._lock:
+            run_log = self._runs.pop(run_id, None)
+        if run_log is None:
+            run_log = _RunLog(os.path.join(self.directory, quote(run_id, safe='')), self.buffer_lines, self.segment_bytes)
+        run_log.delete()
+
+class _RunLog:
+    def __init__(self, directory, buffer_lines, segment_bytes):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.lock = threading.Lock()
+        self.appended = threading.Condition(self.lock)
+        # Ring buffer of (offset, line) of the latest lines appended by this
+        # process, contiguous up to buffer_end
+        self.buffer = deque(maxlen=buffer_lines)
+        self.buffer_end = 0
+        self.file = None
+        self.file_start = None
+        self.lock_file = None
+        # Start offsets of the segment files, the last one is written to
+        self.segments = []
+        self.end = 0
+        self._refresh()
+
+    def _path(self, start):
+        return os.path.join(self.directory, f"{start:020d}.log")
+
+    # Take the segments and the end of the log from disk. Only a full last
+    # segment can be followed by a new one, otherwise its size is enough.
+    def _refresh(self):
+        if self.segments:
+            try:
+                size = os.path.getsize(self._path(self.segments[-1]))
+                if size < self.segment_bytes:
+                    self._set_end(self.segments[-1] + size)
+                    return
+            except FileNotFoundError:
+                pass
+        self.segments = []
+        if os.path.isdir(self.directory):
+            self.segments = sorted(int(name.split('.')[0]) for name in os.listdir(self.directory) if name.endswith('.log'))
+        self._set_end(self.segments[-1] + os.path.getsize(self._path(self.segments[-1])) if self.segments else 0)
+
+    def _set_end(self, end):
+        if end < self.end:
+            # The log was deleted
+            self.buffer.clear()
+            self.buffer_end = 0
+        self.end = end
+
+    def append(self, entries):
+        with self.lock:
+            if self.lock_file is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.lock_file = open(os.path.join(self.directory, '.lock'), 'ab')
+            with file_lock(self.lock_file):
+                self._refresh()
+                if not self.segments or self.end - self.segments[-1] >= self.segment_bytes or self.file_start != self.segments[-1]:
+                    self._rotate()
+                # Lines of other workers since the last append are not in the buffer
+                if self.buffer_end != self.end:
+                    self.buffer.clear()
+                data = bytearray()
+                for entry in entries:
+                    line = entry.encode('utf-8') + b'\n'
+                    self.buffer.append((self.end + len(data), line))
+                    data += line
+                self.file.write(data)
+                self.end += len(data)
+                self.buffer_end = self.end
+            self.appended.notify_all()
+            return self.end
+
+    # Appends of other workers are not notified, they are seen after timeout
+    def wait(self, since, timeout):
+        with self.lock:
+            self._refresh()
+            if self.end <= since:
+                self.appended.wait(timeout)
+                self._refresh()
+            return self.end > since
+
+    def _rotate(self):
+        if self.file is not None:
+            self.file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        # Continue the last segment (after a restart, or one started by another worker) unless it is full
+        if not self.segments or self.end - self.segments[-1] >= self.segment_bytes:
+            self.segments.append(self.end)
+        self.file = open(self._path(self.segments[-1]), 'ab', buffering=0)
+        self.file_start = self.segments[-1]
+
+    def read(self, since, limit):
+        with self.lock:
+            self._refresh()
+            since = max(since, 0)
+            if since >= self.end:
+                return b'', self.end
+            if self.buffer and self.buffer[0][0] <= since < self.buffer_end:
+                lines = []
+                size = 0
+                for offset, line in self.buffer:
+                    if offset < since:
+                        continue
+                    if not lines:
+                        since = offset
+                    elif size + len(line) > limit:
+                        break
+                    lines.append(line)
+                    size += len(line)
+                return b''.join(lines), since + size
+            segments = list(self.segments)
+            end = self.end
+        data = self._read_segments(segments, since, min(end, since + limit))
+        return data, since + len(data)
+
+    # Older lines come from the segment files
+    def _read_segments(self, segments, since, stop):
+        chunks = []
+        index = bisect.bisect_right(segments, since) - 1
+        position = since
+        while position < stop and 0 <= index < len(segments):
+            start = segments[index]
+            with open(self._path(start), 'rb') as file:
+                file.seek(position - start)
+                chunk = file.read(stop - position)
+            chunks.append(chunk)
+            position += len(chunk)
+            index += 1
+            if not chunk:
+                break
+        data = b''.join(chunks)
+        # Only return complete lines, or the first line if it is longer than the limit
+        cut = data.rfind(b'\n') + 1
+        if cut == 0:
+            return self._read_line(segments, since)
+        return data[:cut]
+
+    def _read_line(self, segments, since):
+        start = segments[bisect.bisect_right(segments, since) - 1]
+        with open(self._path(start), 'rb') as file:
+            file.seek(since - start)
+            return file.readline()
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+                self.file_start = None
+            if self.lock_file is not None:
+                self.lock_file.close()
+                self.lock_file = None
+
+    def delete(self):
+        self.close()
+        with self.lock:
+            self._refresh()
+        for start in self.segments:
+            try:
+                os.remove(self._path(start))
+            except FileNotFoundError:
+                pass
+        try:
+            os.remove(os.path.join(self.directory, '.lock'))
+        except FileNotFoundError:
+            pass
+        if os.path.isdir(self.directory) and not os.listdir(self.directory):
+            os.rmdir(self.directory)
@@ -0,0 +1,37 @@
+from sqlalchemy import inspect, text
+
+# Bring an existing database up to date with the models in metadata.
+# db.create_all() only creates missing tables, so columns and indexes that
+# were added to an existing table later are created here. Returns the list of
+# applied changes.
+def upgrade_schema(engine, metadata):
+    changes = []
+    existing_tables = set(inspect(engine).get_table_names())
+    metadata.create_all(engine)
+    changes.extend(f"created table {table.name}" for table in metadata.sorted_tables if table.name not in existing_tables)
+
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=connection.dialect)
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'
+                if column.server_default is not None:
+                    ddl += f" DEFAULT {column.server_default.arg}"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+                connection.execute(text(ddl))
+                changes.append(f"added column {table.name}.{column.name}")
+
+            existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    changes.append(f"created index {index.name}")
+    return changes
@@ -0,0 +1,81 @@
+import json
+import os
+import re
+import time
+import uuid
+import numpy as np
+
+# Class ParseCache for the results and curves of parsed logs by log_hash,
+# stored as {log_hash}.npz files in directory so that all worker processes of
+# the server share them: a log parsed by one worker can be stored as a run by
+# another. Entries expire ttl seconds after they were written, and the oldest
+# are removed when the files take more than max_bytes.
+class ParseCache:
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, ttl=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+    def _path(self, log_hash):
+        return os.path.join(self.directory, f"{log_hash}.npz")
+
+    # Store the parsed data and {name: (steps, values)} curves of a log
+    def put(self, log_hash, parsed_data, history):
+        if not re.fullmatch(r'[0-9a-f]{64}', log_hash):
+            raise KeyError(log_hash)
+        os.makedirs(self.directory, exist_ok=True)
+        arrays = {"parsed_data": np.array(json.dumps(parsed_data))}
+        for index, (name, (steps, values)) in enumerate(history.items()):
+            arrays[f"name_{index}"] = np.array(name)
+            arrays[f"steps_{index}"] = steps
+            arrays[f"values_{index}"] = values
+        # Written under a temporary name, readers never see a partial file
+        temporary = os.path.join(self.directory, f".{log_hash}.{uuid.uuid4().hex}.npz")
+        np.savez(temporary, **arrays)
+        if os.path.getsize(temporary) > self.max_bytes:
+            os.remove(temporary)
+            return False
+        os.replace(temporary, self._path(log_hash))
+        self._prune()
+        return True
+
+    # (parsed_data, history) of a log, None if it is unknown or expired
+    def get(self, log_hash):
+        if not re.fullmatch(r'[0-9a-f]{64}', log_hash or ''):
+            return None
+        path = self._path(log_hash)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with np.load(path, allow_pickle=False) as arrays:
+                history = {}
+                index = 0
+                while f"name_{index}" in arrays:
+                    history[str(arrays[f"name_{index}"])] = (arrays[f"steps_{index}"], arrays[f"values_{index}"])
+                    index += 1
+                return json.loads(str(arrays["parsed_data"])), history
+        except (FileNotFoundError, ValueError, OSError):
+            # Removed or replaced by another worker in the meantime
+            return None
+
+    def _prune(self):
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.npz') or entry.name.startswith('.'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if total <= self.max_bytes and now - mtime <= self.ttl:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
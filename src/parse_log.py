@@ -1,113 +1,253 @@
-import re 
-
-def parse_log_content(log_content): 
-    parsed_data = {
-        'ap': 0.0,
-        'ap50': None, 
-        'ap75': None,
-        'aps': None,
-        'apm': None,
-        'apl': None,
-        'total_loss': None,
-        'loss_cls': None,
-        'loss_box_reg': None,
-        'loss_rpn_cls': None,
-        'loss_rpn_loc': None,
-        'iterations': None,
-        'learning_rate': None,
-        'batch_size': None,
-    }
-    
-    #Define regex patterns to extract metrics
-    ap_pattern = re.compile(r'Average Precision  \(AP\) @\[ IoU=0.50:0.95 \| area=   all \| maxDets=100 \] = ([0-9.]+)')
-    ap50_pattern = re.compile(r'Average Precision\s*\(AP\)\s*@\[ IoU=0.50\s*\|\s*area=\s*all\s*\|\s*maxDets=100\s*\]\s*=\s*([0-9.]+)')
-    ap75_pattern = re.compile(r'Average Precision\s*\(AP\)\s*@\[ IoU=0.75\s*\|\s*area=\s*all\s*\|\s*maxDets=100\s*\]\s*=\s*([0-9.]+)')
-    aps_pattern = re.compile(r'Average Precision\s*\(AP\)\s*@\[ IoU=0.50:0.95\s*\|\s*area=\s*small\s*\|\s*maxDets=100\s*\]\s*=\s*([0-9.]+)')
-    apm_pattern = re.compile(r'Average Precision\s*\(AP\)\s*@\[ IoU=0.50:0.95\s*\|\s*area=\s*medium\s*\|\s*maxDets=100\s*\]\s*=\s*([0-9.]+)')
-    apl_pattern = re.compile(r'Average Precision\s*\(AP\)\s*@\[ IoU=0.50:0.95\s*\|\s*area=\s*large\s*\|\s*maxDets=100\s*\]\s*=\s*([0-9.]+)')
-    total_loss_pattern = re.compile(r'total_loss: ([0-9.]+)')
-    loss_cls_pattern = re.compile(r'loss_cls: ([0-9.]+)')
-    loss_box_reg_pattern = re.compile(r'loss_box_reg: ([0-9.]+)')
-    loss_rpn_cls_pattern = re.compile(r'loss_rpn_cls: ([0-9.]+)')
-    loss_rpn_loc_pattern = re.compile(r'loss_rpn_loc: ([0-9.]+)')
-    iterations_pattern = re.compile(r'iter: ([0-9]+)')
-    learning_rate_pattern = re.compile(r'lr: ([0-9.]+)')
-    batch_size_pattern = re.compile(r'batch_size=([0-9]+)')
-    
-    lines = log_content.splitlines()
-    best_ap_line_index = 0
-    iterations_line_index = 0
-    
-    #Search for best AP
-    for i, line in enumerate(lines):
-        ap_match = ap_pattern.search(line)
-        if ap_match: 
+import hashlib
+import re
+import numpy as np
+
+#Define regex patterns to extract metrics, compiled once on bytes so that lines never have to be decoded
+ap_pattern = re.compile(rb'Average Precision  \(AP\) @\[ IoU=0.50:0.95 \| area=   all \| maxDets=100 \] = ([0-9.]+)')
+ap_patterns = {
+    'ap50': re.compile(rb'Average Precision\s*\(AP\)\s*@\[ IoU=0.50\s*\|\s*area=\s*all\s*\|\s*maxDets=100\s*\]\s*=\s*([0-9.]+)'),
+    'ap75': re.compile(rb'Average Precision\s*\(AP\)\s*@\[ IoU=0.75\s*\|\s*area=\s*all\s*\|\s*maxDets=100\s*\]\s*=\s*([0-9.]+)'),
+    'aps': re.compile(rb'Average Precision\s*\(AP\)\s*@\[ IoU=0.50:0.95\s*\|\s*area=\s*small\s*\|\s*maxDets=100\s*\]\s*=\s*([0-9.]+)'),
+    'apm': re.compile(rb'Average Precision\s*\(AP\)\s*@\[ IoU=0.50:0.95\s*\|\s*area=\s*medium\s*\|\s*maxDets=100\s*\]\s*=\s*([0-9.]+)'),
+    'apl': re.compile(rb'Average Precision\s*\(AP\)\s*@\[ IoU=0.50:0.95\s*\|\s*area=\s*large\s*\|\s*maxDets=100\s*\]\s*=\s*([0-9.]+)'),
+}
+# One pattern for all values of a training iteration line, group 1 is the key
+loss_pattern = re.compile(rb'(total_loss|loss_cls|loss_box_reg|loss_rpn_cls|loss_rpn_loc|lr): ([0-9.]+)')
+iterations_pattern = re.compile(rb'iter: ([0-9]+)')
+batch_size_pattern = re.compile(rb'batch_size=([0-9]+)')
+
+LOSS_KEYS = {
+    b'total_loss': 'total_loss',
+    b'loss_cls': 'loss_cls',
+    b'loss_box_reg': 'loss_box_reg',
+    b'loss_rpn_cls': 'loss_rpn_cls',
+    b'loss_rpn_loc': 'loss_rpn_loc',
+    b'lr': 'learning_rate',
+}
+
+# Curves extracted from every 'iter:' line for the history, key -> metric name
+HISTORY_KEYS = {**LOSS_KEYS, b'loss_mask': 'mask_loss'}
+# Lines with an 'iter:' value, and all values of the history keys on them
+iterations_line_pattern = re.compile(rb'^[^\n]*?\biter: [0-9]+[^\n]*', re.MULTILINE)
+history_pattern = re.compile(rb'\b(iter|' + b'|'.join(HISTORY_KEYS) + rb'): (-?[0-9.]+(?:e[-+]?[0-9]+)?)')
+
+# Fill in the first value of every iteration key found in data that is still missing in values
+def _first_values(data, values):
+    if 'iterations' not in values:
+        iterations_match = iterations_pattern.search(data)
+        if iterations_match:
+            values['iterations'] = int(iterations_match.group(1))
+    missing = len(LOSS_KEYS) - sum(key in values for key in LOSS_KEYS.values())
+    if missing:
+        for match in loss_pattern.finditer(data):
+            key = LOSS_KEYS[match.group(1)]
+            if key not in values:
+                values[key] = float(match.group(2))
+                missing -= 1
+                if not missing:
+                    break
+    if 'batch_size' not in values:
+        batch_size_match = batch_size_pattern.search(data)
+        if batch_size_match:
+            values['batch_size'] = int(batch_size_match.group(1))
+    return values
+
+# Keep one value per step: the last one (keep='last') or the first one
+def _unique_steps(steps, values, keep):
+    if keep == 'last':
+        index = len(steps) - 1 - np.unique(steps[::-1], return_index=True)[1]
+    else:
+        index = np.unique(steps, return_index=True)[1]
+    return steps[index], values[index]
+
+# Start of the last line at or before end that contains an 'iter:' value, or -1
+def _last_iterations_line(data, end):
+    position = data.rfind(b'iter: ', 0, end)
+    while position >= 0 and not iterations_pattern.match(data, position):
+        position = data.rfind(b'iter: ', 0, position)
+    if position < 0:
+        return -1
+    return data.rfind(b'\n', 0, position) + 1
+
+# Class LogParser to extract the metrics of a detectron2 training log in a
+# single pass with constant memory, from binary chunks of any size. The result
+# is the AP block with the best AP and the values of the training iteration
+# logged last before it.
+#
+# The chunks are scanned with the precompiled patterns as a whole, so the
+# regex engine skips to the few interesting places (AP lines, the last 'iter:'
+# line) instead of Python looking at every line. Only the values of the
+# iteration window that ends at a new best AP are extracted.
+#
+# With hash=True the parser keeps the sha256 of the content (log_hash), which
+# identifies a log; it is off by default as it slows parsing down by about 40%.
+# With history=True the parser also extracts the curves of the whole run, see history().
+class LogParser:
+    def __init__(self, history=False, hash=False):
+        self.best_ap = 0.0
+        # First values of the AP block since the best AP (or since the start while there is none)
+        self.best_ap_values = {}
+        # Values of the iteration window before the best AP
+        self.best_window = {}
+        # First values since the last 'iter:' line (or since the start) of the chunks processed so far
+        self.window = {}
+        self.partial = b''
+        self.digest = hashlib.sha256() if hash else None
+        self.extract_history = history
+        # History: per chunk and curve the steps and values of the 'iter:' lines, and one dict per evaluation
+        self.curves = {name: [] for name in HISTORY_KEYS.values()}
+        self.evaluations = []
+        # Evaluation that may continue in the next chunk, and the last 'iter:' value so far
+        self.evaluation = None
+        self.iterations = 0
+
+    # sha256 of the content fed so far, None without hash=True
+    @property
+    def log_hash(self):
+        return self.digest.hexdigest() if self.digest is not None else None
+
+    # Feed a chunk of the binary log, lines may be split across chunks
+    def feed(self, data):
+        if self.digest is not None:
+            self.digest.update(data)
+        end = data.rfind(b'\n') + 1
+        if not end:
+            self.partial += data
+            return
+        chunk = self.partial + data[:end] if self.partial else data[:end]
+        self.partial = data[end:]
+        self._process(chunk)
+
+    def _process(self, chunk):
+        ap_start = 0
+        for ap_match in ap_pattern.finditer(chunk):
             current_ap = float(ap_match.group(1))
-            if current_ap > parsed_data['ap']: 
-                parsed_data['ap'] = current_ap
-                best_ap_line_index = i
-                
-    for j in range(best_ap_line_index, -1, -1): 
-        iterations_match = iterations_pattern.search(lines[j])
-        if iterations_match: 
-            iterations_line_index = j
-            break
-                
-    if best_ap_line_index is not None:
-        for line in lines[best_ap_line_index:]:
-            if parsed_data['ap50'] is None: 
-                ap50_match = ap50_pattern.search(line)
-                if ap50_match:
-                    parsed_data['ap50'] = float(ap50_match.group(1))
-            if parsed_data['ap75'] is None:
-                ap75_match = ap75_pattern.search(line)
-                if ap75_match:
-                    parsed_data['ap75'] = float(ap75_match.group(1))
-            if parsed_data['aps'] is None:
-                aps_match = aps_pattern.search(line)
-                if aps_match:
-                    parsed_data['aps'] = float(aps_match.group(1))
-            if parsed_data['apm'] is None:
-                apm_match = apm_pattern.search(line)
-                if apm_match:
-                    parsed_data['apm'] = float(apm_match.group(1))
-            if parsed_data['apl'] is None:
-                apl_match = apl_pattern.search(line)
-                if apl_match:
-                    parsed_data['apl'] = float(apl_match.group(1))
-                    
-        for line in lines[iterations_line_index:best_ap_line_index]:
-            if parsed_data['total_loss'] is None:
-                total_loss_match = total_loss_pattern.search(line)
-                if total_loss_match:
-                    parsed_data['total_loss'] = float(total_loss_match.group(1))
-            if parsed_data['loss_cls'] is None:
-                loss_cls_match = loss_cls_pattern.search(line)
-                if loss_cls_match:
-                    parsed_data['loss_cls'] = float(loss_cls_match.group(1))
-            if parsed_data['loss_box_reg'] is None:
-                loss_box_reg_match = loss_box_reg_pattern.search(line)
-                if loss_box_reg_match:
-                    parsed_data['loss_box_reg'] = float(loss_box_reg_match.group(1))
-            if parsed_data['loss_rpn_cls'] is None:
-                loss_rpn_cls_match = loss_rpn_cls_pattern.search(line)
-                if loss_rpn_cls_match:
-                    parsed_data['loss_rpn_cls'] = float(loss_rpn_cls_match.group(1))
-            if parsed_data['loss_rpn_loc'] is None:
-                loss_rpn_loc_match = loss_rpn_loc_pattern.search(line)
-                if loss_rpn_loc_match:
-                    parsed_data['loss_rpn_loc'] = float(loss_rpn_loc_match.group(1))
-            if parsed_data['iterations'] is None:
-                iterations_match = iterations_pattern.search(line)
-                if iterations_match:
-                    parsed_data['iterations'] = int(iterations_match.group(1))
-            if parsed_data['learning_rate'] is None:
-                learning_rate_match = learning_rate_pattern.search(line)
-                if learning_rate_match:
-                    parsed_data['learning_rate'] = float(learning_rate_match.group(1))
-            if parsed_data['batch_size'] is None:
-                batch_size_match = batch_size_pattern.search(line)
-                if batch_size_match:
-                    parsed_data['batch_size'] = int(batch_size_match.group(1))
-    return parsed_data
-    
\ No newline at end of file
+            if current_ap > self.best_ap:
+                self.best_ap = current_ap
+                self.best_ap_values = {}
+                # The window runs from the last 'iter:' line up to (excluding) the AP line
+                ap_start = chunk.rfind(b'\n', 0, ap_match.start()) + 1
+                ap_end = chunk.find(b'\n', ap_match.end())
+                iterations_start = _last_iterations_line(chunk, len(chunk) if ap_end < 0 else ap_end)
+                if iterations_start >= 0:
+                    self.best_window = _first_values(chunk[iterations_start:ap_start], {})
+                else:
+                    self.best_window = _first_values(chunk[:ap_start], dict(self.window))
+
+        if len(self.best_ap_values) < len(ap_patterns):
+            for key, pattern in ap_patterns.items():
+                if key not in self.best_ap_values:
+                    match = pattern.search(chunk, ap_start)
+                    if match:
+                        self.best_ap_values[key] = float(match.group(1))
+
+        iterations_start = _last_iterations_line(chunk, len(chunk))
+        if iterations_start >= 0:
+            self.window = _first_values(chunk[iterations_start:], {})
+        else:
+            _first_values(chunk, self.window)
+
+        if self.extract_history:
+            self._extract_history(chunk)
+
+    def _extract_history(self, chunk):
+        lines = iterations_line_pattern.findall(chunk)
+        ap_matches = list(ap_pattern.finditer(chunk))
+
+        # The AP block of an evaluation ends at the next evaluation
+        if self.evaluation is not None:
+            self._fill_evaluation(chunk, 0, ap_matches[0].start() if ap_matches else len(chunk))
+        for index, ap_match in enumerate(ap_matches):
+            # An evaluation belongs to the last 'iter:' line before it
+            iterations_start = _last_iterations_line(chunk, ap_match.start())
+            if iterations_start >= 0:
+                self.iterations = int(iterations_pattern.search(chunk, iterations_start).group(1))
+            self.evaluation = {'step': self.iterations, 'ap': float(ap_match.group(1))}
+            self.evaluations.append(self.evaluation)
+            end = ap_matches[index + 1].start() if index + 1 < len(ap_matches) else len(chunk)
+            self._fill_evaluation(chunk, ap_match.end(), end)
+
+        if lines:
+            # One vectorized pass: every 'iter' value starts a new row, the
+            # other values of the line belong to that row
+            keys, values = zip(*history_pattern.findall(b'\n'.join(lines)))
+            keys = np.array(keys)
+            values = np.array(values).astype(np.float64)
+            is_step = keys == b'iter'
+            rows = np.cumsum(is_step) - 1
+            steps = values[is_step].astype(np.int64)
+            for key, name in HISTORY_KEYS.items():
+                selected = keys == key
+                self.curves[name].append((steps[rows[selected]], values[selected]))
+            self.iterations = int(steps[-1])
+
+    def _fill_evaluation(self, chunk, start, end):
+        for key, pattern in ap_patterns.items():
+            if key not in self.evaluation:
+                match = pattern.search(chunk, start, end)
+                if match:
+                    self.evaluation[key] = float(match.group(1))
+        if len(self.evaluation) == len(ap_patterns) + 2:
+            self.evaluation = None
+
+    # Curves of the whole run as {metric name: (steps, values)} NumPy arrays:
+    # the losses and learning rate of every 'iter:' line and the APs of every
+    # evaluation at the iteration before it. Requires history=True.
+    def history(self):
+        if self.partial:
+            self.result()
+        history = {}
+        for name, chunks in self.curves.items():
+            steps = np.concatenate([chunk_steps for chunk_steps, _ in chunks]) if chunks else np.empty(0, dtype=np.int64)
+            values = np.concatenate([chunk_values for _, chunk_values in chunks]) if chunks else np.empty(0)
+            if len(steps):
+                # A resumed run logs the same iterations again, the last ones are kept
+                history[name] = _unique_steps(steps, values, keep='last')
+        evaluation_steps = np.array([evaluation['step'] for evaluation in self.evaluations], dtype=np.int64)
+        for key in ('ap', *ap_patterns):
+            values = np.array([evaluation.get(key, np.nan) for evaluation in self.evaluations], dtype=np.float64)
+            present = ~np.isnan(values)
+            if present.any():
+                # Of several evaluations at one step (e.g. bbox and segm) the first one is kept
+                history[key] = _unique_steps(evaluation_steps[present], values[present], keep='first')
+        return history
+
+    def result(self):
+        if self.partial:
+            self._process(self.partial)
+            self.partial = b''
+        parsed_data = {
+            'ap': self.best_ap,
+            'ap50': None,
+            'ap75': None,
+            'aps': None,
+            'apm': None,
+            'apl': None,
+            'total_loss': None,
+            'loss_cls': None,
+            'loss_box_reg': None,
+            'loss_rpn_cls': None,
+            'loss_rpn_loc': None,
+            'iterations': None,
+            'learning_rate': None,
+            'batch_size': None,
+        }
+        parsed_data.update(self.best_ap_values)
+        parsed_data.update(self.best_window)
+        return parsed_data
+
+# Size of the blocks read from a file
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Parse a binary file object (e.g. an upload or open(path, 'rb')) block by block,
+# pass a LogParser to get its log_hash or history
+def parse_log_file(file, chunk_size=CHUNK_SIZE, parser=None):
+    parser = parser or LogParser()
+    for chunk in iter(lambda: file.read(chunk_size), b''):
+        parser.feed(chunk)
+    return parser.result()
+
+def parse_log_content(log_content):
+    parser = LogParser()
+    parser.feed('\n'.join(log_content.splitlines()).encode('utf-8'))
+    return parser.result()
@@ -0,0 +1,264 @@
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from flask import g, request
+from sqlalchemy import event
+
+# Longest SQL statement kept in a trace, and functions kept in the summary of a cProfile run
+MAX_STATEMENT_LENGTH = 2000
+TOP_FUNCTIONS = 40
+
+# Only one cProfile can be active per process (Python 3.12+ raises ValueError
+# for a second one, in any thread), shared by every profiler of the process
+_cprofile_lock = threading.Lock()
+
+class _Capture:
+    def __init__(self, trigger):
+        self.trigger = trigger
+        self.start = time.perf_counter()
+        self.started_at = time.time()
+        self.profile = None
+        self.status = None
+        self.statements = []
+        self.stacks = Counter()
+        self.samples = 0
+
+# Collapsed stack of a frame, root first: "module:function:line;..." as used by flame graph tools
+def _folded_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+# Top functions of a cProfile run by cumulative time
+def _profile_summary(profile):
+    stats = pstats.Stats(profile).stats
+    functions = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:TOP_FUNCTIONS]
+    return [
+        {"function": f"{name} ({os.path.basename(filename)}:{line})", "calls": calls,
+         "total_ms": total * 1000, "cumulative_ms": cumulative * 1000}
+        for (filename, line, name), (_, calls, total, cumulative, _) in functions
+    ]
+
+# Class RequestProfiler for opt-in profiling of requests in production.
+#
+# A request is run under cProfile if it carries the header X-Profile with the
+# configured token, or with probability sample_rate. With slow_ms every other
+# request is watched by a sampling thread that collects the stacks of its
+# thread every interval seconds, which costs nothing while no request is in
+# flight; requests slower than slow_ms are kept. cProfile cannot be started
+# after the fact, so slow requests come with stack samples instead. Only one
+# request of the process runs under cProfile at a time, the requests picked
+# meanwhile come with stack samples as well.
+#
+# Every kept request is written with its SQL statements (text and time, no
+# parameters) to {id}.json in directory, and its cProfile stats to {id}.prof
+# (pstats format, e.g. for snakeviz). Only the newest max_profiles are kept.
+class RequestProfiler:
+    def __init__(self, directory, sample_rate=0.0, slow_ms=0, token=None, max_profiles=100, interval=0.005):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.token = token
+        self.max_profiles = max_profiles
+        self.interval = interval
+        self.enabled = bool(sample_rate or slow_ms or token)
+        self._local = threading.local()
+        self._watched = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        app.before_request(self._start)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish)
+
+    def watch_engine(self, engine):
+        if not self.enabled:
+            return
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            if getattr(self._local, 'capture', None) is not None:
+                connection.info.setdefault('profile_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            capture = getattr(self._local, 'capture', None)
+            starts = connection.info.get('profile_start')
+            if capture is not None and starts:
+                elapsed = time.perf_counter() - starts.pop()
+                capture.statements.append({
+                    "statement": statement[:MAX_STATEMENT_LENGTH],
+                    "executemany": executemany,
+                    "duration_ms": elapsed * 1000,
+                })
+
+    def _trigger(self):
+        if self.token and request.headers.get('X-Profile') == self.token:
+            return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        if self.slow_ms:
+            return 'slow'
+        return None
+
+    def _start(self):
+        if request.path.startswith('/profiles'):
+            return
+        trigger = self._trigger()
+        if trigger is None:
+            return
+        capture = _Capture(trigger)
+        self._local.capture = capture
+        g.profile_capture = capture
+        if trigger != 'slow' and _cprofile_lock.acquire(blocking=False):
+            try:
+                capture.profile = cProfile.Profile()
+                capture.profile.enable()
+                return
+            except ValueError as e:
+                # Another profiling tool (e.g. a debugger) is active
+                capture.profile = None
+                _cprofile_lock.release()
+                logging.warning(f"Could not start cProfile, sampling stacks instead: {str(e)}")
+        with self._lock:
+            self._watched[threading.get_ident()] = capture
+            if self._sampler is None:
+                self._sampler = threading.Thread(target=self._sample, name='request-profiler', daemon=True)
+                self._sampler.start()
+
+    def _record_status(self, response):
+        capture = g.get('profile_capture')
+        if capture is not None:
+            capture.status = response.status_code
+        return response
+
+    def _finish(self, exception=None):
+        capture = g.pop('profile_capture', None)
+        if capture is None:
+            return
+        self._local.capture = None
+        duration_ms = (time.perf_counter() - capture.start) * 1000
+        if capture.profile is not None:
+            try:
+                capture.profile.disable()
+            finally:
+                _cprofile_lock.release()
+        else:
+            with self._lock:
+                self._watched.pop(threading.get_ident(), None)
+            if capture.trigger == 'slow' and duration_ms < self.slow_ms:
+                return
+        if exception is not None:
+            capture.status = 500
+        try:
+            self._write(capture, duration_ms)
+        except OSError as e:
+            # A full disk must not fail the request
+            logging.error(f"Could not write request profile: {str(e)}")
+
+    # Stack samples of the watched request threads, while there are any
+    def _sample(self):
+        own = threading.get_ident()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                watched = dict(self._watched)
+            if not watched:
+                continue
+            frames = sys._current_frames()
+            for thread_id, capture in watched.items():
+                frame = frames.get(thread_id)
+                if frame is not None and thread_id != own:
+                    capture.stacks[_folded_stack(frame)] += 1
+                    capture.samples += 1
+
+    def _write(self, capture, duration_ms):
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(capture.started_at))}-{uuid.uuid4().hex[:8]}"
+        result = {
+            "id": profile_id,
+            "trigger": capture.trigger,
+            "created_at": capture.started_at,
+            "method": request.method,
+            "path": request.path,
+            "query": request.query_string.decode('utf-8', 'replace'),
+            "endpoint": request.endpoint,
+            "status": capture.status,
+            "duration_ms": duration_ms,
+            "sql_count": len(capture.statements),
+            "sql_ms": sum(statement["duration_ms"] for statement in capture.statements),
+            "sql": capture.statements,
+        }
+        if capture.profile is not None:
+            result["functions"] = _profile_summary(capture.profile)
+            capture.profile.dump_stats(self._path(profile_id, 'prof'))
+        else:
+            result["sample_interval_ms"] = self.interval * 1000
+            result["samples"] = capture.samples
+            result["stacks"] = dict(capture.stacks.most_common())
+        with open(self._path(profile_id, 'json.tmp'), 'w') as file:
+            json.dump(result, file)
+        os.replace(self._path(profile_id, 'json.tmp'), self._path(profile_id, 'json'))
+        self._prune()
+
+    def _path(self, profile_id, suffix):
+        return os.path.join(self.directory, f"{profile_id}.{suffix}")
+
+    def _ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        # Ids start with the time, so they sort by age
+        return sorted(name[:-len('.json')] for name in names if name.endswith('.json'))
+
+    def _prune(self):
+        ids = self._ids()
+        for profile_id in ids[:max(0, len(ids) - self.max_profiles)]:
+            for suffix in ('json', 'prof'):
+                try:
+                    os.remove(self._path(profile_id, suffix))
+                except FileNotFoundError:
+                    pass
+
+    # Summaries of the kept profiles, newest first
+    def list(self):
+        profiles = []
+        for profile_id in reversed(self._ids()):
+            profile = self.get(profile_id)
+            if profile is not None:
+                profiles.append({key: profile.get(key) for key in (
+                    "id", "trigger", "created_at", "method", "path", "query", "status", "duration_ms", "sql_count", "sql_ms"
+                )})
+        return profiles
+
+    # A kept profile, None if it does not exist (any more)
+    def get(self, profile_id):
+        if not re.fullmatch(r'[0-9T]{15}-[0-9a-f]{8}', profile_id):
+            return None
+        try:
+            with open(self._path(profile_id, 'json')) as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    # Path of the cProfile stats of a profile, None if it has none
+    def stats_path(self, profile_id):
+        if self.get(profile_id) is None or not os.path.exists(self._path(profile_id, 'prof')):
+            return None
+        return self._path(profile_id, 'prof')
@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+
+# Class ResponseCache: in-process LRU cache of the responses of read endpoints,
+# bounded by the total size of the cached bodies in bytes.
+#
+# Every entry carries tags (e.g. the run it shows, or "experiments" for lists
+# of runs) and a write invalidates exactly the entries of the tags it touched.
+# A read that started before an invalidation of one of its tags may have seen
+# the old data, so it is not stored: call start() before reading the database,
+# hand the returned token to put() and release it with finish() in any case.
+# The invalidation of a tag is only remembered while an older read is in flight.
+class ResponseCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        # Invalidation counter, and its value at the last invalidation of every tag
+        self._epoch = 0
+        self._invalidated_at = OrderedDict()
+        self._cleared_at = 0
+        # Number of reads in flight per token
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            token = self._epoch
+            self._active[token] = self._active.get(token, 0) + 1
+            return token
+
+    def finish(self, token):
+        with self._lock:
+            count = self._active.pop(token) - 1
+            if count:
+                self._active[token] = count
+            self._prune()
+
+    # Forget the invalidations that no read in flight started before. They are
+    # ordered by epoch, so only the oldest ones are looked at.
+    def _prune(self):
+        oldest = min(self._active, default=self._epoch)
+        while self._invalidated_at:
+            tag, epoch = next(iter(self._invalidated_at.items()))
+            if epoch > oldest:
+                break
+            del self._invalidated_at[tag]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    # Store value with its size in bytes, unless one of its tags was
+    # invalidated since start() returned token
+    def put(self, key, value, size, tags, token):
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if self._cleared_at > token or any(self._invalidated_at.get(tag, 0) > token for tag in tags):
+                return False
+            self._remove(key)
+            self._entries[key] = (value, size, tags)
+            self.bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self.bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._epoch += 1
+            for tag in tags:
+                self._invalidated_at.pop(tag, None)
+                self._invalidated_at[tag] = self._epoch
+                for key in self._tags.pop(tag, ()):
+                    if self._remove(key):
+                        self.invalidations += 1
+            self._prune()
+
+    # Invalidate all entries, for writes whose tags are not known
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._cleared_at = self._epoch
+            self._invalidated_at.clear()
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._tags.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        _, size, tags = entry
+        self.bytes -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+        return True
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,78 @@
+import functools
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# One lock per process serializes all write transactions. Readers never take
+# it and keep running concurrently thanks to WAL journaling.
+_write_lock = threading.RLock()
+_write_state = threading.local()
+
+# Set the SQLite pragmas on every new connection and let SQLAlchemy emit BEGIN
+# itself, so that write transactions can start with BEGIN IMMEDIATE. A deferred
+# transaction that reads first and writes later fails with "database is locked"
+# without waiting for the busy timeout if another connection wrote in between.
+def configure_sqlite(engine, journal_mode='WAL', synchronous='NORMAL', cache_size=-65536, busy_timeout=30000):
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout={int(busy_timeout)}")
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA cache_size={int(cache_size)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin_transaction(connection):
+        if getattr(_write_state, 'depth', 0):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        else:
+            connection.exec_driver_sql("BEGIN")
+
+# Context manager for the write path: waits for the other writers of this
+# process and makes the transactions started inside take the write lock up front.
+@contextmanager
+def serialized_write():
+    with _write_lock:
+        _write_state.depth = getattr(_write_state, 'depth', 0) + 1
+        try:
+            yield
+        finally:
+            _write_state.depth -= 1
+
+# Decorator to run a whole view function on the serialized write path
+def serialized(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with serialized_write():
+            return view(*args, **kwargs)
+    return wrapper
+
+# Class CommitWatcher to notice cheaply when any other connection, of this or
+# another process, committed to a SQLite database: PRAGMA data_version of its
+# own connection changes then. The connection is opened in the process that
+# uses it, never inherited over a fork, and also serves the reads that follow
+# a change. It is not thread safe, callers hold a lock.
+class CommitWatcher:
+    def __init__(self, path, busy_timeout=30000):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout)}")
+            self._pid = os.getpid()
+        return self._connection
+
+    def data_version(self):
+        return self._connect().execute("PRAGMA data_version").fetchone()[0]
+
+    def query(self, statement, parameters=()):
+        return self._connect().execute(statement, parameters).fetchall()
@@ -0,0 +1,159 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from src.file_lock import file_lock
+from src.parse_log import LogParser
+
+# Size of the blocks read from a request body or spool file
+BLOCK_SIZE = 1024 * 1024
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset):
+        super().__init__(f"Upload is at offset {offset}")
+        self.offset = offset
+
+# Class UploadStore for resumable chunked uploads of training logs.
+#
+# Every upload is spooled to {id}.part in directory, next to {id}.json with
+# its metadata. The offset of an upload is the size of its spool file, so an
+# interrupted chunk keeps what arrived and the client continues from there.
+# Every block is fed to an incremental LogParser as it lands, so completing an
+# upload only has to finish the last line. The parsers of the most recently
+# used max_active uploads are kept in memory, the others are rebuilt from
+# their spool file when the upload continues (e.g. after a restart).
+#
+# The worker processes of the server share the spool directory: chunks are
+# appended under a lock on the spool file, and a parser first catches up with
+# the blocks that other workers appended.
+class UploadStore:
+    def __init__(self, directory, max_active=32, max_age=24 * 3600):
+        self.directory = directory
+        self.max_active = max_active
+        self.max_age = max_age
+        self._uploads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, upload_id, suffix):
+        return os.path.join(self.directory, f"{upload_id}.{suffix}")
+
+    # Start an upload, size is the expected total size in bytes if known
+    def create(self, filename=None, size=None):
+        os.makedirs(self.directory, exist_ok=True)
+        self._expire()
+        upload_id = uuid.uuid4().hex
+        meta = {"upload_id": upload_id, "filename": filename, "size": size, "created_at": time.time()}
+        with open(self._path(upload_id, 'json'), 'w') as file:
+            json.dump(meta, file)
+        open(self._path(upload_id, 'part'), 'wb').close()
+        return dict(meta, offset=0)
+
+    def _upload(self, upload_id):
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id) or not os.path.exists(self._path(upload_id, 'json')):
+            raise KeyError(upload_id)
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+            if upload is None:
+                with open(self._path(upload_id, 'json')) as file:
+                    upload = _Upload(json.load(file), self._path(upload_id, 'part'), self._path(upload_id, 'json'))
+                self._uploads[upload_id] = upload
+                while len(self._uploads) > self.max_active:
+                    self._uploads.popitem(last=False)
+            else:
+                self._uploads.move_to_end(upload_id)
+            return upload
+
+    # Metadata and current offset of an upload, raises KeyError for unknown uploads
+    def info(self, upload_id):
+        upload = self._upload(upload_id)
+        return dict(upload.meta, offset=upload.offset())
+
+    # Append the body of a chunk that starts at offset. Raises OffsetMismatch
+    # if the upload is at another offset. Returns the new offset.
+    def append(self, upload_id, offset, stream):
+        return self._upload(upload_id).append(offset, stream)
+
+    # Finish an upload and remove its files. Returns the LogParser with the
+    # result, history and log_hash of the log.
+    def complete(self, upload_id):
+        upload = self._upload(upload_id)
+        with upload.locked():
+            size = upload.meta.get("size")
+            if size is not None and upload.offset() != size:
+                raise OffsetMismatch(upload.offset())
+            parser = upload.parser()
+            parser.result()
+        self.delete(upload_id)
+        return parser
+
+    def delete(self, upload_id):
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+            raise KeyError(upload_id)
+        with self._lock:
+            self._uploads.pop(upload_id, None)
+        for suffix in ('part', 'json'):
+            try:
+                os.remove(self._path(upload_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    # Remove uploads that were not continued for max_age seconds
+    def _expire(self):
+        now = time.time()
+        for name in os.listdir(self.directory):
+            upload_id, _, suffix = name.partition('.')
+            if suffix == 'json' and now - os.path.getmtime(os.path.join(self.directory, name)) > self.max_age:
+                self.delete(upload_id)
+
+class _Upload:
+    def __init__(self, meta, path, meta_path):
+        self.meta = meta
+        self.path = path
+        self.meta_path = meta_path
+        self.lock = threading.Lock()
+        self._parser = None
+        # Bytes of the spool file fed to the parser
+        self._parsed = 0
+
+    def offset(self):
+        return os.path.getsize(self.path)
+
+    # Lock of the upload for the threads of this process and the other workers
+    @contextmanager
+    def locked(self):
+        with self.lock, open(self.path, 'ab') as file, file_lock(file):
+            yield file
+
+    def parser(self):
+        if self._parser is None:
+            self._parser = LogParser(history=True, hash=True)
+            self._parsed = 0
+        if self._parsed < self.offset():
+            with open(self.path, 'rb') as file:
+                file.seek(self._parsed)
+                for block in iter(lambda: file.read(BLOCK_SIZE), b''):
+                    self._parser.feed(block)
+                    self._parsed += len(block)
+        return self._parser
+
+    def append(self, offset, stream):
+        with self.locked() as file:
+            if offset != self.offset():
+                raise OffsetMismatch(self.offset())
+            parser = self.parser()
+            # Every block is written before it is parsed, so a broken
+            # connection keeps the blocks that arrived completely
+            try:
+                for block in iter(lambda: stream.read(BLOCK_SIZE), b''):
+                    file.write(block)
+                    file.flush()
+                    parser.feed(block)
+                    self._parsed += len(block)
+            finally:
+                # The upload was active, it does not expire yet
+                os.utime(self.meta_path)
+            return self.offset()
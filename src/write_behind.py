@@ -0,0 +1,192 @@
+import logging
+import os
+import threading
+import time
+
+class _Pending:
+    __slots__ = ('fields', 'values', 'points', 'updates', 'attempts')
+
+    def __init__(self):
+        self.fields = {}
+        self.values = {}
+        self.points = {}
+        self.updates = 0
+        self.attempts = 0
+
+# Class WriteBehindBuffer for live updates that are acknowledged before they
+# are written to the database.
+#
+# Pending updates are coalesced per run: the latest value of a field (status,
+# iterations) and of a metric wins, and metric points are kept by
+# (metric, step) with the latest value of a step, like in the database. A
+# background thread hands all pending updates to write() as one batch
+# max_staleness seconds after the oldest of them arrived, or as soon as
+# max_pending points are pending. put() waits while ten times as many are
+# pending, so a database that cannot keep up slows the clients down instead
+# of growing the buffer. If a batch fails, its runs are written one by one,
+# so one bad run does not hold back the others, and the runs that still fail
+# are merged back under the newer updates and retried, up to max_attempts
+# times. flush(run_ids) writes the pending updates of some runs now, e.g.
+# before they are read. close() writes the rest and is called at exit of the
+# process.
+class WriteBehindBuffer:
+    def __init__(self, write, max_staleness=1.0, max_pending=10000, max_attempts=3):
+        self.write = write
+        self.max_staleness = max_staleness
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+        self.dropped = 0
+        self._pending = {}
+        # Runs of the batch that is being written
+        self._writing = set()
+        self._points = 0
+        self._oldest = None
+        self._closed = False
+        self._condition = threading.Condition()
+        # One flush at a time, from the writer thread or flush()
+        self._flush_lock = threading.Lock()
+        # Process that runs the writer thread, a forked worker starts its own
+        self._writer_pid = None
+
+    @property
+    def pending(self):
+        with self._condition:
+            return sum(pending.updates for pending in self._pending.values())
+
+    # Queue an update of run_id: fields by name, values {metric: value} at step.
+    # Without step the points go to the iterations of the update, else of the
+    # pending updates of the run, else default_step. Returns the step.
+    def put(self, run_id, fields, values, step=None, default_step=0):
+        now = time.time()
+        with self._condition:
+            if self._writer_pid != os.getpid():
+                self._writer_pid = os.getpid()
+                threading.Thread(target=self._run, name='write-behind', daemon=True).start()
+            while self._points >= self.max_pending * 10 and not self._closed:
+                self._condition.wait()
+            pending = self._pending.get(run_id)
+            if pending is None:
+                pending = self._pending[run_id] = _Pending()
+                if self._oldest is None:
+                    # The writer thread waits for the first update of a batch
+                    self._oldest = time.monotonic()
+                    self._condition.notify_all()
+            if step is None:
+                step = fields.get('iterations', pending.fields.get('iterations', default_step))
+            pending.fields.update(fields)
+            pending.values.update(values)
+            for name, value in values.items():
+                if (name, step) not in pending.points:
+                    self._points += 1
+                pending.points[(name, step)] = (value, now)
+            pending.updates += 1
+            if self._points >= self.max_pending:
+                self._condition.notify_all()
+            return step
+
+    # Drop the pending updates of a run, e.g. when it is deleted
+    def discard(self, run_id):
+        with self._condition:
+            pending = self._pending.pop(run_id, None)
+            if pending is not None:
+                self._points -= len(pending.points)
+                self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if self._closed:
+                    return
+                deadline = self._oldest + self.max_staleness
+                while self._points < self.max_pending and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+            self.flush()
+
+    # Write the pending updates of run_ids (default all) now, also waits for
+    # a batch with one of them that is being written. Returns the number of
+    # updates written.
+    def flush(self, run_ids=None):
+        if run_ids is not None:
+            with self._condition:
+                if not any(run_id in self._pending or run_id in self._writing for run_id in run_ids):
+                    return 0
+        with self._flush_lock:
+            with self._condition:
+                if run_ids is None:
+                    batch, self._pending = self._pending, {}
+                else:
+                    batch = {run_id: self._pending.pop(run_id) for run_id in run_ids if run_id in self._pending}
+                self._points = sum(len(pending.points) for pending in self._pending.values())
+                if not self._pending:
+                    self._oldest = None
+                self._writing = set(batch)
+                self._condition.notify_all()
+            try:
+                return self._write(batch)
+            finally:
+                with self._condition:
+                    self._writing = set()
+
+    def _write(self, batch):
+        if not batch:
+            return 0
+        try:
+            self.write(batch)
+        except Exception as e:
+            logging.error(f"Could not write {len(batch)} runs of live updates: {str(e)}")
+            self.failures += 1
+            if len(batch) == 1:
+                self._requeue(batch)
+                return 0
+            # Write the runs one by one, only the ones that fail again are retried
+            failed = {}
+            written = {}
+            for run_id, pending in batch.items():
+                try:
+                    self.write({run_id: pending})
+                    written[run_id] = pending
+                except Exception as e:
+                    logging.error(f"Could not write the live updates of experiment {run_id}: {str(e)}")
+                    failed[run_id] = pending
+            if failed:
+                self._requeue(failed)
+            batch = written
+        updates = sum(pending.updates for pending in batch.values())
+        self.flushes += 1
+        self.written += updates
+        return updates
+
+    # Put a failed batch back, the updates that arrived in the meantime win
+    def _requeue(self, batch):
+        with self._condition:
+            for run_id, pending in batch.items():
+                pending.attempts += 1
+                if pending.attempts >= self.max_attempts:
+                    logging.error(f"Dropped {pending.updates} live updates of experiment {run_id} after {pending.attempts} attempts.")
+                    self.dropped += pending.updates
+                    continue
+                newer = self._pending.get(run_id)
+                if newer is not None:
+                    pending.fields.update(newer.fields)
+                    pending.values.update(newer.values)
+                    pending.points.update(newer.points)
+                    pending.updates += newer.updates
+                self._pending[run_id] = pending
+            self._points = sum(len(pending.points) for pending in self._pending.values())
+            if self._pending:
+                self._oldest = time.monotonic()
+
+    # Stop the writer thread and write the rest
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.flush()